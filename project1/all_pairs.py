@@ -0,0 +1,331 @@
+"""
+
+Name:       Minh Vu
+Email:      2004minhvu@gmail.com
+
+Project: Road Trip Optimizer
+
+All-pairs shortest distances for the road networks of traveller_template1.py.
+
+The distance of every (departure, destination) pair is stored in a V x V
+matrix, and the next city on the shortest route of every pair in a second
+V x V matrix, so any route can be read back in O(route length) without a
+search. Small dense road networks are solved with the Floyd-Warshall
+algorithm row by row, everything else with one Dijkstra's search per
+departure city, writing each row to the file as soon as it is ready.
+
+Both matrices are saved in the .npy format (little-endian int64 and int32,
+C order) next to the distance file, named by a hash of the distance file's
+contents. They are opened with mmap, so only the rows that are used are
+read from the disk, and NumPy can open the same files with
+numpy.load(file_name, mmap_mode="r") for reports.
+"""
+
+import glob
+import hashlib
+import heapq
+import mmap
+import sys
+from array import array
+
+
+FLOYD_WARSHALL_LIMIT = 150   # the largest number of cities solved with Floyd-Warshall
+MATRIX_CITY_LIMIT = 5_000    # the largest number of cities with a matrix, 300 MB of files and 5 000 searches
+MATRIX_CELL_BYTES = 12       # an int64 distance and an int32 next city per pair
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+NO_ROUTE = -1
+DISTANCES_SUFFIX = ".distances.npy"
+NEXT_CITIES_SUFFIX = ".next.npy"
+
+
+class AllPairsMatrix:
+    """
+    This class gives the routes of a road network from the distance and
+    next city matrices. The matrices describe the road network as it was
+    read from the distance file, so any change of a road segment makes them
+    unusable until they are built again.
+    """
+
+    def __init__(self, network):
+        self.__network = network
+        self.__city_count = 0
+        self.__distances = None   # memoryview of the distance matrix
+        self.__next_cities = None  # memoryview of the next city matrix
+        self.__maps = []
+        network.add_listener(self)
+
+    def is_valid(self):
+        """
+        Check if the matrices are open and up to date.
+
+        :return: True, if the matrices can be used | False, if they can't
+        """
+
+        return self.__distances is not None
+
+    def build(self, source_file):
+        """
+        Compute the matrices of the road network, write them next to
+        <source_file> and open them.
+
+        :param source_file: str, the name of the distance file
+        :return: str, the name of the distance matrix file
+        :raise ValueError: if the road network has more than MATRIX_CITY_LIMIT
+                           cities, nothing is written then
+        """
+
+        network = self.__network
+        city_count = network.city_count()
+        if city_count > MATRIX_CITY_LIMIT:
+            raise ValueError(f"{city_count} cities need {matrix_bytes(city_count)} bytes of matrices")
+        distance_file, next_city_file = matrix_file_names(source_file)
+        edge_count = sum(end - start for start, end in zip(network.adjacency()[0], network.adjacency()[1]))
+
+        if city_count <= FLOYD_WARSHALL_LIMIT and edge_count * 4 >= city_count * city_count:
+            rows = _floyd_warshall(network.adjacency(), city_count)
+        else:
+            rows = (_dijkstra_row(network.adjacency(), source, city_count) for source in range(city_count))
+
+        with open(distance_file, mode="wb") as distances, open(next_city_file, mode="wb") as next_cities:
+            distances.write(_npy_header("<i8", city_count))
+            next_cities.write(_npy_header("<i4", city_count))
+            for distance_row, next_city_row in rows:
+                _write_little_endian(distances, distance_row)
+                _write_little_endian(next_cities, next_city_row)
+
+        self.open(source_file)
+        return distance_file
+
+    def open(self, source_file):
+        """
+        Open the matrices made from the current contents of <source_file>.
+
+        :param source_file: str, the name of the distance file
+        :return: True, if the matrices were opened | False, if there are no
+                 matrices for this version of the distance file
+        """
+
+        self.close()
+        # hashing the distance file is needed only if there are matrix files of some version of it
+        if not glob.glob(glob.escape(source_file) + ".*" + DISTANCES_SUFFIX):
+            return False
+        city_count = self.__network.city_count()
+        try:
+            distance_file, next_city_file = matrix_file_names(source_file)
+            distances = self.__map(distance_file, "q", city_count)
+            next_cities = self.__map(next_city_file, "i", city_count)
+        except (OSError, ValueError):
+            self.close()
+            return False
+
+        self.__city_count = city_count
+        self.__distances = distances
+        self.__next_cities = next_cities
+        return True
+
+    def close(self):
+        """
+        Close the memory mapped matrices.
+        """
+
+        if self.__distances is not None:
+            self.__distances.release()
+            self.__next_cities.release()
+        self.__distances = None
+        self.__next_cities = None
+        for matrix_map in self.__maps:
+            matrix_map.close()
+        self.__maps = []
+
+    def route(self, source, target):
+        """
+        Read a route from the matrices.
+
+        :param source: int, the id of the departure city
+        :param target: int, the id of the destination city
+        :return: tuple(list[int], int), the city ids of the route and its
+                 length in km, or ([], None) if there is no route
+        """
+
+        city_count = self.__city_count
+        total_distance = self.__distances[source * city_count + target]
+        if total_distance == NO_ROUTE:
+            return [], None
+
+        route = [source]
+        city = source
+        while city != target:
+            city = self.__next_cities[city * city_count + target]
+            route.append(city)
+        return route, total_distance
+
+    def road_changed(self, departure_id, destination_id, old_distance, new_distance):
+        """
+        Follow a change of the road network, see RoadNetwork.add_listener.
+        """
+
+        self.close()
+
+    def __map(self, file_name, type_code, city_count):
+        """
+        Memory map the data of a .npy matrix file.
+
+        :return: memoryview, the matrix as a flat memoryview of <type_code>
+        """
+
+        with open(file_name, mode="rb") as matrix_file:
+            matrix_map = mmap.mmap(matrix_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__maps.append(matrix_map)
+
+        if matrix_map[:len(NPY_MAGIC)] != NPY_MAGIC:
+            raise ValueError(f"'{file_name}' is not a .npy file")
+        header_length = int.from_bytes(matrix_map[8:10], "little")
+        data_start = 10 + header_length
+        item_size = array(type_code).itemsize
+        if len(matrix_map) - data_start != city_count * city_count * item_size:
+            raise ValueError(f"'{file_name}' does not match the road network")
+        if sys.byteorder != "little":
+            raise ValueError("the matrices can be mapped only on little-endian machines")
+        return memoryview(matrix_map)[data_start:].cast(type_code)
+
+
+def matrix_bytes(city_count):
+    """
+    Give the size of the two matrix files of a road network.
+
+    :param city_count: int, the number of cities
+    :return: int, the size of the files in bytes, without the headers
+    """
+
+    return MATRIX_CELL_BYTES * city_count * city_count
+
+
+def matrix_file_names(source_file):
+    """
+    Name the matrix files of a distance file after a hash of its contents.
+
+    :param source_file: str, the name of the distance file
+    :return: tuple(str, str), the names of the distance and next city files
+    """
+
+    file_hash = hashlib.sha256()
+    with open(source_file, mode="rb") as distance_file:
+        while True:
+            chunk = distance_file.read(1 << 20)
+            if not chunk:
+                break
+            file_hash.update(chunk)
+    prefix = f"{source_file}.{file_hash.hexdigest()[:16]}"
+    return prefix + DISTANCES_SUFFIX, prefix + NEXT_CITIES_SUFFIX
+
+
+def _dijkstra_row(adjacency, source, city_count):
+    """
+    Dijkstra's algorithm from <source> over the whole road network. The first
+    city of the route to a city is taken from its previous city when it is
+    settled, as the previous city has been settled before it.
+
+    :return: tuple(array, array), the distances (NO_ROUTE if unreachable)
+             and the next cities after <source> (NO_ROUTE if unreachable)
+    """
+
+    starts, ends, targets, weights = adjacency
+    distances = array("q", [NO_ROUTE]) * city_count
+    next_cities = array("i", [NO_ROUTE]) * city_count
+    came_from = array("i", [NO_ROUTE]) * city_count
+    settled = bytearray(city_count)
+    distances[source] = 0
+    next_cities[source] = source
+    heap = [(0, source)]
+
+    while heap:
+        delta, city = heapq.heappop(heap)
+        if settled[city]:
+            continue
+        settled[city] = 1
+        if city != source:
+            previous = came_from[city]
+            next_cities[city] = city if previous == source else next_cities[previous]
+
+        for slot in range(starts[city], ends[city]):
+            neighbour = targets[slot]
+            new_delta = delta + weights[slot]
+            if not settled[neighbour] and (distances[neighbour] == NO_ROUTE or new_delta < distances[neighbour]):
+                distances[neighbour] = new_delta
+                came_from[neighbour] = city
+                heapq.heappush(heap, (new_delta, neighbour))
+
+    return distances, next_cities
+
+
+def _floyd_warshall(adjacency, city_count):
+    """
+    The Floyd-Warshall algorithm on the whole matrix. For every middle city
+    k, each row is updated from row k with one pass over the columns.
+
+    :return: list[tuple(array, array)], the distance and next city rows
+    """
+
+    starts, ends, targets, weights = adjacency
+    unreachable = sys.maxsize
+    distances = [[unreachable] * city_count for city_id in range(city_count)]
+    next_cities = [[NO_ROUTE] * city_count for city_id in range(city_count)]
+    for city_id in range(city_count):
+        distances[city_id][city_id] = 0
+        next_cities[city_id][city_id] = city_id
+        for slot in range(starts[city_id], ends[city_id]):
+            neighbour = targets[slot]
+            if neighbour != city_id and weights[slot] < distances[city_id][neighbour]:
+                distances[city_id][neighbour] = weights[slot]
+                next_cities[city_id][neighbour] = neighbour
+
+    for middle in range(city_count):
+        middle_row = distances[middle]
+        for city_id in range(city_count):
+            row = distances[city_id]
+            to_middle = row[middle]
+            if to_middle == unreachable or city_id == middle:
+                continue
+            next_row = next_cities[city_id]
+            first_city = next_row[middle]
+            for column, from_middle in enumerate(middle_row):
+                if to_middle + from_middle < row[column]:
+                    row[column] = to_middle + from_middle
+                    next_row[column] = first_city
+
+    rows = []
+    for city_id in range(city_count):
+        distance_row = array("q", (NO_ROUTE if distance >= unreachable else distance
+                                   for distance in distances[city_id]))
+        rows.append((distance_row, array("i", next_cities[city_id])))
+    return rows
+
+
+def _npy_header(descr, city_count):
+    """
+    Make the header of a .npy (version 1.0) file of a square matrix. The
+    header is padded so that the data starts at a multiple of 64 bytes.
+
+    :param descr: str, the NumPy type of the items, e.g. "<i8"
+    :param city_count: int, the number of rows and columns
+    :return: bytes, the header
+    """
+
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({city_count}, {city_count}), }}"
+    padding = 64 - (len(NPY_MAGIC) + 2 + len(header) + 1) % 64
+    header = header + " " * (padding % 64) + "\n"
+    return NPY_MAGIC + len(header).to_bytes(2, "little") + header.encode("latin1")
+
+
+def _write_little_endian(matrix_file, row):
+    """
+    Write a row of a matrix in little-endian byte order.
+
+    :param matrix_file: file, the binary file to be written
+    :param row: array, the row to be written
+    """
+
+    if sys.byteorder != "little":
+        row = array(row.typecode, row)
+        row.byteswap()
+    row.tofile(matrix_file)
@@ -0,0 +1,193 @@
+"""
+
+Name:       Minh Vu
+Email:      2004minhvu@gmail.com
+
+Project: Road Trip Optimizer
+
+This program answers a file of route queries without the interactive
+action loop of traveller_template1.py. Every line of the query file is
+"departure;destination". The queries are grouped by the departure city, so
+a single search from the departure answers all of its destinations, and
+the groups are spread over a pool of worker processes. The road network is
+opened like in the interactive mode (see start_session in
+traveller_template1.py), so the snapshot is used and the changes made by
+the add and remove actions are replayed from the journal. It is read once
+and shared with the workers through shared memory (see shared_graph.py), so
+adding workers doesn't add copies of it. The results are written to a CSV
+file as soon as they are ready, one row per query:
+departure;destination;result, where the result is what the route action
+would print, e.g. "Tampere-Jyväskylä-Oulu (487 km)".
+
+The rows are written group by group in the order the departure cities
+first appear in the query file.
+
+Usage: python batch_routes.py <distance file> <query file> <result file> [--workers N]
+"""
+
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from shared_graph import SharedRoadNetwork, attach_network
+from traveller_template1 import start_session, find_routes_from, format_route
+
+
+# the number of departure groups sent to a worker at a time
+GROUPS_PER_TASK = 16
+
+# the road network of a worker process and its shared memory, set by _start_worker
+_network = None
+_shared_memory = None
+
+
+def read_queries(file_name):
+    """
+    Read the query file and group the queries by the departure city.
+
+    :param file_name: str, the name of the query file
+    :return: dict[str, list[str]] | None, the destinations of every departure
+             city in the order of the file, or None if the file can't be read
+    """
+
+    groups = {}
+    try:
+        with open(file_name, mode="r", encoding="utf-8") as query_file:
+            for line_number, line in enumerate(query_file, start=1):
+                line = line.rstrip()
+                if line == "":
+                    continue
+                parts = line.split(";")
+                if len(parts) != 2:
+                    print(f"Error: bad query on line {line_number} of '{file_name}'.")
+                    return None
+                departure, destination = parts
+                groups.setdefault(departure, []).append(destination)
+    except (OSError, UnicodeDecodeError):
+        return None
+    return groups
+
+
+def answer_group(network, departure, destinations):
+    """
+    Answer all the queries of one departure city with a single search.
+
+    :param network: RoadNetwork, the road network
+    :param departure: str, the name of the departure city
+    :param destinations: list[str], the names of the destination cities
+    :return: list[tuple(str, str, str)], the departure, the destination and
+             the result text of every query
+    """
+
+    if not network.is_known(departure):
+        return [(departure, destination, f"Error: '{departure}' is unknown.") for destination in destinations]
+
+    routes = find_routes_from(network, departure, destinations)
+    rows = []
+    for destination in destinations:
+        if destination in routes:
+            route, total_distance = routes[destination]
+            result = format_route(route, total_distance)
+        else:
+            result = f"No route found between '{departure}' and '{destination}'."
+        rows.append((departure, destination, result))
+    return rows
+
+
+def _start_worker(shared_name):
+    """
+    Attach a worker process to the shared road network.
+
+    :param shared_name: str, the name of the shared memory block
+    """
+
+    global _network, _shared_memory
+    _network, _shared_memory = attach_network(shared_name)
+
+
+def _answer_groups(groups):
+    """
+    Answer a batch of departure groups in a worker process.
+
+    :param groups: list[tuple(str, list[str])], the departure cities and
+                   their destinations
+    :return: list[tuple(str, str, str)], the result rows
+    """
+
+    rows = []
+    for departure, destinations in groups:
+        rows.extend(answer_group(_network, departure, destinations))
+    return rows
+
+
+def run_batch(distance_file, query_file, result_file, workers=None):
+    """
+    Answer every query of <query_file> and write the results to <result_file>.
+
+    :param distance_file: str, the name of the distance file
+    :param query_file: str, the name of the query file
+    :param result_file: str, the name of the CSV file to be written
+    :param workers: int | None, the number of worker processes, the number
+                    of CPUs by default
+    :return: int | None, the number of answered queries, or None if a file
+             can't be read
+    """
+
+    session = start_session(distance_file)
+    if session is None:
+        return None
+    network, journal = session
+    # the queries don't change the road network, so nothing is written to the journal
+    journal.close()
+
+    groups = read_queries(query_file)
+    if groups is None:
+        print(f"Error: '{query_file}' can not be read.")
+        return None
+
+    items = list(groups.items())
+    tasks = [items[i:i + GROUPS_PER_TASK] for i in range(0, len(items), GROUPS_PER_TASK)]
+    answered = 0
+
+    shared_network = SharedRoadNetwork(network)
+    # the workers read the shared copy, the parent doesn't need its own any more
+    del network
+    try:
+        with open(result_file, mode="w", encoding="utf-8", newline="") as results, \
+                ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_start_worker,
+                                    initargs=(shared_network.get_name(),)) as executor:
+            writer = csv.writer(results, delimiter=";")
+            writer.writerow(("departure", "destination", "result"))
+            for rows in executor.map(_answer_groups, tasks):
+                writer.writerows(rows)
+                answered += len(rows)
+    finally:
+        shared_network.close()
+
+    return answered
+
+
+def main():
+    arguments = sys.argv[1:]
+    workers = None
+    if "--workers" in arguments:
+        position = arguments.index("--workers")
+        try:
+            workers = int(arguments[position + 1])
+        except (IndexError, ValueError):
+            print("Error: --workers needs a number.")
+            return
+        del arguments[position:position + 2]
+
+    if len(arguments) != 3:
+        print("Usage: python batch_routes.py <distance file> <query file> <result file> [--workers N]")
+        return
+
+    answered = run_batch(*arguments, workers=workers)
+    if answered is not None:
+        print(f"{answered} queries answered.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+
+Name:       Minh Vu
+Email:      2004minhvu@gmail.com
+
+Project: Road Trip Optimizer
+
+This program measures how traveller_template1.py scales. It writes
+synthetic road networks in the "departure;destination;distance" form of
+the distance files and times reading them (read_distance_file), route
+queries (find_route), route queries without a route, and the display
+action. The road networks are made with a seeded random generator, so the
+same arguments always give the same files:
+
+- grid: a square grid, every city has a road segment to its neighbours on
+  the left, right, above and below it.
+- geometric: cities at random points of a 1000 km x 1000 km square, every
+  city has road segments to and from its GEOMETRIC_NEIGHBOURS nearest cities,
+  as long as the straight distance.
+- scale-free: a Barabasi-Albert network, every new city connects to
+  SCALE_FREE_LINKS earlier cities picked in proportion to their degree, so
+  a few hub cities get most of the road segments.
+
+Every road network also has a small island of two cities that can't be
+reached from the rest of it, for the queries without a route.
+
+The results are written to a JSON file, one entry per road network, so the
+results of different versions can be compared.
+
+Usage: python benchmark.py [number of road segments ...] [--generators grid,geometric,scale-free]
+                           [--queries N] [--output file.json] [--keep directory]
+The default sizes are 1 000, 10 000, 100 000 and 1 000 000 road segments.
+The largest size takes minutes in pure Python.
+"""
+
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from traveller_template1 import read_distance_file, find_route, display
+
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+DEFAULT_QUERIES = 20
+DEFAULT_OUTPUT = "benchmark_results.json"
+GEOMETRIC_NEIGHBOURS = 3
+SCALE_FREE_LINKS = 2
+ISLAND = ("Island1", "Island2")
+
+
+def grid_roads(road_count, generator):
+    """
+    Make the road segments of a grid with about <road_count> road segments.
+
+    :param road_count: int, the wanted number of road segments
+    :param generator: random.Random, the generator of the distances
+    :return: generator of (str, str, int), the road segments
+    """
+
+    # a side x side grid has 4 * side * (side - 1) road segments
+    side = max(2, round((road_count / 4) ** 0.5) + 1)
+    for row in range(side):
+        for column in range(side):
+            city = f"C{row * side + column}"
+            if column + 1 < side:
+                distance = generator.randint(10, 100)
+                yield city, f"C{row * side + column + 1}", distance
+                yield f"C{row * side + column + 1}", city, distance
+            if row + 1 < side:
+                distance = generator.randint(10, 100)
+                yield city, f"C{(row + 1) * side + column}", distance
+                yield f"C{(row + 1) * side + column}", city, distance
+
+
+def geometric_roads(road_count, generator):
+    """
+    Make the road segments of a random geometric road network with about
+    <road_count> road segments. The nearest cities are found from a grid of
+    buckets, searching rings of buckets outwards until enough are found.
+
+    :param road_count: int, the wanted number of road segments
+    :param generator: random.Random, the generator of the city positions
+    :return: generator of (str, str, int), the road segments
+    """
+
+    # many pairs of cities are each other's nearest cities, so a city ends up
+    # with about 1.25 * GEOMETRIC_NEIGHBOURS road segments, not twice as many
+    city_count = max(GEOMETRIC_NEIGHBOURS + 1, int(road_count / (1.25 * GEOMETRIC_NEIGHBOURS)))
+    points = [(generator.uniform(0, 1000), generator.uniform(0, 1000)) for city in range(city_count)]
+    bucket_count = max(1, int((city_count / 2) ** 0.5))
+    bucket_size = 1000 / bucket_count
+    buckets = {}
+    for city, (x, y) in enumerate(points):
+        key = (min(int(x / bucket_size), bucket_count - 1), min(int(y / bucket_size), bucket_count - 1))
+        buckets.setdefault(key, []).append(city)
+
+    for city, (x, y) in enumerate(points):
+        column = min(int(x / bucket_size), bucket_count - 1)
+        row = min(int(y / bucket_size), bucket_count - 1)
+        nearby = []
+        ring = 0
+        # a city found in ring r is at least (r - 1) buckets away, so one more ring is searched after enough are found
+        while ring <= bucket_count and (len(nearby) <= GEOMETRIC_NEIGHBOURS or ring < 2):
+            for bucket_column in range(column - ring, column + ring + 1):
+                for bucket_row in range(row - ring, row + ring + 1):
+                    if max(abs(bucket_column - column), abs(bucket_row - row)) == ring:
+                        nearby.extend(buckets.get((bucket_column, bucket_row), []))
+            ring += 1
+        nearby.sort(key=lambda other: (points[other][0] - x) ** 2 + (points[other][1] - y) ** 2)
+        for other in nearby[1:GEOMETRIC_NEIGHBOURS + 1]:
+            distance = int(((points[other][0] - x) ** 2 + (points[other][1] - y) ** 2) ** 0.5) + 1
+            yield f"C{city}", f"C{other}", distance
+            yield f"C{other}", f"C{city}", distance
+
+
+def scale_free_roads(road_count, generator):
+    """
+    Make the road segments of a Barabasi-Albert road network with about
+    <road_count> road segments. Every city appears in the list of ends once
+    per road segment, so picking from the list picks a city in proportion
+    to its degree.
+
+    :param road_count: int, the wanted number of road segments
+    :param generator: random.Random, the generator of the links and distances
+    :return: generator of (str, str, int), the road segments
+    """
+
+    city_count = max(SCALE_FREE_LINKS + 1, road_count // (2 * SCALE_FREE_LINKS))
+    ends = list(range(SCALE_FREE_LINKS))
+    for city in range(SCALE_FREE_LINKS, city_count):
+        linked = set()
+        while len(linked) < SCALE_FREE_LINKS:
+            linked.add(generator.choice(ends))
+        for other in sorted(linked):
+            distance = generator.randint(10, 100)
+            yield f"C{city}", f"C{other}", distance
+            yield f"C{other}", f"C{city}", distance
+            ends.extend((city, other))
+
+
+GENERATORS = {
+    "grid": grid_roads,
+    "geometric": geometric_roads,
+    "scale-free": scale_free_roads,
+}
+
+
+def write_network(file_name, generator_name, road_count, seed=1):
+    """
+    Write a synthetic road network into a distance file.
+
+    :param file_name: str, the name of the distance file
+    :param generator_name: str, a key of GENERATORS
+    :param road_count: int, the wanted number of road segments
+    :param seed: int, the seed of the random generator
+    :return: int, the number of written lines, the same road segment may
+             be written twice
+    """
+
+    generator = random.Random(seed)
+    written = 0
+    with open(file_name, mode="w", encoding="utf-8", newline="\n") as distance_file:
+        for departure, destination, distance in GENERATORS[generator_name](road_count, generator):
+            distance_file.write(f"{departure};{destination};{distance}\n")
+            written += 1
+        distance_file.write(f"{ISLAND[0]};{ISLAND[1]};1\n")
+    return written + 1
+
+
+def measure(file_name, query_count, seed=1):
+    """
+    Time reading a distance file, route queries, route queries without a
+    route and the display action.
+
+    :param file_name: str, the name of the distance file
+    :param query_count: int, the number of queries of both kinds
+    :param seed: int, the seed of the random queries
+    :return: dict, the measured times in seconds and the size of the road network
+    """
+
+    begin = time.perf_counter()
+    network = read_distance_file(file_name)
+    load = time.perf_counter() - begin
+
+    generator = random.Random(seed)
+    cities = [network.city_name(city_id) for city_id in range(network.city_count())
+              if network.city_name(city_id) not in ISLAND]
+    routes = [(generator.choice(cities), generator.choice(cities)) for query in range(query_count)]
+    # the island can't be reached from the rest of the road network
+    unreachable = [(generator.choice(cities), ISLAND[0]) for query in range(query_count)]
+
+    results = {
+        "cities": network.city_count(),
+        "road_segments": sum(1 for city_id in range(network.city_count())
+                             for road in network.roads_from(network.city_name(city_id))),
+        "load": load,
+    }
+    for kind, queries in (("route", routes), ("unreachable", unreachable)):
+        latencies = []
+        for departure, destination in queries:
+            begin = time.perf_counter()
+            find_route(network, departure, destination)
+            latencies.append(time.perf_counter() - begin)
+        results[kind] = _summary(latencies)
+
+    with open(os.devnull, mode="w") as devnull, contextlib.redirect_stdout(devnull):
+        begin = time.perf_counter()
+        display(network)
+        results["display"] = time.perf_counter() - begin
+
+    return results
+
+
+def _summary(latencies):
+    """
+    Summarize the latencies of a set of queries.
+
+    :param latencies: list[float], the latencies in seconds
+    :return: dict[str, float], the mean, median and largest latency in seconds
+    """
+
+    return {
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "median": statistics.median(latencies) if latencies else 0.0,
+        "max": max(latencies, default=0.0),
+    }
+
+
+def run(sizes, generator_names, query_count, output_file, directory):
+    """
+    Measure every generator at every size and write the results.
+
+    :param sizes: list[int], the wanted numbers of road segments
+    :param generator_names: list[str], the keys of GENERATORS
+    :param query_count: int, the number of queries of both kinds
+    :param output_file: str, the name of the JSON file to be written
+    :param directory: str, the directory of the generated distance files
+    :return: list[dict], the results
+    """
+
+    results = []
+    print(f"{'network':<12}{'segments':>10}{'cities':>9}{'load s':>9}{'route ms':>10}"
+          f"{'no route ms':>13}{'display s':>11}")
+    for generator_name in generator_names:
+        for size in sizes:
+            file_name = os.path.join(directory, f"{generator_name}-{size}.txt")
+            write_network(file_name, generator_name, size)
+            result = {"generator": generator_name, "size": size}
+            result.update(measure(file_name, query_count))
+            results.append(result)
+            print(f"{generator_name:<12}{result['road_segments']:>10}{result['cities']:>9}{result['load']:>9.2f}"
+                  f"{result['route']['mean'] * 1000:>10.2f}{result['unreachable']['mean'] * 1000:>13.2f}"
+                  f"{result['display']:>11.2f}")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "queries": query_count,
+        "results": results,
+    }
+    with open(output_file, mode="w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2)
+    return results
+
+
+def main():
+    sizes = []
+    generator_names = list(GENERATORS)
+    query_count = DEFAULT_QUERIES
+    output_file = DEFAULT_OUTPUT
+    directory = None
+    arguments = sys.argv[1:]
+    try:
+        while arguments:
+            argument = arguments.pop(0)
+            if argument == "--generators":
+                generator_names = arguments.pop(0).split(",")
+            elif argument == "--queries":
+                query_count = int(arguments.pop(0))
+            elif argument == "--output":
+                output_file = arguments.pop(0)
+            elif argument == "--keep":
+                directory = arguments.pop(0)
+            else:
+                sizes.append(int(argument))
+    except (IndexError, ValueError):
+        print("Usage: " + __doc__.split("Usage: ")[1].strip())
+        return
+    for generator_name in generator_names:
+        if generator_name not in GENERATORS:
+            print(f"Error: unknown generator '{generator_name}'.")
+            return
+    if not sizes:
+        sizes = DEFAULT_SIZES
+
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        run(sizes, generator_names, query_count, output_file, directory)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            run(sizes, generator_names, query_count, output_file, directory)
+    print(f"Results saved to '{output_file}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+
+Name:       Minh Vu
+Email:      2004minhvu@gmail.com
+
+Project: Road Trip Optimizer
+
+This program compares the route query latency of the contraction hierarchy
+(method "ch") with the plain Dijkstra's search of find_route on synthetic
+grid shaped road networks, made by the grid generator of benchmark.py.
+
+Usage: python ch_benchmark.py [number of cities ...] [--queries N] [--large]
+The default sizes are 10 000 and 100 000 cities. --large adds a network of
+1 000 000 cities, whose preprocessing takes hours in pure Python.
+"""
+
+import random
+import sys
+import time
+from array import array
+
+from benchmark import grid_roads
+from traveller_template1 import RoadNetwork, find_route
+
+
+DEFAULT_SIZES = (10_000, 100_000)
+LARGE_SIZE = 1_000_000
+DEFAULT_QUERIES = 50
+
+
+def grid_network(city_count, seed=1):
+    """
+    Make a grid shaped road network with about <city_count> cities.
+
+    :param city_count: int, the wanted number of cities
+    :param seed: int, the seed of the random distances
+    :return: RoadNetwork, the road network
+    """
+
+    # a side x side grid has 4 * side * (side - 1) road segments
+    side = max(2, int(city_count ** 0.5))
+    network = RoadNetwork()
+    sources = array("i")
+    targets = array("i")
+    weights = array("i")
+    for departure, destination, distance in grid_roads(4 * side * (side - 1), random.Random(seed)):
+        sources.append(network.intern(departure))
+        targets.append(network.intern(destination))
+        weights.append(distance)
+
+    network.load_edges(sources, targets, weights)
+    return network
+
+
+def measure(city_count, query_count):
+    """
+    Build a grid network, its contraction hierarchy and time the queries.
+
+    :param city_count: int, the wanted number of cities
+    :param query_count: int, the number of random route queries
+    :return: dict, the measured times in seconds
+    """
+
+    network = grid_network(city_count)
+    names = [network.city_name(city_id) for city_id in range(network.city_count())]
+    generator = random.Random(city_count)
+    queries = [(generator.choice(names), generator.choice(names)) for query in range(query_count)]
+
+    begin = time.perf_counter()
+    network.contraction_hierarchy().build()
+    preprocessing = time.perf_counter() - begin
+
+    latencies = {}
+    for method in ("dijkstra", "ch"):
+        begin = time.perf_counter()
+        routes = [find_route(network, departure, destination, method=method)
+                  for departure, destination in queries]
+        latencies[method] = (time.perf_counter() - begin) / query_count
+        latencies[method + " routes"] = routes
+
+    for dijkstra_route, ch_route in zip(latencies.pop("dijkstra routes"), latencies.pop("ch routes")):
+        if _route_length(network, dijkstra_route) != _route_length(network, ch_route):
+            print(f"Error: the routes {dijkstra_route} and {ch_route} differ in length.")
+
+    return {
+        "cities": network.city_count(),
+        "shortcuts": network.contraction_hierarchy().get_shortcut_count(),
+        "preprocessing": preprocessing,
+        "dijkstra": latencies["dijkstra"],
+        "ch": latencies["ch"],
+    }
+
+
+def _route_length(network, route):
+    """
+    Add up the distances of a route.
+
+    :param network: RoadNetwork, the road network
+    :param route: list[str], the route returned by find_route
+    :return: int, the length of the route in km
+    """
+
+    if len(route) == 2 and route[0] == route[1]:
+        return 0
+    return sum(network.distance(route[i], route[i + 1]) for i in range(len(route) - 1))
+
+
+def main():
+    sizes = []
+    query_count = DEFAULT_QUERIES
+    large = False
+    arguments = sys.argv[1:]
+    try:
+        while arguments:
+            argument = arguments.pop(0)
+            if argument == "--queries":
+                query_count = int(arguments.pop(0))
+            elif argument == "--large":
+                large = True
+            else:
+                sizes.append(int(argument))
+    except (IndexError, ValueError):
+        print("Usage: " + __doc__.split("Usage: ")[1].strip())
+        return
+    if not sizes:
+        sizes = list(DEFAULT_SIZES)
+    if large:
+        sizes.append(LARGE_SIZE)
+
+    print(f"{'cities':>10}{'shortcuts':>11}{'preprocess s':>14}{'dijkstra ms':>13}{'ch ms':>9}{'speedup':>9}")
+    for city_count in sizes:
+        result = measure(city_count, query_count)
+        speedup = result["dijkstra"] / result["ch"] if result["ch"] > 0 else float("inf")
+        print(f"{result['cities']:>10}{result['shortcuts']:>11}{result['preprocessing']:>14.1f}"
+              f"{result['dijkstra'] * 1000:>13.2f}{result['ch'] * 1000:>9.3f}{speedup:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+
+Name:       Minh Vu
+Email:      2004minhvu@gmail.com
+
+Project: Road Trip Optimizer
+
+Contraction hierarchies for the route searches of traveller_template1.py.
+
+The cities are contracted one by one in the order of their importance.
+Contracting a city removes it from the remaining road network, and a
+shortcut road segment is added between two of its neighbours whenever the
+route through the contracted city is the only shortest route between them.
+After the preprocessing a route query is a bidirectional search that only
+goes "upwards" to more important cities from both ends, which settles a few
+hundred cities even on a large road network. The shortcuts remember the
+city they skip, so the route can be unpacked back into the original cities.
+"""
+
+import heapq
+from array import array
+
+
+# a witness search gives up after settling this many cities, which only
+# costs an unnecessary shortcut now and then
+WITNESS_SETTLE_LIMIT = 60
+
+
+class ContractionHierarchy:
+    """
+    This class keeps the contraction hierarchy of a RoadNetwork. The
+    hierarchy is built by build() (or refresh()) and dropped whenever a
+    road segment of the network changes, as any change can make a shortcut
+    wrong.
+
+    The upward road segments (towards a more important city) are stored in
+    CSR form for the forward search, and the downward road segments are
+    stored reversed under their more important end for the backward search.
+    """
+
+    def __init__(self, network):
+        self.__network = network
+        self.__ranks = None       # city id -> contraction order
+        self.__upward = None      # (starts, targets, weights) of the forward search
+        self.__downward = None    # (starts, sources, weights) of the backward search
+        self.__middles = None     # departure * city count + destination -> skipped city
+        self.__city_count = 0
+        self.__shortcut_count = 0
+        network.add_listener(self)
+
+    def is_valid(self):
+        """
+        Check if the hierarchy is built and up to date.
+
+        :return: True, if the hierarchy can be used | False, if it can't
+        """
+
+        return self.__ranks is not None
+
+    def get_shortcut_count(self):
+        """
+        fetch the number of shortcuts added by the last build
+
+        :return: int, the number of shortcuts
+        """
+
+        return self.__shortcut_count
+
+    def refresh(self):
+        """
+        Build the hierarchy if it has not been built yet or if it is stale.
+        """
+
+        if self.__ranks is None:
+            self.build()
+
+    def road_changed(self, departure_id, destination_id, old_distance, new_distance):
+        """
+        Follow a change of the road network, see RoadNetwork.add_listener.
+        """
+
+        self.__ranks = None
+        self.__upward = None
+        self.__downward = None
+        self.__middles = None
+
+    def build(self):
+        """
+        Contract every city. The next city to be contracted is the one with
+        the smallest edge difference (the shortcuts it needs minus the road
+        segments it removes) plus the number of its already contracted
+        neighbours, which spreads the contraction evenly over the network.
+        The priorities are updated lazily: a popped city whose priority has
+        grown is pushed back if it is no longer the smallest one.
+        """
+
+        city_count = self.__network.city_count()
+        starts, ends, targets, weights = self.__network.adjacency()
+
+        # the road network under contraction as dicts, the road segments of
+        # the contracted cities are kept as they belong to the hierarchy
+        outgoing = [{} for city_id in range(city_count)]
+        inbound = [{} for city_id in range(city_count)]
+        for city_id in range(city_count):
+            for slot in range(starts[city_id], ends[city_id]):
+                neighbour = targets[slot]
+                if neighbour != city_id:
+                    outgoing[city_id][neighbour] = weights[slot]
+                    inbound[neighbour][city_id] = weights[slot]
+
+        contracted = bytearray(city_count)
+        contracted_neighbours = array("i", [0]) * city_count
+        ranks = array("i", [0]) * city_count
+        middles = {}
+        shortcut_count = 0
+
+        heap = []
+        for city_id in range(city_count):
+            shortcuts = self.__find_shortcuts(city_id, outgoing, inbound, contracted)
+            heap.append((self.__priority(city_id, shortcuts, outgoing, inbound, contracted,
+                                         contracted_neighbours), city_id))
+        heapq.heapify(heap)
+
+        rank = 0
+        while heap:
+            priority, city_id = heapq.heappop(heap)
+            shortcuts = self.__find_shortcuts(city_id, outgoing, inbound, contracted)
+            priority = self.__priority(city_id, shortcuts, outgoing, inbound, contracted, contracted_neighbours)
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, city_id))
+                continue
+
+            for departure, destination, distance in shortcuts:
+                outgoing[departure][destination] = distance
+                inbound[destination][departure] = distance
+                middles[departure * city_count + destination] = city_id
+                shortcut_count += 1
+
+            contracted[city_id] = 1
+            ranks[city_id] = rank
+            rank += 1
+            for neighbour in outgoing[city_id]:
+                contracted_neighbours[neighbour] += 1
+            for neighbour in inbound[city_id]:
+                contracted_neighbours[neighbour] += 1
+
+        upward = ([[] for city_id in range(city_count)])
+        downward = ([[] for city_id in range(city_count)])
+        for city_id in range(city_count):
+            for neighbour, distance in outgoing[city_id].items():
+                if ranks[neighbour] > ranks[city_id]:
+                    upward[city_id].append((neighbour, distance))
+                else:
+                    downward[neighbour].append((city_id, distance))
+
+        self.__upward = _to_csr(upward)
+        self.__downward = _to_csr(downward)
+        self.__middles = middles
+        self.__city_count = city_count
+        self.__shortcut_count = shortcut_count
+        self.__ranks = ranks
+
+    def route(self, source, target, trace=None):
+        """
+        Find the shortest route between two cities: both searches only go
+        upwards in the hierarchy, and the route goes through the city where
+        they meet with the smallest total distance. A search stops when the
+        smallest distance in its heap is no better than the best route found.
+
+        :param source: int, the id of the departure city
+        :param target: int, the id of the destination city
+        :param trace: dict | None, "reached" and "heap_left" are added here
+                      after the search, see set_profile_hook in traveller_template1.py
+        :return: list[int], the city ids of the route or [] if there is no route
+        """
+
+        self.refresh()
+
+        forward = (self.__upward, {source: 0}, {source: -1}, [(0, source)])
+        backward = (self.__downward, {target: 0}, {target: -1}, [(0, target)])
+        best = None
+        meeting_city = -1
+
+        while forward[3] or backward[3]:
+            # continue with the side with the smaller distance on the top of its heap
+            if not backward[3] or (forward[3] and forward[3][0][0] <= backward[3][0][0]):
+                side, other = forward, backward
+            else:
+                side, other = backward, forward
+            (starts, neighbours, weights), deltas, came_from, heap = side
+
+            delta, city = heapq.heappop(heap)
+            if best is not None and delta >= best:
+                # nothing on this side can make the route shorter any more
+                heap.clear()
+                continue
+            if delta > deltas[city]:
+                continue
+
+            other_delta = other[1].get(city)
+            if other_delta is not None and (best is None or delta + other_delta < best):
+                best = delta + other_delta
+                meeting_city = city
+
+            for slot in range(starts[city], starts[city + 1]):
+                neighbour = neighbours[slot]
+                new_delta = delta + weights[slot]
+                if new_delta < deltas.get(neighbour, new_delta + 1):
+                    deltas[neighbour] = new_delta
+                    came_from[neighbour] = city
+                    heapq.heappush(heap, (new_delta, neighbour))
+
+        if trace is not None:
+            trace["reached"] += len(forward[1]) + len(backward[1])
+            trace["heap_left"] += len(forward[3]) + len(backward[3])
+
+        if best is None:
+            return []
+
+        # the route in the hierarchy, from the source up to the meeting city and down to the target
+        hierarchy_route = []
+        city = meeting_city
+        while city != -1:
+            hierarchy_route.append(city)
+            city = forward[2][city]
+        hierarchy_route.reverse()
+        city = backward[2][meeting_city]
+        while city != -1:
+            hierarchy_route.append(city)
+            city = backward[2][city]
+
+        route = [source]
+        for i in range(len(hierarchy_route) - 1):
+            route.extend(self.__unpack(hierarchy_route[i], hierarchy_route[i + 1]))
+        return route
+
+    def __unpack(self, departure, destination):
+        """
+        Replace a road segment of the hierarchy by the original road segments.
+
+        :param departure: int, the id of the departure city
+        :param destination: int, the id of the destination city
+        :return: list[int], the city ids after <departure> up to <destination>
+        """
+
+        cities = []
+        stack = [(departure, destination)]
+        while stack:
+            departure, destination = stack.pop()
+            middle = self.__middles.get(departure * self.__city_count + destination)
+            if middle is None:
+                cities.append(destination)
+            else:
+                # the second half is pushed first so that the first half is unpacked first
+                stack.append((middle, destination))
+                stack.append((departure, middle))
+        return cities
+
+    @staticmethod
+    def __find_shortcuts(city_id, outgoing, inbound, contracted):
+        """
+        Find the shortcuts needed if <city_id> is contracted. For every
+        remaining neighbour leading to the city, a limited Dijkstra's search
+        that avoids the city looks for a route (a witness) to the remaining
+        neighbours after the city that is no longer than the route through it.
+
+        :return: list[tuple(int, int, int)], the departure, the destination
+                 and the distance of every shortcut
+        """
+
+        after = [(neighbour, distance) for neighbour, distance in outgoing[city_id].items()
+                 if not contracted[neighbour]]
+        if not after:
+            return []
+        longest_after = max(distance for neighbour, distance in after)
+
+        shortcuts = []
+        for before, before_distance in inbound[city_id].items():
+            if contracted[before]:
+                continue
+
+            limit = before_distance + longest_after
+            deltas = {before: 0}
+            settled = 0
+            heap = [(0, before)]
+            while heap and settled < WITNESS_SETTLE_LIMIT:
+                delta, city = heapq.heappop(heap)
+                if delta > limit:
+                    break
+                if delta > deltas[city]:
+                    continue
+                settled += 1
+                for neighbour, distance in outgoing[city].items():
+                    if neighbour == city_id or contracted[neighbour]:
+                        continue
+                    new_delta = delta + distance
+                    if new_delta < deltas.get(neighbour, new_delta + 1):
+                        deltas[neighbour] = new_delta
+                        heapq.heappush(heap, (new_delta, neighbour))
+
+            for neighbour, after_distance in after:
+                if neighbour == before:
+                    continue
+                through = before_distance + after_distance
+                if deltas.get(neighbour, through + 1) > through:
+                    shortcuts.append((before, neighbour, through))
+
+        return shortcuts
+
+    @staticmethod
+    def __priority(city_id, shortcuts, outgoing, inbound, contracted, contracted_neighbours):
+        """
+        Count the contraction priority of a city, the smaller the earlier.
+
+        :return: int, the edge difference plus the contracted neighbours
+        """
+
+        removed = 0
+        for neighbour in outgoing[city_id]:
+            if not contracted[neighbour]:
+                removed += 1
+        for neighbour in inbound[city_id]:
+            if not contracted[neighbour]:
+                removed += 1
+        return len(shortcuts) - removed + contracted_neighbours[city_id]
+
+
+def _to_csr(road_lists):
+    """
+    Pack lists of road segments into CSR arrays.
+
+    :param road_lists: list[list[tuple(int, int)]], the (city id, distance)
+                       pairs of every city
+    :return: tuple(array, array, array), the starts (one extra at the end),
+             the city ids and the distances
+    """
+
+    starts = array("i", [0])
+    cities = array("i")
+    # a shortcut is as long as the roads it replaces together, which may not fit 32 bits
+    distances = array("q")
+    for roads in road_lists:
+        for city_id, distance in roads:
+            cities.append(city_id)
+            distances.append(distance)
+        starts.append(len(cities))
+    return starts, cities, distances
@@ -0,0 +1,215 @@
+"""
+
+Name:       Minh Vu
+Email:      2004minhvu@gmail.com
+
+Project: Road Trip Optimizer
+
+An append-only journal of the changes made to the RoadNetwork of
+traveller_template1.py, so that the add and remove actions are not lost
+when the program ends.
+
+Every change of a road segment is appended to the journal file as one
+line: "+;departure;destination;distance" for a new road segment or a new
+distance, and "-;departure;destination" for a removed one. A change costs
+one write to the end of the file no matter how large the road network is.
+The lines are handed to the operating system right away, and forced to the
+disk with fsync once per JOURNAL_SYNC_ENTRIES changes or JOURNAL_SYNC_SECONDS
+seconds, whichever comes first, and when the journal is closed.
+
+At startup the journal is replayed on top of the road network read from the
+distance file (or its snapshot). Every line sets or removes a road segment
+to a given state, so replaying a line twice does no harm. The compact
+action of traveller_template1.py writes the road network into a new
+distance file and empties the journal.
+
+The journal file is created at the first change, so a session without
+changes leaves no file behind. If it can't be written, e.g. in a read-only
+directory, a warning is printed and the program goes on without keeping
+the changes.
+"""
+
+import os
+import time
+
+
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_SYNC_ENTRIES = 64
+JOURNAL_SYNC_SECONDS = 1.0
+
+
+class MutationJournal:
+    """
+    This class keeps the journal file of a distance file. It is a listener
+    of the road network (see RoadNetwork.add_listener) and appends every
+    change it is told about.
+    """
+
+    def __init__(self, file_name, sync_entries=JOURNAL_SYNC_ENTRIES, sync_seconds=JOURNAL_SYNC_SECONDS):
+        self.__file_name = file_name
+        self.__sync_entries = sync_entries
+        self.__sync_seconds = sync_seconds
+        self.__network = None
+        self.__journal_file = None
+        self.__unsynced = 0          # the changes written after the last fsync
+        self.__last_sync = 0.0
+        self.__complete_size = 0     # the size of the complete lines found by replay
+        self.__writable = True       # False after the journal file couldn't be opened
+
+    def get_file_name(self):
+        """
+        fetch the name of the journal file
+
+        :return: str, the name of the journal file
+        """
+
+        return self.__file_name
+
+    def attach(self, network):
+        """
+        Replay the journal on a road network and start appending its changes.
+
+        :param network: RoadNetwork, the road network read from the distance file
+        :return: int | None, the number of replayed changes, or None if the
+                 journal can't be read
+        """
+
+        replayed = self.replay(network)
+        if replayed is None:
+            return None
+        self.__network = network
+        self.__last_sync = time.monotonic()
+        network.add_listener(self)
+        # a missing journal is created by the first change
+        if os.path.exists(self.__file_name):
+            self.__open()
+        return replayed
+
+    def __open(self):
+        """
+        Open the journal file for appending, or warn that the changes are
+        not kept if it can't be opened.
+
+        :return: True, if the file was opened | False, if it wasn't
+        """
+
+        try:
+            self.__journal_file = open(self.__file_name, mode="a", encoding="utf-8", newline="\n")
+            # drop a line cut short by a crash, so that the next change starts on a line of its own
+            if self.__journal_file.tell() > self.__complete_size:
+                self.__journal_file.truncate(self.__complete_size)
+        except OSError:
+            if self.__journal_file is not None:
+                self.__journal_file.close()
+                self.__journal_file = None
+            self.__writable = False
+            print(f"Warning: '{self.__file_name}' can not be written, the changes are not kept.")
+            return False
+        return True
+
+    def replay(self, network):
+        """
+        Apply the changes of the journal file to a road network. A last line
+        without a line break was cut short by a crash and is left out.
+
+        :param network: RoadNetwork, the road network
+        :return: int | None, the number of replayed changes, or None if the
+                 journal has a bad line
+        """
+
+        replayed = 0
+        self.__complete_size = 0
+        try:
+            with open(self.__file_name, mode="r", encoding="utf-8", newline="\n") as journal_file:
+                for line_number, line in enumerate(journal_file, start=1):
+                    if not line.endswith("\n"):
+                        break
+                    fields = line[:-1].split(";")
+                    try:
+                        if fields[0] == "+" and len(fields) == 4 and fields[3].isdigit():
+                            # raises ValueError for a distance the road network can't hold
+                            network.set_distance(fields[1], fields[2], int(fields[3]))
+                        elif fields[0] == "-" and len(fields) == 3:
+                            network.remove_road(fields[1], fields[2])
+                        else:
+                            raise ValueError(line)
+                    except ValueError:
+                        print(f"Error: line {line_number} of '{self.__file_name}' is not a change.")
+                        return None
+                    replayed += 1
+                    self.__complete_size += len(line.encode("utf-8"))
+        except FileNotFoundError:
+            return 0
+        except (OSError, UnicodeDecodeError):
+            return None
+        return replayed
+
+    def road_changed(self, departure_id, destination_id, old_distance, new_distance):
+        """
+        Follow a change of the road network, see RoadNetwork.add_listener.
+        """
+
+        if self.__journal_file is None and (not self.__writable or not self.__open()):
+            return
+        departure = self.__network.city_name(departure_id)
+        destination = self.__network.city_name(destination_id)
+        if new_distance is None:
+            self.__journal_file.write(f"-;{departure};{destination}\n")
+        else:
+            self.__journal_file.write(f"+;{departure};{destination};{new_distance}\n")
+        self.__journal_file.flush()
+
+        self.__unsynced += 1
+        if self.__unsynced >= self.__sync_entries or time.monotonic() - self.__last_sync >= self.__sync_seconds:
+            self.sync()
+
+    def sync(self):
+        """
+        Force the written changes to the disk.
+        """
+
+        if self.__journal_file is None or self.__unsynced == 0:
+            return
+        self.__journal_file.flush()
+        os.fsync(self.__journal_file.fileno())
+        self.__unsynced = 0
+        self.__last_sync = time.monotonic()
+
+    def clear(self):
+        """
+        Empty the journal after its changes have been written into the
+        distance file, see compact_distance_file in traveller_template1.py.
+        """
+
+        if self.__journal_file is None:
+            return
+        self.__journal_file.truncate(0)
+        self.__journal_file.flush()
+        os.fsync(self.__journal_file.fileno())
+        self.__unsynced = 0
+        self.__last_sync = time.monotonic()
+
+    def close(self):
+        """
+        Sync and close the journal file and stop following the road network.
+        """
+
+        if self.__network is None:
+            return
+        if self.__journal_file is not None:
+            self.sync()
+            self.__journal_file.close()
+            self.__journal_file = None
+        self.__network.remove_listener(self)
+        self.__network = None
+
+
+def journal_file_name(source_file):
+    """
+    Name the journal file of a distance file.
+
+    :param source_file: str, the name of the distance file
+    :return: str, the name of the journal file
+    """
+
+    return source_file + JOURNAL_SUFFIX
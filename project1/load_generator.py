@@ -0,0 +1,231 @@
+"""
+
+Name:       Minh Vu
+Email:      2004minhvu@gmail.com
+
+Project: Road Trip Optimizer
+
+This program measures the route server (route_server.py) under load. It
+keeps a number of connections open to the server, sends route requests
+between random cities of the distance file over them as fast as the server
+answers, and reports the latency percentiles and the queries per second.
+
+A part of the requests can repeat one popular route, so that the request
+coalescing of the server is used. The counters of the server are shown at
+the end, see the /stats endpoint.
+
+Usage: python load_generator.py <distance file> [--requests N] [--connections N]
+                                [--repeat fraction] [--port N] [--seed N]
+"""
+
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+import urllib.parse
+
+from route_server import DEFAULT_PORT, HOST
+
+
+DEFAULT_REQUESTS = 1000
+DEFAULT_CONNECTIONS = 16
+
+
+def read_city_names(file_name):
+    """
+    Collect the names of the departure cities of a distance file, without
+    building the road network.
+
+    :param file_name: str, the name of the distance file
+    :return: list[str] | None, the names in file order, or None if the file
+             can't be read
+    """
+
+    names = {}
+    try:
+        with open(file_name, mode="r", encoding="utf-8") as distance_file:
+            for row in distance_file:
+                departure = row.split(";", 1)[0].strip()
+                if departure:
+                    names[departure] = None
+    except (OSError, UnicodeDecodeError):
+        return None
+    return list(names)
+
+
+def make_queries(cities, request_count, repeat, seed=1):
+    """
+    Pick the departure and destination cities of the route requests.
+
+    :param cities: list[str], the names of the cities
+    :param request_count: int, the number of requests
+    :param repeat: float, the fraction of requests for the same popular route
+    :param seed: int, the seed of the random generator
+    :return: list[tuple(str, str)], the departure and destination cities
+    """
+
+    generator = random.Random(seed)
+    popular = (generator.choice(cities), generator.choice(cities))
+    queries = []
+    for request in range(request_count):
+        if generator.random() < repeat:
+            queries.append(popular)
+        else:
+            queries.append((generator.choice(cities), generator.choice(cities)))
+    return queries
+
+
+async def request(reader, writer, method, target):
+    """
+    Send one request over an open connection and read its answer.
+
+    :param reader: asyncio.StreamReader, the connection
+    :param writer: asyncio.StreamWriter, the connection
+    :param method: str, the HTTP method
+    :param target: str, the path and the parameters of the URL
+    :return: tuple(int, dict), the HTTP status and the JSON answer
+    """
+
+    writer.write(f"{method} {target} HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode("utf-8"))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    body_length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, separator, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            body_length = int(value)
+    return status, json.loads(await reader.readexactly(body_length))
+
+
+async def _client(port, queries, latencies, failures):
+    """
+    Send route requests over one connection until the queries run out.
+    The queries are shared by all the clients.
+    """
+
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        while queries:
+            departure, destination = queries.pop()
+            target = "/route?" + urllib.parse.urlencode({"from": departure, "to": destination})
+            begin = time.perf_counter()
+            status, answer = await request(reader, writer, "GET", target)
+            latencies.append(time.perf_counter() - begin)
+            if status != 200:
+                failures.append((departure, destination, answer.get("error")))
+    finally:
+        writer.close()
+
+
+async def run_load(port, queries, connection_count):
+    """
+    Send the route requests over several connections at once.
+
+    :param port: int, the port of the server on localhost
+    :param queries: list[tuple(str, str)], the departure and destination cities
+    :param connection_count: int, the number of connections
+    :return: dict, the latencies, the queries per second and the counters of the server
+    """
+
+    latencies = []
+    failures = []
+    pending = list(reversed(queries))
+    begin = time.perf_counter()
+    await asyncio.gather(*[_client(port, pending, latencies, failures) for connection in range(connection_count)])
+    elapsed = time.perf_counter() - begin
+
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        status, server_statistics = await request(reader, writer, "GET", "/stats")
+    finally:
+        writer.close()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "failures": len(failures),
+        "seconds": elapsed,
+        "qps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50": _percentile(latencies, 50),
+        "p99": _percentile(latencies, 99),
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "server": server_statistics,
+    }
+
+
+def _percentile(latencies, percent):
+    """
+    Pick a percentile of sorted latencies (nearest rank).
+
+    :param latencies: list[float], the sorted latencies in seconds
+    :param percent: int, the percentile
+    :return: float, the latency in seconds
+    """
+
+    if not latencies:
+        return 0.0
+    rank = max(1, -(-percent * len(latencies) // 100))
+    return latencies[rank - 1]
+
+
+def main():
+    arguments = sys.argv[1:]
+    request_count = DEFAULT_REQUESTS
+    connection_count = DEFAULT_CONNECTIONS
+    repeat = 0.0
+    port = DEFAULT_PORT
+    seed = 1
+    distance_file = None
+    try:
+        while arguments:
+            argument = arguments.pop(0)
+            if argument == "--requests":
+                request_count = int(arguments.pop(0))
+            elif argument == "--connections":
+                connection_count = max(1, int(arguments.pop(0)))
+            elif argument == "--repeat":
+                repeat = float(arguments.pop(0))
+            elif argument == "--port":
+                port = int(arguments.pop(0))
+            elif argument == "--seed":
+                seed = int(arguments.pop(0))
+            elif distance_file is None:
+                distance_file = argument
+            else:
+                raise ValueError(argument)
+    except (IndexError, ValueError):
+        distance_file = None
+    if distance_file is None:
+        print("Usage: " + __doc__.split("Usage: ")[1].strip())
+        return
+
+    cities = read_city_names(distance_file)
+    if not cities:
+        print(f"Error: '{distance_file}' can not be read.")
+        return
+
+    queries = make_queries(cities, request_count, repeat, seed)
+    try:
+        results = asyncio.run(run_load(port, queries, connection_count))
+    except OSError:
+        print(f"Error: no route server on port {port}.")
+        return
+
+    print(f"{results['requests']} requests over {connection_count} connections in {results['seconds']:.2f} s")
+    print(f"QPS:  {results['qps']:.1f}")
+    print(f"p50:  {results['p50'] * 1000:.2f} ms")
+    print(f"p99:  {results['p99'] * 1000:.2f} ms")
+    print(f"mean: {results['mean'] * 1000:.2f} ms")
+    if results["failures"] > 0:
+        print(f"failed requests: {results['failures']}")
+    server = results["server"]
+    print(f"server: {server['searches']} searches, {server['coalesced']} coalesced requests")
+
+
+if __name__ == "__main__":
+    main()
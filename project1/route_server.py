@@ -0,0 +1,396 @@
+"""
+
+Name:       Minh Vu
+Email:      2004minhvu@gmail.com
+
+Project: Road Trip Optimizer
+
+A small HTTP server answering route queries on one road network, so that
+other programs don't have to start a process per query. The server only
+listens on localhost and answers in JSON:
+
+    GET    /route?from=Tampere&to=Oulu      the shortest route and its length
+    GET    /neighbours?city=Tampere         the road segments leaving a city
+    GET    /within?from=Tampere&distance=300
+                                            the cities within a distance
+    POST   /roads?from=A&to=B&distance=120  add a road segment or change its distance
+    DELETE /roads?from=A&to=B               remove a road segment
+    GET    /stats                           the request counters
+
+The event loop itself never touches the road network:
+- The route and within searches run in a pool of worker processes, on a
+  packed copy of the road network in shared memory (see shared_graph.py).
+- The changes of road segments run on one graph thread, which also packs
+  a new copy of the road network for the workers when the next search
+  needs it. So a search always sees the changes made before it.
+- Identical route requests that arrive while the first one is still being
+  searched wait for the same search (request coalescing).
+
+The road network is opened like in the interactive mode (see
+start_session in traveller_template1.py), so the snapshot and the journal
+are used and the changes made through the server are kept.
+
+Usage: python route_server.py <distance file> [--port N] [--workers N]
+"""
+
+import asyncio
+import json
+import os
+import signal
+import sys
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from shared_graph import SharedRoadNetwork, attach_network
+from traveller_template1 import start_session, find_routes_from, cities_within, is_valid_city_name, MAX_DISTANCE
+
+
+DEFAULT_PORT = 8080
+HOST = "127.0.0.1"
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+# the road network a worker process is attached to: (shared memory name, PackedRoadNetwork, SharedMemory)
+_attached = None
+
+
+class RouteServer:
+    """
+    This class answers the HTTP requests of the route server. The road
+    network is changed only on the graph thread, and every published copy
+    for the workers is kept until the last search using it has ended.
+    """
+
+    def __init__(self, network, workers=None):
+        self.__network = network
+        self.__graph_thread = ThreadPoolExecutor(max_workers=1)
+        self.__search_pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_start_worker)
+        self.__version = 0              # grows with every change of the road network
+        self.__published = None         # (version, shared memory name) of the newest copy
+        self.__publications = {}        # shared memory name -> [SharedRoadNetwork, searches using it]
+        self.__publish_lock = asyncio.Lock()
+        self.__pending = {}             # request key -> future of the search answering it
+        self.__statistics = {"requests": 0, "searches": 0, "coalesced": 0, "changes": 0}
+
+    def close(self):
+        """
+        Stop the workers and remove the shared copies of the road network.
+        """
+
+        self.__search_pool.shutdown()
+        self.__graph_thread.shutdown()
+        for shared_network, searches in self.__publications.values():
+            shared_network.close()
+        self.__publications = {}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve the requests of one connection, keeping it open between the
+        requests unless the client asks to close it.
+        """
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, separator, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body_length = int(headers.get("content-length", "0") or "0")
+                if body_length > 0:
+                    await reader.readexactly(body_length)
+
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    status, answer = 400, {"error": "bad request line"}
+                    keep_alive = False
+                else:
+                    method, target, version = parts
+                    url = urllib.parse.urlsplit(target)
+                    status, answer = await self.dispatch(method, url.path, dict(urllib.parse.parse_qsl(url.query)))
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                payload = json.dumps(answer, ensure_ascii=False).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                             f"Content-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                             + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, query):
+        """
+        Answer one request.
+
+        :param method: str, the HTTP method
+        :param path: str, the path of the URL
+        :param query: dict[str, str], the parameters of the URL
+        :return: tuple(int, dict), the HTTP status and the JSON answer
+        """
+
+        self.__statistics["requests"] += 1
+        handlers = {
+            ("GET", "/route"): (self.__route, ("from", "to")),
+            ("GET", "/neighbours"): (self.__neighbours, ("city",)),
+            ("GET", "/within"): (self.__within, ("from", "distance")),
+            ("POST", "/roads"): (self.__add_road, ("from", "to", "distance")),
+            ("DELETE", "/roads"): (self.__remove_road, ("from", "to")),
+            ("GET", "/stats"): (self.__stats, ()),
+        }
+        if (method, path) not in handlers:
+            if any(known_path == path for known_method, known_path in handlers):
+                return 405, {"error": f"'{method}' is not allowed for '{path}'"}
+            return 404, {"error": f"unknown path '{path}'"}
+
+        handler, parameters = handlers[(method, path)]
+        missing = [parameter for parameter in parameters if parameter not in query]
+        if missing:
+            return 400, {"error": f"missing parameter '{missing[0]}'"}
+        return await handler(*[query[parameter] for parameter in parameters])
+
+    async def __route(self, departure, destination):
+        if not await self.__in_graph_thread(self.__network.is_known, departure):
+            return 404, {"error": f"'{departure}' is unknown."}
+        routes = await self.__search(_route_task, departure, destination)
+        if destination not in routes:
+            return 200, {"route": [], "distance": None}
+        route, total_distance = routes[destination]
+        return 200, {"route": route, "distance": total_distance}
+
+    async def __within(self, departure, max_distance):
+        if not max_distance.isdigit():
+            return 400, {"error": f"'{max_distance}' is not an integer."}
+        if not await self.__in_graph_thread(self.__network.is_known, departure):
+            return 404, {"error": f"'{departure}' is unknown."}
+        cities = await self.__search(_within_task, departure, int(max_distance))
+        return 200, {"cities": cities}
+
+    async def __neighbours(self, city):
+        def neighbours():
+            if not self.__network.is_known(city):
+                return None
+            return sorted(self.__network.roads_from(city))
+
+        roads = await self.__in_graph_thread(neighbours)
+        if roads is None:
+            return 404, {"error": f"'{city}' is unknown."}
+        return 200, {"neighbours": roads}
+
+    async def __add_road(self, departure, destination, distance):
+        if not distance.isdigit():
+            return 400, {"error": f"'{distance}' is not an integer."}
+        if int(distance) > MAX_DISTANCE:
+            return 400, {"error": f"'{distance}' is larger than {MAX_DISTANCE}."}
+        # a ';' or a line break would break the line of the change in the journal
+        if not is_valid_city_name(departure) or not is_valid_city_name(destination):
+            return 400, {"error": "a city name can not contain ';' or control characters."}
+        await self.__in_graph_thread(self.__network.set_distance, departure, destination, int(distance))
+        self.__changed()
+        return 200, {"changed": True}
+
+    async def __remove_road(self, departure, destination):
+        if not await self.__in_graph_thread(self.__network.remove_road, departure, destination):
+            return 404, {"error": f"missing road segment between '{departure}' and '{destination}'."}
+        self.__changed()
+        return 200, {"changed": True}
+
+    async def __stats(self):
+        return 200, dict(self.__statistics, version=self.__version)
+
+    def __changed(self):
+        """
+        Count a change of the road network, the next search publishes a new copy.
+        """
+
+        self.__version += 1
+        self.__statistics["changes"] += 1
+
+    async def __in_graph_thread(self, function, *arguments):
+        """
+        Run a function on the graph thread, the only thread using the road network.
+        """
+
+        return await asyncio.get_running_loop().run_in_executor(self.__graph_thread, function, *arguments)
+
+    async def __search(self, task, *arguments):
+        """
+        Run a search in a worker process. A search with the same arguments
+        that is still running on the same version of the road network is
+        waited for instead of starting a new one.
+
+        :param task: function, the worker function, see _route_task
+        :return: the result of the worker function
+        """
+
+        key = (task.__name__, self.__version) + arguments
+        pending = self.__pending.get(key)
+        if pending is not None:
+            self.__statistics["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[key] = future
+        try:
+            name = await self.__publish()
+            self.__publications[name][1] += 1
+            try:
+                self.__statistics["searches"] += 1
+                result = await asyncio.get_running_loop().run_in_executor(self.__search_pool, task, name,
+                                                                          *arguments)
+            finally:
+                self.__publications[name][1] -= 1
+                self.__release_old_publications()
+            future.set_result(result)
+        except Exception as error:
+            future.set_exception(error)
+            # the waiting requests get the error, retrieve it here so it isn't reported as never retrieved
+            future.exception()
+            raise
+        finally:
+            del self.__pending[key]
+        return result
+
+    async def __publish(self):
+        """
+        Make sure the workers have a copy of the current road network.
+
+        :return: str, the name of the shared memory block of the copy
+        """
+
+        async with self.__publish_lock:
+            if self.__published is None or self.__published[0] != self.__version:
+                version = self.__version
+                shared_network = await self.__in_graph_thread(SharedRoadNetwork, self.__network)
+                self.__publications[shared_network.get_name()] = [shared_network, 0]
+                self.__published = (version, shared_network.get_name())
+                self.__release_old_publications()
+            return self.__published[1]
+
+    def __release_old_publications(self):
+        """
+        Remove the older copies of the road network no search is using any more.
+        """
+
+        for name in list(self.__publications):
+            shared_network, searches = self.__publications[name]
+            if name != self.__published[1] and searches == 0:
+                shared_network.close()
+                del self.__publications[name]
+
+
+def _start_worker():
+    """
+    Prepare a worker process. ^C reaches the workers too, but only the
+    server stops them, so that it can remove the shared copies first.
+    """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _network_for(name):
+    """
+    Attach a worker process to a copy of the road network, releasing the
+    copy it used before.
+
+    :param name: str, the name of the shared memory block
+    :return: PackedRoadNetwork, the road network
+    """
+
+    global _attached
+    if _attached is None or _attached[0] != name:
+        if _attached is not None:
+            _attached[1].release()
+            _attached[2].close()
+        network, memory = attach_network(name)
+        _attached = (name, network, memory)
+    return _attached[1]
+
+
+def _route_task(name, departure, destination):
+    """
+    Search a route in a worker process.
+
+    :return: dict[str, tuple(list[str], int)], see find_routes_from
+    """
+
+    return find_routes_from(_network_for(name), departure, [destination])
+
+
+def _within_task(name, departure, max_distance):
+    """
+    Search the cities within a distance in a worker process.
+
+    :return: list[tuple(str, int)], see cities_within
+    """
+
+    return cities_within(_network_for(name), departure, max_distance)
+
+
+async def serve(network, port, workers):
+    """
+    Run the server until it is interrupted.
+
+    :param network: RoadNetwork, the road network
+    :param port: int, the port on localhost
+    :param workers: int | None, the number of worker processes
+    """
+
+    route_server = RouteServer(network, workers)
+    try:
+        # stopping with SIGTERM cancels the server like ^C, so the shared copies are removed too
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    try:
+        server = await asyncio.start_server(route_server.handle_connection, HOST, port)
+        print(f"Serving on http://{HOST}:{port}/")
+        async with server:
+            await server.serve_forever()
+    finally:
+        route_server.close()
+
+
+def main():
+    arguments = sys.argv[1:]
+    port = DEFAULT_PORT
+    workers = None
+    try:
+        for option in ("--port", "--workers"):
+            if option in arguments:
+                position = arguments.index(option)
+                value = int(arguments[position + 1])
+                del arguments[position:position + 2]
+                if option == "--port":
+                    port = value
+                else:
+                    workers = value
+    except (IndexError, ValueError):
+        arguments = []
+    if len(arguments) != 1:
+        print("Usage: python route_server.py <distance file> [--port N] [--workers N]")
+        return
+
+    session = start_session(arguments[0])
+    if session is None:
+        return
+    network, journal = session
+    try:
+        asyncio.run(serve(network, port, workers))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        journal.close()
+
+
+if __name__ == "__main__":
+    main()
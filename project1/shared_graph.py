@@ -0,0 +1,322 @@
+"""
+
+Name:       Minh Vu
+Email:      2004minhvu@gmail.com
+
+Project: Road Trip Optimizer
+
+A packed, read-only form of the RoadNetwork of traveller_template1.py that
+lives in one flat buffer, and the helpers to share it between processes
+with multiprocessing.shared_memory.
+
+The buffer holds a header, the string table of the city names, the ids
+sorted by name (for finding a city by name with a binary search), the CSR
+arrays (offsets, targets, weights) and one flag byte per city. A process
+that attaches to the buffer reads everything in place, so attaching costs
+O(1) time and memory no matter how large the road network is, and no
+worker gets its own copy of the graph.
+
+PackedRoadNetwork offers the reading part of the RoadNetwork API, so the
+Dijkstra's searches of traveller_template1.py (find_route with the default
+method, find_routes_from) run on it unchanged.
+"""
+
+import multiprocessing
+import sys
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+
+
+PACKED_MAGIC = b"RTGRAPH1"
+HEADER_ITEMS = 4             # city count, road segment count, string table size, reserved
+DEPARTURE_FLAG = 1
+KNOWN_FLAG = 2
+
+
+class PackedRoadNetwork:
+    """
+    This class reads a road network packed by pack_network from a buffer
+    (shared memory, mmap or bytes) without copying it.
+    """
+
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        if bytes(view[:len(PACKED_MAGIC)]) != PACKED_MAGIC:
+            raise ValueError("the buffer does not contain a packed road network")
+
+        header = view[len(PACKED_MAGIC):len(PACKED_MAGIC) + 8 * HEADER_ITEMS].cast("q")
+        city_count, edge_count, name_size = header[0], header[1], header[2]
+        layout = _layout(city_count, edge_count, name_size)
+
+        self.__city_count = city_count
+        self.__name_offsets = view[layout["name_offsets"]].cast("q")
+        self.__sorted_ids = view[layout["sorted_ids"]].cast("i")
+        offsets = view[layout["offsets"]].cast("i")
+        self.__starts = offsets[:-1]
+        self.__ends = offsets[1:]
+        self.__targets = view[layout["targets"]].cast("i")
+        self.__weights = view[layout["weights"]].cast("i")
+        self.__flags = view[layout["flags"]]
+        self.__names = view[layout["names"]]
+        self.__views = [header, self.__name_offsets, self.__sorted_ids, offsets, self.__starts, self.__ends,
+                        self.__targets, self.__weights, self.__flags, self.__names, view]
+
+    def release(self):
+        """
+        Release the views into the buffer, after which the buffer (e.g. the
+        shared memory) can be closed. The object can't be used any more.
+        """
+
+        for view in self.__views:
+            view.release()
+        self.__views = []
+
+    def city_count(self):
+        """
+        fetch the number of cities
+
+        :return: int, the number of cities
+        """
+
+        return self.__city_count
+
+    def city_name(self, city_id):
+        """
+        fetch the name of a city
+
+        :param city_id: int, the id of the city
+        :return: str, the name of the city
+        """
+
+        return str(self.__names[self.__name_offsets[city_id]:self.__name_offsets[city_id + 1]], "utf-8")
+
+    def city_id(self, city):
+        """
+        Find the id of a city with a binary search over the ids sorted by name.
+
+        :param city: str, the name of the city
+        :return: int | None, the id of the city or None if it is unknown
+        """
+
+        low = 0
+        high = self.__city_count
+        while low < high:
+            middle = (low + high) // 2
+            middle_name = self.city_name(self.__sorted_ids[middle])
+            if middle_name < city:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.__city_count and self.city_name(self.__sorted_ids[low]) == city:
+            return self.__sorted_ids[low]
+        return None
+
+    def is_departure(self, city):
+        """
+        Check if a city is known as a departure city, see RoadNetwork.is_departure.
+
+        :param city: str, the name of the city
+        :return: True, if the city is a departure city | False, if it isn't
+        """
+
+        city_id = self.city_id(city)
+        return city_id is not None and self.__flags[city_id] & DEPARTURE_FLAG != 0
+
+    def is_known(self, city):
+        """
+        Check if a city is known, see RoadNetwork.is_known.
+
+        :param city: str, the name of the city
+        :return: True, if the city is known | False, if it isn't
+        """
+
+        city_id = self.city_id(city)
+        return city_id is not None and self.__flags[city_id] & KNOWN_FLAG != 0
+
+    def adjacency(self):
+        """
+        Give the CSR arrays of the road segments grouped by departure city,
+        see RoadNetwork.adjacency.
+
+        :return: tuple(memoryview, memoryview, memoryview, memoryview), the
+                 starts, ends, targets and weights
+        """
+
+        return self.__starts, self.__ends, self.__targets, self.__weights
+
+    def roads_from(self, city):
+        """
+        Iterate the road segments leaving a city, see RoadNetwork.roads_from.
+
+        :param city: str, the name of the departure city
+        :return: generator of (str, int), the destination names and distances
+        """
+
+        city_id = self.city_id(city)
+        if city_id is None:
+            return
+        for slot in range(self.__starts[city_id], self.__ends[city_id]):
+            yield self.city_name(self.__targets[slot]), self.__weights[slot]
+
+
+class SharedRoadNetwork:
+    """
+    This class owns a shared memory block holding a packed road network.
+    Its name is all a worker process needs to attach to it, see attach_network.
+    """
+
+    def __init__(self, network):
+        size = packed_size(network)
+        self.__memory = shared_memory.SharedMemory(create=True, size=size)
+        pack_network(network, self.__memory.buf)
+
+    def get_name(self):
+        """
+        fetch the name of the shared memory block
+
+        :return: str, the name to be given to attach_network
+        """
+
+        return self.__memory.name
+
+    def close(self):
+        """
+        Close and remove the shared memory block. The workers attached to
+        it must have released it first.
+        """
+
+        self.__memory.close()
+        self.__memory.unlink()
+
+
+def attach_network(name):
+    """
+    Attach to a road network shared by SharedRoadNetwork.
+
+    :param name: str, the name of the shared memory block
+    :return: tuple(PackedRoadNetwork, SharedMemory), the road network and
+             the shared memory block, which must be kept open while the
+             road network is used
+    """
+
+    if sys.version_info >= (3, 13):
+        memory = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        memory = shared_memory.SharedMemory(name=name)
+        # before Python 3.13 an attaching process also registers the block
+        # to be removed when it exits, but the block belongs to its creator.
+        # A worker started by multiprocessing shares the resource tracker of
+        # its creator, where the block is registered once, so it must not
+        # take the registration of its creator away
+        if multiprocessing.parent_process() is None:
+            resource_tracker.unregister(memory._name, "shared_memory")
+    return PackedRoadNetwork(memory.buf), memory
+
+
+def packed_size(network):
+    """
+    Count the size of the buffer needed by pack_network.
+
+    :param network: RoadNetwork, the road network to be packed
+    :return: int, the size in bytes
+    """
+
+    layout = _layout(network.city_count(), _edge_count(network), len(_name_table(network)[0]))
+    return layout["names"].stop
+
+
+def pack_network(network, buffer):
+    """
+    Write a road network into a buffer of at least packed_size(network)
+    bytes. The road segments of every city are written contiguously, without
+    the unused slots of the RoadNetwork arrays.
+
+    :param network: RoadNetwork, the road network to be packed
+    :param buffer: writable buffer, e.g. SharedMemory.buf or a bytearray
+    """
+
+    city_count = network.city_count()
+    names, name_offsets = _name_table(network)
+    starts, ends, targets, weights = network.adjacency()
+    in_starts, in_ends = network.reverse_adjacency()[:2]
+
+    offsets = array("i", [0])
+    packed_targets = array("i")
+    packed_weights = array("i")
+    flags = bytearray(city_count)
+    for city_id in range(city_count):
+        packed_targets.extend(targets[starts[city_id]:ends[city_id]])
+        packed_weights.extend(weights[starts[city_id]:ends[city_id]])
+        offsets.append(len(packed_targets))
+        name = network.city_name(city_id)
+        if network.is_departure(name):
+            flags[city_id] |= DEPARTURE_FLAG | KNOWN_FLAG
+        if in_ends[city_id] > in_starts[city_id]:
+            flags[city_id] |= KNOWN_FLAG
+
+    sorted_ids = array("i", sorted(range(city_count), key=network.city_name))
+    layout = _layout(city_count, len(packed_targets), len(names))
+
+    view = memoryview(buffer).cast("B")
+    view[:len(PACKED_MAGIC)] = PACKED_MAGIC
+    header = array("q", [city_count, len(packed_targets), len(names), 0])
+    view[len(PACKED_MAGIC):len(PACKED_MAGIC) + 8 * HEADER_ITEMS] = header.tobytes()
+    view[layout["name_offsets"]] = name_offsets.tobytes()
+    view[layout["sorted_ids"]] = sorted_ids.tobytes()
+    view[layout["offsets"]] = offsets.tobytes()
+    view[layout["targets"]] = packed_targets.tobytes()
+    view[layout["weights"]] = packed_weights.tobytes()
+    view[layout["flags"]] = flags
+    view[layout["names"]] = names
+    view.release()
+
+
+def _name_table(network):
+    """
+    Encode the city names into one string table.
+
+    :return: tuple(bytes, array), the UTF-8 names one after another and the
+             offset of every name (with one extra offset at the end)
+    """
+
+    encoded = [network.city_name(city_id).encode("utf-8") for city_id in range(network.city_count())]
+    offsets = array("q", [0])
+    for name in encoded:
+        offsets.append(offsets[-1] + len(name))
+    return b"".join(encoded), offsets
+
+
+def _edge_count(network):
+    """
+    Count the road segments of a RoadNetwork.
+
+    :return: int, the number of road segments
+    """
+
+    starts, ends = network.adjacency()[:2]
+    return sum(ends[city_id] - starts[city_id] for city_id in range(network.city_count()))
+
+
+def _layout(city_count, edge_count, name_size):
+    """
+    Place the sections of a packed road network in the buffer, every
+    section starting at a multiple of 8 bytes.
+
+    :return: dict[str, slice], the byte range of every section
+    """
+
+    sizes = [
+        ("name_offsets", 8 * (city_count + 1)),
+        ("sorted_ids", 4 * city_count),
+        ("offsets", 4 * (city_count + 1)),
+        ("targets", 4 * edge_count),
+        ("weights", 4 * edge_count),
+        ("flags", city_count),
+        ("names", name_size),
+    ]
+    layout = {}
+    position = len(PACKED_MAGIC) + 8 * HEADER_ITEMS
+    for section, size in sizes:
+        layout[section] = slice(position, position + size)
+        position = (position + size + 7) // 8 * 8
+    return layout
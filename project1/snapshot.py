@@ -0,0 +1,312 @@
+"""
+
+Name:       Minh Vu
+Email:      2004minhvu@gmail.com
+
+Project: Road Trip Optimizer
+
+A binary snapshot of the RoadNetwork of traveller_template1.py, for
+starting the program without parsing the distance file again.
+
+The snapshot file holds a versioned header, the string table of the city
+names, the ids sorted by name (for finding a city by name with a binary
+search), the departure flags, the outgoing and the inbound road segments
+in CSR form (offsets, cities, distances) and, optionally, the tables of the
+landmark index and the reachability index. Every section starts at a
+multiple of 8 bytes, so the file is opened with mmap and every section is
+used in place through a memoryview: opening a snapshot costs O(1) time,
+and the pages of the file are read from the disk when they are used.
+
+The snapshot remembers the signature (size and modification time) of the
+distance file it was made from, and is not opened for any other version of
+the distance file.
+"""
+
+import mmap
+import os
+from array import array
+
+
+SNAPSHOT_MAGIC = b"RTSNAPSH"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snapshot"
+BYTE_ORDER_MARK = 0x0102030405060708  # reads differently on a machine of the other byte order
+HEADER_ITEMS = 9    # version, byte order mark, signature, cities, road segments,
+                    # string table size, landmarks, components (-1 if none), reach size
+
+
+class MappedNames:
+    """
+    This class gives the city names of a snapshot by id and the ids by name,
+    like the list and the dict of names of a RoadNetwork, without decoding
+    the names in advance. A name is found with a binary search over the ids
+    sorted by name.
+    """
+
+    def __init__(self, name_offsets, sorted_ids, names):
+        self.__name_offsets = name_offsets
+        self.__sorted_ids = sorted_ids
+        self.__names = names
+
+    def __len__(self):
+        return len(self.__sorted_ids)
+
+    def __getitem__(self, city_id):
+        return str(self.__names[self.__name_offsets[city_id]:self.__name_offsets[city_id + 1]], "utf-8")
+
+    def __iter__(self):
+        for city_id in range(len(self.__sorted_ids)):
+            yield self[city_id]
+
+    def get(self, city, default=None):
+        """
+        Find the id of a city by its name.
+
+        :param city: str, the name of the city
+        :param default: the value given for an unknown city
+        :return: int, the id of the city or <default> if it is unknown
+        """
+
+        low = 0
+        high = len(self.__sorted_ids)
+        while low < high:
+            middle = (low + high) // 2
+            if self[self.__sorted_ids[middle]] < city:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.__sorted_ids) and self[self.__sorted_ids[low]] == city:
+            return self.__sorted_ids[low]
+        return default
+
+
+class MappedReach:
+    """
+    This class gives the reachable component bits of the reachability index
+    from a snapshot, decoding the bits of a component when they are asked.
+    """
+
+    def __init__(self, offsets, bits):
+        self.__offsets = offsets
+        self.__bits = bits
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def __getitem__(self, component):
+        return int.from_bytes(self.__bits[self.__offsets[component]:self.__offsets[component + 1]], "little")
+
+
+class Snapshot:
+    """
+    This class holds the sections of an opened snapshot file. The memory
+    map stays open as long as the sections are used.
+    """
+
+    def __init__(self, snapshot_map, names, departures, outgoing, incoming, landmarks, reachability):
+        self.__map = snapshot_map
+        self.names = names                # MappedNames
+        self.departures = departures      # memoryview, 1 for a departure city
+        self.outgoing = outgoing          # (starts, ends, targets, weights)
+        self.incoming = incoming          # (starts, ends, sources, weights)
+        self.landmarks = landmarks        # (landmark ids, from tables, to tables) | None
+        self.reachability = reachability  # (components, MappedReach) | None
+
+
+def snapshot_file_name(source_file):
+    """
+    Name the snapshot file of a distance file.
+
+    :param source_file: str, the name of the distance file
+    :return: str, the name of the snapshot file
+    """
+
+    return source_file + SNAPSHOT_SUFFIX
+
+
+def write_snapshot(network, file_name, signature):
+    """
+    Write a road network into a snapshot file, with the landmark tables and
+    the reachability tables if the network has them up to date.
+
+    :param network: RoadNetwork, the road network to be saved
+    :param file_name: str, the name of the snapshot file
+    :param signature: int, the signature of the distance file
+    """
+
+    city_count = network.city_count()
+    encoded = [network.city_name(city_id).encode("utf-8") for city_id in range(city_count)]
+    name_offsets = array("q", [0])
+    for name in encoded:
+        name_offsets.append(name_offsets[-1] + len(name))
+    names = b"".join(encoded)
+    del encoded
+
+    sorted_ids = array("i", sorted(range(city_count), key=network.city_name))
+    departures = bytearray(city_count)
+    for departure in network.departure_cities():
+        departures[network.city_id(departure)] = 1
+    outgoing = _packed_csr(network.adjacency())
+    incoming = _packed_csr(network.reverse_adjacency())
+
+    landmarks = network.landmark_index().get_tables()
+    if landmarks is None:
+        landmarks = ([], [], [])
+    reachability = network.reachability_index().get_tables()
+    reach_offsets = array("q", [0])
+    reach_bits = bytearray()
+    if reachability is not None:
+        components, reach = reachability
+        for bits in reach:
+            reach_bits += bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+            reach_offsets.append(len(reach_bits))
+
+    header = array("q", [SNAPSHOT_VERSION, BYTE_ORDER_MARK, signature, city_count, len(outgoing[1]), len(names),
+                         len(landmarks[0]), -1 if reachability is None else len(reach_offsets) - 1,
+                         len(reach_bits)])
+    sections = {
+        "name_offsets": name_offsets,
+        "sorted_ids": sorted_ids,
+        "departures": departures,
+        "out_offsets": outgoing[0],
+        "out_targets": outgoing[1],
+        "out_weights": outgoing[2],
+        "in_offsets": incoming[0],
+        "in_sources": incoming[1],
+        "in_weights": incoming[2],
+        "landmarks": array("q", landmarks[0]),
+        "landmark_tables": [table for tables in zip(landmarks[1], landmarks[2]) for table in tables],
+        "components": reachability[0] if reachability is not None else array("i"),
+        "reach_offsets": reach_offsets if reachability is not None else array("q"),
+        "reach_bits": reach_bits,
+        "names": names,
+    }
+
+    layout = _layout(header)
+    # the snapshot is written under a temporary name and moved over the old one, which may still be memory mapped
+    temporary_file = file_name + ".tmp"
+    with open(temporary_file, mode="wb") as snapshot_file:
+        snapshot_file.write(SNAPSHOT_MAGIC)
+        snapshot_file.write(header.tobytes())
+        for section, byte_range in layout.items():
+            # the padding before the section
+            snapshot_file.write(bytes(byte_range.start - snapshot_file.tell()))
+            data = sections[section]
+            for part in (data if isinstance(data, list) else [data]):
+                snapshot_file.write(bytes(part) if isinstance(part, memoryview) else part)
+    os.replace(temporary_file, file_name)
+
+
+def read_snapshot(file_name, signature):
+    """
+    Open a snapshot file with mmap.
+
+    :param file_name: str, the name of the snapshot file
+    :param signature: int, the signature of the current distance file
+    :return: Snapshot | None, the sections of the snapshot, or None if the
+             file is not a snapshot of this version of the distance file
+    :raise OSError: if the file can't be opened
+    """
+
+    with open(file_name, mode="rb") as snapshot_file:
+        snapshot_map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(snapshot_map)
+    header_end = len(SNAPSHOT_MAGIC) + 8 * HEADER_ITEMS
+    if len(view) < header_end or bytes(view[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+        view.release()
+        snapshot_map.close()
+        return None
+    header = array("q")
+    header.frombytes(view[len(SNAPSHOT_MAGIC):header_end])
+    version, byte_order_mark, stored_signature, city_count = header[:4]
+    layout = _layout(header)
+    if version != SNAPSHOT_VERSION or byte_order_mark != BYTE_ORDER_MARK or stored_signature != signature \
+            or len(view) < layout["names"].stop:
+        view.release()
+        snapshot_map.close()
+        return None
+
+    def section(name, type_code="B"):
+        return view[layout[name]].cast(type_code)
+
+    names = MappedNames(section("name_offsets", "q"), section("sorted_ids", "i"), section("names"))
+    out_offsets = section("out_offsets", "i")
+    in_offsets = section("in_offsets", "i")
+    outgoing = (out_offsets[:-1], out_offsets[1:], section("out_targets", "i"), section("out_weights", "i"))
+    incoming = (in_offsets[:-1], in_offsets[1:], section("in_sources", "i"), section("in_weights", "i"))
+
+    landmarks = None
+    landmark_ids = section("landmarks", "q")
+    if len(landmark_ids) > 0:
+        tables = section("landmark_tables", "q")
+        from_tables = []
+        to_tables = []
+        for landmark in range(len(landmark_ids)):
+            start = 2 * landmark * city_count
+            from_tables.append(tables[start:start + city_count])
+            to_tables.append(tables[start + city_count:start + 2 * city_count])
+        landmarks = (list(landmark_ids), from_tables, to_tables)
+
+    reachability = None
+    if header[7] >= 0:
+        reachability = (section("components", "i"), MappedReach(section("reach_offsets", "q"), section("reach_bits")))
+
+    return Snapshot(snapshot_map, names, section("departures"), outgoing, incoming, landmarks, reachability)
+
+
+def _packed_csr(adjacency):
+    """
+    Pack the CSR arrays of a RoadNetwork without their unused slots.
+
+    :param adjacency: tuple(array, array, array, array), the starts, ends,
+                      cities and distances
+    :return: tuple(array, array, array), the offsets (one extra at the end),
+             the cities and the distances
+    """
+
+    starts, ends, others, weights = adjacency
+    offsets = array("i", [0])
+    packed_others = array("i")
+    packed_weights = array("i")
+    for city_id in range(len(starts)):
+        packed_others.extend(others[starts[city_id]:ends[city_id]])
+        packed_weights.extend(weights[starts[city_id]:ends[city_id]])
+        offsets.append(len(packed_others))
+    return offsets, packed_others, packed_weights
+
+
+def _layout(header):
+    """
+    Place the sections of a snapshot in the file, every section starting at
+    a multiple of 8 bytes.
+
+    :param header: array[int], the header of the snapshot
+    :return: dict[str, slice], the byte range of every section in file order
+    """
+
+    city_count, edge_count, name_size, landmark_count, component_count, reach_size = header[3:9]
+    component_count = max(component_count, 0)
+    sizes = [
+        ("name_offsets", 8 * (city_count + 1)),
+        ("sorted_ids", 4 * city_count),
+        ("departures", city_count),
+        ("out_offsets", 4 * (city_count + 1)),
+        ("out_targets", 4 * edge_count),
+        ("out_weights", 4 * edge_count),
+        ("in_offsets", 4 * (city_count + 1)),
+        ("in_sources", 4 * edge_count),
+        ("in_weights", 4 * edge_count),
+        ("landmarks", 8 * landmark_count),
+        ("landmark_tables", 8 * 2 * landmark_count * city_count),
+        ("components", 4 * city_count if header[7] >= 0 else 0),
+        ("reach_offsets", 8 * (component_count + 1) if header[7] >= 0 else 0),
+        ("reach_bits", reach_size),
+        ("names", name_size),
+    ]
+    layout = {}
+    position = len(SNAPSHOT_MAGIC) + 8 * HEADER_ITEMS
+    for section, size in sizes:
+        layout[section] = slice(position, position + size)
+        position = (position + size + 7) // 8 * 8
+    return layout
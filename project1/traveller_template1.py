@@ -7,113 +7,2559 @@ Project: Road Trip Optimizer
 
 This program examines and manipulates the distance between a departure city and a destination city.It can add a
 connection between a departure and a destination city, and it can remove a connection between a departure and
-a destination city. Moreover, it can find all the neighbouring cities of a city, and it can print a route to go
-from a city to another city.
+a destination city. Moreover, it can find all the neighbouring cities of a city, all the cities with a connection to a city, and
+it can print a route to go from a city to another city.
 """
 
+import heapq
+import io
+import mmap
+import os
+import sys
+import time
+from bisect import bisect_left
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from all_pairs import MATRIX_CITY_LIMIT, AllPairsMatrix, matrix_bytes
+from contraction_hierarchy import ContractionHierarchy
+from journal import MutationJournal, journal_file_name
+from snapshot import read_snapshot, snapshot_file_name, write_snapshot
+
+
+LANDMARK_COUNT = 8
+LANDMARK_MAGIC = b"RTLANDM1"
+LANDMARK_SUFFIX = ".landmarks"
+ROUTE_CACHE_SIZE = 1024
+HOT_TREE_COUNT = 8
+HOT_DEPARTURE_QUERIES = 3
+READ_CHUNK_SIZE = 1 << 22
+DISPLAY_CHUNK_ROWS = 4096
+OUTPUT_BUFFER_SIZE = 1 << 20
+PARALLEL_READ_SIZE = 64 << 20
+MAX_DISTANCE = (1 << 31) - 1   # the largest distance of a road segment, the weight arrays hold 32 bit ints
+REACH_BIT_LIMIT = 1 << 26
+
+
+class Adjacency:
+    """
+    This class stores the road segments of one direction in CSR form. The
+    road segments of the city <u> live in the slots starts[u] ... ends[u] - 1
+    of the arrays others (the city at the other end) and weights (the
+    distance in km).
+
+    When a city's road segments change, its slots are either updated in
+    place or moved to the end of the arrays. The slots left behind are
+    reclaimed by compacting the arrays once they make up half of them.
+
+    The arrays can also be read-only memoryviews into a snapshot file (see
+    load_mapped), they are copied into arrays before the first change.
+    """
+
+    def __init__(self):
+        self.starts = array("i")
+        self.ends = array("i")
+        self.others = array("i")
+        self.weights = array("i")
+        self.__unused_slots = 0
+
+    def add_city(self):
+        """
+        Give an empty range of slots to a new city id.
+        """
+
+        self.__make_writable()
+        self.starts.append(len(self.others))
+        self.ends.append(len(self.others))
+
+    def load(self, city_count, sources, others, weights):
+        """
+        Replace all the road segments by the ones given as three parallel
+        arrays. The arrays are grouped by source with a counting sort. If a
+        road segment appears more than once, the last one wins, like a later
+        line of the distance file overrides an earlier one.
+
+        The given arrays are emptied as soon as they have been grouped, and
+        the duplicates are dropped in place, so at most the given arrays and
+        the grouped arrays are in memory at the same time.
+
+        :param city_count: int, the number of city ids
+        :param sources: array[int], the city ids the road segments are grouped by
+        :param others: array[int], the city ids at the other end
+        :param weights: array[int], the distances in km
+        """
+
+        offsets = array("i", bytes(4 * (city_count + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for city_id in range(city_count):
+            offsets[city_id + 1] += offsets[city_id]
+
+        edge_count = len(sources)
+        grouped_others = array("i", bytes(4 * edge_count))
+        grouped_weights = array("i", bytes(4 * edge_count))
+        position = offsets[:-1]
+        for i in range(edge_count):
+            source = sources[i]
+            slot = position[source]
+            grouped_others[slot] = others[i]
+            grouped_weights[slot] = weights[i]
+            position[source] = slot + 1
+        del position
+        del sources[:], others[:], weights[:]
+
+        # drop the duplicated road segments, a dict keeps the first position
+        # of a city and the last distance given to it. The kept road segments
+        # are moved towards the beginning of the grouped arrays.
+        self.starts = array("i", bytes(4 * city_count))
+        self.ends = array("i", bytes(4 * city_count))
+        kept = 0
+        for city_id in range(city_count):
+            start = offsets[city_id]
+            end = offsets[city_id + 1]
+            self.starts[city_id] = kept
+            if end - start > 1:
+                roads = {}
+                for slot in range(start, end):
+                    roads[grouped_others[slot]] = grouped_weights[slot]
+                for other, weight in roads.items():
+                    grouped_others[kept] = other
+                    grouped_weights[kept] = weight
+                    kept += 1
+            elif end > start:
+                grouped_others[kept] = grouped_others[start]
+                grouped_weights[kept] = grouped_weights[start]
+                kept += 1
+            self.ends[city_id] = kept
+        del grouped_others[kept:], grouped_weights[kept:]
+        self.others = grouped_others
+        self.weights = grouped_weights
+        self.__unused_slots = 0
+
+    def load_mapped(self, starts, ends, others, weights):
+        """
+        Use the CSR arrays of a snapshot in place, without copying them.
+
+        :param starts: memoryview, the first slot of every city
+        :param ends: memoryview, the slot after the last slot of every city
+        :param others: memoryview, the city ids at the other end
+        :param weights: memoryview, the distances in km
+        """
+
+        self.starts = starts
+        self.ends = ends
+        self.others = others
+        self.weights = weights
+        self.__unused_slots = 0
+
+    def load_reversed(self, forward):
+        """
+        Replace all the road segments by the ones of another Adjacency with
+        their direction turned around, e.g. build the inbound road segments
+        from the outgoing ones. The road segments are placed straight from
+        the arrays of <forward>, without copying them into edge lists first.
+
+        :param forward: Adjacency, the road segments to be turned around
+        """
+
+        city_count = len(forward.starts)
+        offsets = array("i", bytes(4 * (city_count + 1)))
+        for city_id in range(city_count):
+            for slot in range(forward.starts[city_id], forward.ends[city_id]):
+                offsets[forward.others[slot] + 1] += 1
+        for city_id in range(city_count):
+            offsets[city_id + 1] += offsets[city_id]
+
+        edge_count = offsets[city_count]
+        self.others = array("i", bytes(4 * edge_count))
+        self.weights = array("i", bytes(4 * edge_count))
+        self.starts = offsets[:-1]
+        position = offsets[:-1]
+        for city_id in range(city_count):
+            for slot in range(forward.starts[city_id], forward.ends[city_id]):
+                other = forward.others[slot]
+                reversed_slot = position[other]
+                self.others[reversed_slot] = city_id
+                self.weights[reversed_slot] = forward.weights[slot]
+                position[other] = reversed_slot + 1
+        self.ends = position
+        self.__unused_slots = 0
+
+    def degree(self, city_id):
+        """
+        fetch the number of road segments of a city
+
+        :param city_id: int, the id of the city
+        :return: int, the number of road segments
+        """
+
+        return self.ends[city_id] - self.starts[city_id]
+
+    def find_slot(self, city_id, other_id):
+        """
+        Search the slot of the road segment between two city ids.
+
+        :param city_id: int, the city the road segment is stored under
+        :param other_id: int, the city at the other end
+        :return: int | None, the slot or None if there is no such road segment
+        """
+
+        others = self.others
+        for slot in range(self.starts[city_id], self.ends[city_id]):
+            if others[slot] == other_id:
+                return slot
+        return None
+
+    def set_weight(self, city_id, other_id, weight):
+        """
+        Add a road segment or update its distance.
+
+        :param city_id: int, the city the road segment is stored under
+        :param other_id: int, the city at the other end
+        :param weight: int, the distance in km
+        :return: int | None, the previous distance or None if the road
+                 segment is new
+        """
+
+        self.__make_writable()
+        slot = self.find_slot(city_id, other_id)
+        if slot is not None:
+            previous = self.weights[slot]
+            self.weights[slot] = weight
+            return previous
+
+        # the slots of the city are not at the end of the arrays, move them there
+        if self.ends[city_id] != len(self.others):
+            start = self.starts[city_id]
+            end = self.ends[city_id]
+            self.starts[city_id] = len(self.others)
+            self.others.extend(self.others[start:end])
+            self.weights.extend(self.weights[start:end])
+            self.__unused_slots += end - start
+        self.others.append(other_id)
+        self.weights.append(weight)
+        self.ends[city_id] = len(self.others)
+        self.__compact_if_needed()
+        return None
+
+    def remove(self, city_id, other_id):
+        """
+        Remove the road segment between two city ids.
+
+        :param city_id: int, the city the road segment is stored under
+        :param other_id: int, the city at the other end
+        :return: int | None, the distance of the removed road segment or
+                 None if there was no such road segment
+        """
+
+        self.__make_writable()
+        slot = self.find_slot(city_id, other_id)
+        if slot is None:
+            return None
+
+        # the last slot of the city is moved into the removed slot
+        last = self.ends[city_id] - 1
+        removed = self.weights[slot]
+        self.others[slot] = self.others[last]
+        self.weights[slot] = self.weights[last]
+        self.ends[city_id] = last
+        self.__unused_slots += 1
+        self.__compact_if_needed()
+        return removed
+
+    def __make_writable(self):
+        """
+        Copy the arrays of a snapshot into arrays that can be changed.
+        """
+
+        if isinstance(self.others, memoryview):
+            self.starts = array("i", self.starts)
+            self.ends = array("i", self.ends)
+            self.others = array("i", self.others)
+            self.weights = array("i", self.weights)
+
+    def __compact_if_needed(self):
+        """
+        Rewrite the arrays without the unused slots once they take at least
+        half of the arrays.
+        """
+
+        if self.__unused_slots == 0 or self.__unused_slots * 2 < len(self.others):
+            return
+
+        others = array("i")
+        weights = array("i")
+        for city_id in range(len(self.starts)):
+            start = self.starts[city_id]
+            end = self.ends[city_id]
+            self.starts[city_id] = len(others)
+            others.extend(self.others[start:end])
+            weights.extend(self.weights[start:end])
+            self.ends[city_id] = len(others)
+        self.others = others
+        self.weights = weights
+        self.__unused_slots = 0
+
+
+class RoadNetwork:
+    """
+    This class represents the road network read from the distance file.
+
+    Every city name is interned to an integer id (0, 1, 2, ...) and the
+    road segments are stored twice in CSR form (see Adjacency): grouped by
+    the departure city for the searches, and grouped by the destination
+    city as an index of the inbound road segments. A road segment costs
+    24 bytes in total instead of a dict entry and a str object, and no
+    string is parsed during a search.
+
+    A road network opened from a snapshot (see load_snapshot) reads the
+    names and the road segments in place from the snapshot file, and copies
+    them into its own lists and arrays before the first change.
+    """
+
+    def __init__(self):
+        self.__names = []               # city id -> city name
+        self.__ids = {}                 # city name -> city id
+        self.__departures = bytearray()  # 1 if the city is known as a departure city
+        self.__outgoing = Adjacency()
+        self.__incoming = Adjacency()
+        self.__listeners = []
+        self.__reachability = None
+        self.__landmarks = None
+        self.__hierarchy = None
+        self.__route_cache = None
+        self.__route_trees = None
+        self.__all_pairs = None
+        self.__display_index = None
+        self.__snapshot = None          # the opened snapshot, see load_snapshot
+
+    def add_listener(self, listener):
+        """
+        Register an object that is told about every change of a road segment.
+        The listener must have a method
+        road_changed(departure_id, destination_id, old_distance, new_distance)
+        which is called after the change. old_distance is None for a new road
+        segment and new_distance is None for a removed one.
+
+        :param listener: the object to be told about the changes
+        """
+
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Stop telling an object about the changes of the road segments.
+
+        :param listener: the object registered with add_listener
+        """
+
+        self.__listeners.remove(listener)
+
+    def reachability_index(self):
+        """
+        fetch the reachability index of the road network, building it the
+        first time it is needed
+
+        :return: ReachabilityIndex, the index that is kept up to date with the
+                 changes of the road network
+        """
+
+        if self.__reachability is None:
+            self.__reachability = ReachabilityIndex(self)
+        return self.__reachability
+
+    def landmark_index(self):
+        """
+        fetch the landmark tables of the road network, see LandmarkIndex.
+        The tables are not built until they are refreshed or loaded.
+
+        :return: LandmarkIndex, the landmark tables
+        """
+
+        if self.__landmarks is None:
+            self.__landmarks = LandmarkIndex(self)
+        return self.__landmarks
+
+    def contraction_hierarchy(self):
+        """
+        fetch the contraction hierarchy of the road network, see
+        ContractionHierarchy. The hierarchy is not built until it is refreshed.
+
+        :return: ContractionHierarchy, the contraction hierarchy
+        """
+
+        if self.__hierarchy is None:
+            self.__hierarchy = ContractionHierarchy(self)
+        return self.__hierarchy
+
+    def route_cache(self):
+        """
+        fetch the cache of the routes found in the road network, see RouteCache
+
+        :return: RouteCache, the route cache
+        """
+
+        if self.__route_cache is None:
+            self.__route_cache = RouteCache(self)
+        return self.__route_cache
+
+    def display_index(self):
+        """
+        fetch the sorted index of the road segments used by the display
+        action, see DisplayIndex
+
+        :return: DisplayIndex, the sorted index
+        """
+
+        if self.__display_index is None:
+            self.__display_index = DisplayIndex(self)
+        return self.__display_index
+
+    def route_trees(self):
+        """
+        fetch the shortest path trees of the most asked departure cities,
+        see HotRouteTrees
+
+        :return: HotRouteTrees, the shortest path trees
+        """
+
+        if self.__route_trees is None:
+            self.__route_trees = HotRouteTrees(self)
+        return self.__route_trees
+
+    def all_pairs_matrix(self):
+        """
+        fetch the all-pairs distance matrix of the road network, see
+        all_pairs.py. The matrix can't be used until it is built or opened.
+
+        :return: AllPairsMatrix, the distance matrix
+        """
+
+        if self.__all_pairs is None:
+            self.__all_pairs = AllPairsMatrix(self)
+        return self.__all_pairs
+
+    def can_reach(self, departure, destination):
+        """
+        Check if there is any route from a city to another city, without
+        searching for it. See ReachabilityIndex.
+
+        :param departure: str, the name of the departure city
+        :param destination: str, the name of the destination city
+        :return: True, if a route exists | False, if there is no route or
+                 either city is unknown
+        """
+
+        departure_id = self.__ids.get(departure)
+        destination_id = self.__ids.get(destination)
+        if departure_id is None or destination_id is None:
+            return False
+        return self.reachability_index().can_reach(departure_id, destination_id)
+
+    def save_snapshot(self, file_name, source_file):
+        """
+        Write the road network into a snapshot file, see snapshot.py. The
+        landmark and reachability tables are saved too if they are up to date.
+
+        :param file_name: str, the name of the snapshot file
+        :param source_file: str, the name of the distance file the road
+                            network was read from
+        :return: True, if the file was written | False, if it failed
+        """
+
+        try:
+            write_snapshot(self, file_name, _file_signature(source_file))
+        except OSError:
+            return False
+        return True
+
+    def load_snapshot(self, file_name, source_file):
+        """
+        Open a snapshot file made from the current version of the distance
+        file. Costs O(1): the names and the road segments are read from the
+        file when they are used. The road network must be empty.
+
+        :param file_name: str, the name of the snapshot file
+        :param source_file: str, the name of the distance file
+        :return: True, if the snapshot was opened | False, if there is no
+                 snapshot of this version of the distance file
+        """
+
+        try:
+            snapshot = read_snapshot(file_name, _file_signature(source_file))
+        except (OSError, ValueError):
+            return False
+        if snapshot is None:
+            return False
+
+        self.__snapshot = snapshot
+        # the mapped names work both as the id -> name list and the name -> id dict
+        self.__names = snapshot.names
+        self.__ids = snapshot.names
+        self.__departures = snapshot.departures
+        self.__outgoing.load_mapped(*snapshot.outgoing)
+        self.__incoming.load_mapped(*snapshot.incoming)
+        if snapshot.landmarks is not None:
+            self.landmark_index().set_tables(*snapshot.landmarks)
+        if snapshot.reachability is not None:
+            self.reachability_index().set_tables(*snapshot.reachability)
+        return True
+
+    def intern(self, city):
+        """
+        Fetch the id of a city, giving a new id to an unknown city.
+
+        :param city: str, the name of the city
+        :return: int, the id of the city
+        """
+
+        city_id = self.__ids.get(city)
+        if city_id is None:
+            self.__make_writable()
+            city_id = len(self.__names)
+            self.__ids[city] = city_id
+            self.__names.append(city)
+            self.__departures.append(0)
+            self.__outgoing.add_city()
+            self.__incoming.add_city()
+        return city_id
+
+    def load_edges(self, sources, targets, weights):
+        """
+        Replace all the road segments by the ones given as three parallel
+        arrays of source ids, target ids and distances. If a road segment
+        appears more than once, the last one wins. Every source becomes a
+        departure city. The given arrays are emptied, see Adjacency.load.
+
+        :param sources: array[int], the departure city ids
+        :param targets: array[int], the destination city ids
+        :param weights: array[int], the distances in km
+        """
+
+        self.__make_writable()
+        city_count = len(self.__names)
+        self.__outgoing.load(city_count, sources, targets, weights)
+        # the inbound index is built from the deduplicated road segments
+        self.__incoming.load_reversed(self.__outgoing)
+        for city_id in range(city_count):
+            if self.__outgoing.degree(city_id) > 0:
+                self.__departures[city_id] = 1
+
+    def mark_departures(self, city_ids):
+        """
+        Make cities departure cities even if they have no road segments,
+        like a departure whose road segments have all been removed.
+
+        :param city_ids: iterable[int], the city ids
+        """
+
+        self.__make_writable()
+        for city_id in city_ids:
+            self.__departures[city_id] = 1
+
+    def city_count(self):
+        """
+        fetch the number of known cities
+
+        :return: int, the number of city ids given so far
+        """
+
+        return len(self.__names)
+
+    def city_id(self, city):
+        """
+        fetch the id of a city
+
+        :param city: str, the name of the city
+        :return: int | None, the id of the city or None if it is unknown
+        """
+
+        return self.__ids.get(city)
+
+    def city_name(self, city_id):
+        """
+        fetch the name of a city
+
+        :param city_id: int, the id of the city
+        :return: str, the name of the city
+        """
+
+        return self.__names[city_id]
+
+    def is_departure(self, city):
+        """
+        Check if a city is known as a departure city, i.e. it has been given
+        as a departure in the distance file or in the add action. A departure
+        city stays one even if all of its road segments are removed.
+
+        :param city: str, the name of the city
+        :return: True, if the city is a departure city | False, if it isn't
+        """
+
+        city_id = self.__ids.get(city)
+        return city_id is not None and self.__departures[city_id] == 1
+
+    def is_known(self, city):
+        """
+        Check if a city is known, i.e. it is a departure city or there is
+        at least one road segment leading to it. Costs O(1).
+
+        :param city: str, the name of the city
+        :return: True, if the city is known | False, if it isn't
+        """
+
+        city_id = self.__ids.get(city)
+        if city_id is None:
+            return False
+        return self.__departures[city_id] == 1 or self.__incoming.degree(city_id) > 0
+
+    def departure_cities(self):
+        """
+        fetch the names of all the departure cities
+
+        :return: list[str], the departure city names in id order
+        """
+
+        return [self.__names[city_id] for city_id in range(len(self.__names)) if self.__departures[city_id]]
+
+    def adjacency(self):
+        """
+        Give the CSR arrays of the road segments grouped by departure city
+        for a search loop. The arrays are not copied, so they must not be
+        modified and are valid only until the next change of the road network.
+
+        :return: tuple(array, array, array, array), the starts, ends,
+                 targets and weights arrays
+        """
+
+        outgoing = self.__outgoing
+        return outgoing.starts, outgoing.ends, outgoing.others, outgoing.weights
+
+    def reverse_adjacency(self):
+        """
+        Give the CSR arrays of the road segments grouped by destination city,
+        with the same rules as adjacency().
+
+        :return: tuple(array, array, array, array), the starts, ends,
+                 sources and weights arrays
+        """
+
+        incoming = self.__incoming
+        return incoming.starts, incoming.ends, incoming.others, incoming.weights
+
+    def roads_from(self, city):
+        """
+        Iterate the road segments leaving a city without copying them.
+
+        :param city: str, the name of the departure city
+        :return: generator of (str, int), the destination names and distances
+        """
+
+        yield from self.__roads(self.__outgoing, city)
+
+    def roads_to(self, city):
+        """
+        Iterate the road segments leading to a city without copying them.
+        Costs O(in-degree).
+
+        :param city: str, the name of the destination city
+        :return: generator of (str, int), the departure names and distances
+        """
+
+        yield from self.__roads(self.__incoming, city)
+
+    def distance(self, departure, destination):
+        """
+        fetch the length of the road segment between two cities
+
+        :param departure: str, the name of the departure city
+        :param destination: str, the name of the destination city
+        :return: int | None, the distance in km or None if there is no
+                 road segment from <departure> to <destination>
+        """
+
+        departure_id = self.__ids.get(departure)
+        destination_id = self.__ids.get(destination)
+        if departure_id is None or destination_id is None:
+            return None
+        slot = self.__outgoing.find_slot(departure_id, destination_id)
+        if slot is None:
+            return None
+        return self.__outgoing.weights[slot]
+
+    def set_distance(self, departure, destination, distance):
+        """
+        Add a road segment or update its distance. The departure city becomes
+        a departure city and unknown cities get new ids.
+
+        :param departure: str, the name of the departure city
+        :param destination: str, the name of the destination city
+        :param distance: int, the distance in km
+        :raise ValueError: if the distance is not within 0 ... MAX_DISTANCE,
+                           the road network is not changed then
+        """
+
+        if not 0 <= distance <= MAX_DISTANCE:
+            raise ValueError(f"the distance {distance} is not within 0 ... {MAX_DISTANCE}")
+        self.__make_writable()
+        departure_id = self.intern(departure)
+        destination_id = self.intern(destination)
+        self.__departures[departure_id] = 1
+        previous = self.__outgoing.set_weight(departure_id, destination_id, distance)
+        self.__incoming.set_weight(destination_id, departure_id, distance)
+        for listener in self.__listeners:
+            listener.road_changed(departure_id, destination_id, previous, distance)
+
+    def remove_road(self, departure, destination):
+        """
+        Remove the road segment between two cities.
+
+        :param departure: str, the name of the departure city
+        :param destination: str, the name of the destination city
+        :return: True, if the road segment was removed | False, if there
+                 was no such road segment
+        """
+
+        departure_id = self.__ids.get(departure)
+        destination_id = self.__ids.get(destination)
+        if departure_id is None or destination_id is None:
+            return False
+        removed = self.__outgoing.remove(departure_id, destination_id)
+        if removed is None:
+            return False
+        self.__incoming.remove(destination_id, departure_id)
+        for listener in self.__listeners:
+            listener.road_changed(departure_id, destination_id, removed, None)
+        return True
+
+    def __make_writable(self):
+        """
+        Copy the names and the departure flags of a snapshot into a list, a
+        dict and a bytearray that can be changed. Costs O(cities) once, the
+        road segments are copied by Adjacency when they change.
+        """
+
+        if self.__snapshot is None:
+            return
+        self.__names = list(self.__names)
+        self.__ids = {name: city_id for city_id, name in enumerate(self.__names)}
+        self.__departures = bytearray(self.__departures)
+        self.__snapshot = None
+
+    def __roads(self, adjacency, city):
+        """
+        Iterate the road segments of a city in one direction.
+
+        :return: generator of (str, int), the city names at the other end
+                 and the distances
+        """
+
+        city_id = self.__ids.get(city)
+        if city_id is None:
+            return
+        for slot in range(adjacency.starts[city_id], adjacency.ends[city_id]):
+            yield self.__names[adjacency.others[slot]], adjacency.weights[slot]
+
+
+class ReachabilityIndex:
+    """
+    This class answers "is there any route from a city to another city" in
+    O(1), so that a route query without an answer doesn't have to expand
+    every city it can reach before giving up.
+
+    The cities are grouped into strongly connected components (Tarjan's
+    algorithm), every city of a component can reach every other city of it.
+    The components form a DAG, and for every component the set of
+    components it can reach is stored as the bits of an int.
+
+    The reachable bits of all the components take O(components²) bits in
+    the worst case (a long one-way chain of cities), so they are kept only
+    while they take at most REACH_BIT_LIMIT bits. Above that only the
+    components are kept, and a query between different components searches
+    the road network instead.
+
+    The index is built at the first query. It follows the changes of the
+    road network: a removed road segment or a changed distance can't make
+    an unreachable city reachable, so the index stays valid. A new road
+    segment makes the index stale only if its destination was not reachable
+    from its departure already, and the index is then rebuilt at the next
+    query.
+    """
+
+    def __init__(self, network, bit_limit=REACH_BIT_LIMIT):
+        self.__network = network
+        self.__bit_limit = bit_limit
+        self.__components = None  # city id -> component id
+        self.__reach = None       # component id -> bits of the reachable components, None above the limit
+        network.add_listener(self)
+
+    def can_reach(self, departure_id, destination_id):
+        """
+        Check if there is a route from a city to another city.
+
+        :param departure_id: int, the id of the departure city
+        :param destination_id: int, the id of the destination city
+        :return: True, if a route exists | False, if it doesn't
+        """
+
+        self.refresh()
+        if departure_id == destination_id:
+            return True
+        if self.__reach is None:
+            return self.__search(departure_id, destination_id)
+        reachable = self.__reach[self.__components[departure_id]]
+        return (reachable >> self.__components[destination_id]) & 1 == 1
+
+    def is_current(self):
+        """
+        Check if the index is built and knows every city, so that a query
+        doesn't rebuild it.
+
+        :return: True, if the index can answer right away | False, if it can't
+        """
+
+        return self.__components is not None and len(self.__components) >= self.__network.city_count()
+
+    def has_closure(self):
+        """
+        Check if the index answers the queries in O(1), i.e. the reachable
+        bits of the components were within the limit. Builds the index if needed.
+
+        :return: True, if can_reach doesn't search | False, if it does
+        """
+
+        self.refresh()
+        return self.__reach is not None
+
+    def refresh(self):
+        """
+        Build the index if it has not been built yet or if it is stale. A
+        city added after the index was built makes it stale too, even if
+        the index has not been told about the change yet (the listeners are
+        told one by one, and another listener may ask first).
+        """
+
+        if self.__components is None or len(self.__components) < self.__network.city_count():
+            self.__build()
+
+    def get_tables(self):
+        """
+        fetch the tables of the index for saving them, see set_tables
+
+        :return: tuple(array, list[int]) | None, the component of every city
+                 and the reachable component bits of every component, or
+                 None if the index is not built
+        """
+
+        if self.__components is None or self.__reach is None:
+            return None
+        return self.__components, self.__reach
+
+    def set_tables(self, components, reach):
+        """
+        Use tables saved from an index of the same road network.
+
+        :param components: sequence of int, the component of every city
+        :param reach: sequence of int, the reachable component bits of every component
+        """
+
+        self.__components = components
+        self.__reach = reach
+
+    def road_changed(self, departure_id, destination_id, old_distance, new_distance):
+        """
+        Follow a change of the road network, see RoadNetwork.add_listener.
+        """
+
+        if self.__components is None or old_distance is not None or new_distance is None:
+            return
+        if self.__reach is None:
+            # the searches see the new road segment, and two cities of the same component still reach each other
+            return
+        if departure_id >= len(self.__components) or destination_id >= len(self.__components) \
+                or not self.can_reach(departure_id, destination_id):
+            self.__components = None
+            self.__reach = None
+
+    def __build(self):
+        """
+        Find the strongly connected components with an iterative version of
+        Tarjan's algorithm. A component is completed only after every
+        component it can reach, so the reachable bits of a component can be
+        collected right when it is completed.
+        """
+
+        starts, ends, targets, weights = self.__network.adjacency()
+        city_count = self.__network.city_count()
+
+        order = array("i", [-1]) * city_count  # the visiting order of the cities
+        low = array("i", [0]) * city_count
+        components = array("i", [-1]) * city_count
+        on_stack = bytearray(city_count)
+        stack = []
+        reach = []
+        reach_bits = 0     # the bits taken by reach, it is dropped above the limit
+        component_count = 0
+        counter = 0
+
+        for root in range(city_count):
+            if order[root] != -1:
+                continue
+
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            # every entry is (city, the next slot to be visited)
+            work = [(root, starts[root])]
+
+            while work:
+                city, slot = work[-1]
+                if slot < ends[city]:
+                    work[-1] = (city, slot + 1)
+                    neighbour = targets[slot]
+                    if order[neighbour] == -1:
+                        order[neighbour] = low[neighbour] = counter
+                        counter += 1
+                        stack.append(neighbour)
+                        on_stack[neighbour] = 1
+                        work.append((neighbour, starts[neighbour]))
+                    elif on_stack[neighbour] and order[neighbour] < low[city]:
+                        low[city] = order[neighbour]
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if low[city] < low[parent]:
+                        low[parent] = low[city]
+
+                if low[city] == order[city]:
+                    # the city is the root of a component, pop its members
+                    component = component_count
+                    component_count += 1
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        components[member] = component
+                        members.append(member)
+                        if member == city:
+                            break
+
+                    if reach is None:
+                        continue
+                    reachable = 1 << component
+                    for member in members:
+                        for member_slot in range(starts[member], ends[member]):
+                            other = components[targets[member_slot]]
+                            if other != component:
+                                reachable |= reach[other]
+                    reach.append(reachable)
+                    reach_bits += reachable.bit_length()
+                    if reach_bits > self.__bit_limit:
+                        reach = None
+
+        self.__components = components
+        self.__reach = reach
+
+    def __search(self, departure_id, destination_id):
+        """
+        Search the road network for any route, for an index without the
+        reachable bits. A city of the component of the destination ends the
+        search, as every city of a component can reach the others.
+
+        :return: True, if a route exists | False, if it doesn't
+        """
+
+        destination_component = self.__components[destination_id]
+        if self.__components[departure_id] == destination_component:
+            return True
+        starts, ends, targets, weights = self.__network.adjacency()
+        seen = bytearray(len(self.__components))
+        seen[departure_id] = 1
+        stack = [departure_id]
+        while stack:
+            city = stack.pop()
+            for slot in range(starts[city], ends[city]):
+                neighbour = targets[slot]
+                if self.__components[neighbour] == destination_component:
+                    return True
+                if not seen[neighbour]:
+                    seen[neighbour] = 1
+                    stack.append(neighbour)
+        return False
+
+
+class LandmarkIndex:
+    """
+    This class keeps the landmark tables of the A* search (ALT): for a few
+    landmark cities L, the shortest distances d(L, city) and d(city, L) to
+    and from every city. By the triangle inequality
+    d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L), which
+    gives the search a lower bound of the remaining distance, so it expands
+    the cities in the direction of the destination first.
+
+    The landmarks are picked one by one as the city farthest away from the
+    landmarks picked so far (farthest selection), cities that no landmark
+    can reach are picked first.
+
+    A removed road segment or a longer distance keeps the bounds valid, as
+    distances only grow. A new road segment or a shorter distance can make
+    them too large, so the tables are dropped and built again when needed.
+    """
+
+    def __init__(self, network, landmark_count=LANDMARK_COUNT):
+        self.__network = network
+        self.__landmark_count = landmark_count
+        self.__landmarks = []     # city ids of the landmarks
+        self.__from_tables = []   # per landmark: array, d(landmark, city) or -1
+        self.__to_tables = []     # per landmark: array, d(city, landmark) or -1
+        self.__valid = False
+        network.add_listener(self)
+
+    def is_valid(self):
+        """
+        Check if the tables are built and up to date.
+
+        :return: True, if the tables can be used | False, if they can't
+        """
+
+        return self.__valid
+
+    def get_landmarks(self):
+        """
+        fetch the landmark cities
+
+        :return: list[str], the names of the landmark cities
+        """
+
+        return [self.__network.city_name(city_id) for city_id in self.__landmarks]
+
+    def refresh(self):
+        """
+        Build the tables if they have not been built yet or if they are stale.
+        """
+
+        if not self.__valid:
+            self.build()
+
+    def get_tables(self):
+        """
+        fetch the tables for saving them, see set_tables
+
+        :return: tuple(list[int], list[array], list[array]) | None, the
+                 landmark ids, the d(landmark, city) and the d(city, landmark)
+                 tables, or None if the tables are not up to date
+        """
+
+        if not self.__valid:
+            return None
+        return self.__landmarks, self.__from_tables, self.__to_tables
+
+    def set_tables(self, landmarks, from_tables, to_tables):
+        """
+        Use tables saved from the landmark index of the same road network.
+
+        :param landmarks: list[int], the city ids of the landmarks
+        :param from_tables: list of sequences, d(landmark, city) or -1 per landmark
+        :param to_tables: list of sequences, d(city, landmark) or -1 per landmark
+        """
+
+        self.__landmarks = list(landmarks)
+        self.__from_tables = from_tables
+        self.__to_tables = to_tables
+        self.__valid = True
+
+    def build(self):
+        """
+        Pick the landmarks and compute their tables. Every landmark costs a
+        forward and a backward search over the whole road network.
+        """
+
+        network = self.__network
+        city_count = network.city_count()
+        outgoing = network.adjacency()
+        inbound = network.reverse_adjacency()
+
+        self.__landmarks = []
+        self.__from_tables = []
+        self.__to_tables = []
+
+        # the round trip distance from the nearest landmark, -1 if no
+        # landmark has a round trip through the city
+        nearest = array("q", [-1]) * city_count
+        candidate = 0
+        if city_count > 0:
+            # start from the city farthest away from the first city
+            distances = _distance_table(outgoing, 0, city_count)
+            candidate = max(range(city_count), key=distances.__getitem__)
+
+        while len(self.__landmarks) < min(self.__landmark_count, city_count):
+            from_table = _distance_table(outgoing, candidate, city_count)
+            to_table = _distance_table(inbound, candidate, city_count)
+            self.__landmarks.append(candidate)
+            self.__from_tables.append(from_table)
+            self.__to_tables.append(to_table)
+
+            for city_id in range(city_count):
+                if from_table[city_id] >= 0 and to_table[city_id] >= 0:
+                    round_trip = from_table[city_id] + to_table[city_id]
+                    if nearest[city_id] == -1 or round_trip < nearest[city_id]:
+                        nearest[city_id] = round_trip
+
+            farthest = -1
+            candidate = -1
+            for city_id in range(city_count):
+                if city_id in self.__landmarks:
+                    continue
+                if nearest[city_id] == -1:
+                    candidate = city_id
+                    break
+                if nearest[city_id] > farthest:
+                    farthest = nearest[city_id]
+                    candidate = city_id
+            if candidate == -1:
+                break
+
+        self.__valid = True
+
+    def lower_bounds(self, target):
+        """
+        Make a function that gives the lower bound of the distance from a
+        city to <target>.
+
+        :param target: int, the id of the destination city
+        :return: function(int) -> int | None, the lower bound from a city id,
+                 or None if the city can't reach <target> at all
+        """
+
+        columns = []
+        for landmark in range(len(self.__landmarks)):
+            from_table = self.__from_tables[landmark]
+            to_table = self.__to_tables[landmark]
+            columns.append((from_table, from_table[target], to_table, to_table[target]))
+
+        def lower_bound(city):
+            bound = 0
+            for from_table, from_target, to_table, to_target in columns:
+                from_city = from_table[city]
+                to_city = to_table[city]
+                if from_target >= 0:
+                    if from_city < 0:
+                        pass
+                    elif from_target - from_city > bound:
+                        bound = from_target - from_city
+                elif from_city >= 0:
+                    # the landmark reaches the city but not the target
+                    return None
+                if to_city >= 0:
+                    if to_target < 0:
+                        pass
+                    elif to_city - to_target > bound:
+                        bound = to_city - to_target
+                elif to_target >= 0:
+                    # the target reaches the landmark but the city doesn't
+                    return None
+            return bound
+
+        return lower_bound
+
+    def save(self, file_name, source_file):
+        """
+        Write the tables into a binary file. The size and the modification
+        time of the distance file are stored too, so that the tables of an
+        older version of the distance file are not loaded.
+
+        :param file_name: str, the name of the file to be written
+        :param source_file: str, the name of the distance file
+        :return: True, if the file was written | False, if it failed
+        """
+
+        try:
+            with open(file_name, mode="wb") as landmark_file:
+                landmark_file.write(LANDMARK_MAGIC)
+                header = array("q", [_file_signature(source_file), self.__network.city_count(),
+                                     len(self.__landmarks)])
+                header.tofile(landmark_file)
+                array("q", self.__landmarks).tofile(landmark_file)
+                for landmark in range(len(self.__landmarks)):
+                    self.__from_tables[landmark].tofile(landmark_file)
+                    self.__to_tables[landmark].tofile(landmark_file)
+        except OSError:
+            return False
+        return True
+
+    def load(self, file_name, source_file):
+        """
+        Read the tables written by save, if they belong to the current
+        version of the distance file.
+
+        :param file_name: str, the name of the file to be read
+        :param source_file: str, the name of the distance file
+        :return: True, if the tables were loaded | False, if there is no
+                 file or it doesn't match the distance file
+        """
+
+        city_count = self.__network.city_count()
+        try:
+            with open(file_name, mode="rb") as landmark_file:
+                if landmark_file.read(len(LANDMARK_MAGIC)) != LANDMARK_MAGIC:
+                    return False
+                header = array("q")
+                header.fromfile(landmark_file, 3)
+                signature, stored_city_count, landmark_count = header
+                if signature != _file_signature(source_file) or stored_city_count != city_count:
+                    return False
+                landmarks = array("q")
+                landmarks.fromfile(landmark_file, landmark_count)
+                from_tables = []
+                to_tables = []
+                for landmark in range(landmark_count):
+                    from_table = array("q")
+                    from_table.fromfile(landmark_file, city_count)
+                    to_table = array("q")
+                    to_table.fromfile(landmark_file, city_count)
+                    from_tables.append(from_table)
+                    to_tables.append(to_table)
+        except (OSError, EOFError, ValueError):
+            return False
+
+        self.__landmarks = list(landmarks)
+        self.__from_tables = from_tables
+        self.__to_tables = to_tables
+        self.__valid = True
+        return True
+
+    def road_changed(self, departure_id, destination_id, old_distance, new_distance):
+        """
+        Follow a change of the road network, see RoadNetwork.add_listener.
+        """
+
+        if new_distance is not None and (old_distance is None or new_distance < old_distance):
+            self.__valid = False
+
+
+class RouteCache:
+    """
+    This class is a bounded LRU cache of the routes found so far:
+    (departure id, destination id) -> (route, total distance in km).
+
+    A change of a road segment drops only the routes it can affect:
+    - A removed road segment or a longer distance can only make the routes
+      through that road segment worse, so only they are dropped. An index
+      from every road segment to the cached routes using it finds them.
+    - A new road segment or a shorter distance u -> v of d km can only
+      improve a route s -> t of D km if d < D, s can reach u and v can
+      reach t. The reachability index tells the last two.
+    """
+
+    def __init__(self, network, capacity=ROUTE_CACHE_SIZE):
+        self.__network = network
+        self.__capacity = capacity
+        self.__routes = OrderedDict()   # (departure id, destination id) -> (route, distance)
+        self.__by_road = {}             # (departure id, destination id) of a road -> set of cache keys
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__invalidations = 0
+        network.add_listener(self)
+
+    def get(self, departure, destination):
+        """
+        Look up a cached route and mark it as the most recently used one.
+
+        :param departure: str, the name of the departure city
+        :param destination: str, the name of the destination city
+        :return: tuple(list[str], int) | None, the route and its total
+                 distance, or None if the route is not cached
+        """
+
+        key = (self.__network.city_id(departure), self.__network.city_id(destination))
+        cached = self.__routes.get(key)
+        if cached is None:
+            self.__misses += 1
+            return None
+        self.__hits += 1
+        self.__routes.move_to_end(key)
+        route, total_distance = cached
+        return list(route), total_distance
+
+    def put(self, route, total_distance):
+        """
+        Cache a route, dropping the least recently used route if the cache
+        is full.
+
+        :param route: list[str], the route found by find_route
+        :param total_distance: int, the length of the route in km
+        """
+
+        route_ids = [self.__network.city_id(city) for city in route]
+        key = (route_ids[0], route_ids[-1])
+        if key in self.__routes:
+            self.__drop(key)
+        elif len(self.__routes) >= self.__capacity:
+            self.__drop(next(iter(self.__routes)))
+            self.__evictions += 1
+
+        self.__routes[key] = (tuple(route), total_distance)
+        for i in range(len(route_ids) - 1):
+            self.__by_road.setdefault((route_ids[i], route_ids[i + 1]), set()).add(key)
+
+    def get_statistics(self):
+        """
+        fetch the counters of the cache
+
+        :return: dict[str, int], the hits, misses, evictions, invalidations,
+                 the number of cached routes and the capacity
+        """
+
+        return {
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "evictions": self.__evictions,
+            "invalidations": self.__invalidations,
+            "routes": len(self.__routes),
+            "capacity": self.__capacity,
+        }
+
+    def road_changed(self, departure_id, destination_id, old_distance, new_distance):
+        """
+        Follow a change of the road network, see RoadNetwork.add_listener.
+        """
+
+        if not self.__routes:
+            return
+        if new_distance is None or (old_distance is not None and new_distance >= old_distance):
+            affected = list(self.__by_road.get((departure_id, destination_id), ()))
+        else:
+            reachability = self.__network.reachability_index()
+            # a stale index would be rebuilt in O(V + E) for the checks, and without the reachable bits every
+            # check would be a search, in both cases every route longer than the new distance is dropped
+            checked = reachability.is_current() and reachability.has_closure()
+            affected = []
+            for key, (route, total_distance) in self.__routes.items():
+                if new_distance < total_distance and (not checked or (reachability.can_reach(key[0], departure_id)
+                                                                      and reachability.can_reach(destination_id,
+                                                                                                 key[1]))):
+                    affected.append(key)
+
+        for key in affected:
+            self.__drop(key)
+        self.__invalidations += len(affected)
+
+    def __drop(self, key):
+        """
+        Remove a cached route and its entries in the road segment index.
+
+        :param key: tuple(int, int), the departure and destination ids
+        """
+
+        route, total_distance = self.__routes.pop(key)
+        for i in range(len(route) - 1):
+            road = (self.__network.city_id(route[i]), self.__network.city_id(route[i + 1]))
+            keys = self.__by_road.get(road)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.__by_road[road]
+
+
+class ShortestPathTree:
+    """
+    This class keeps the shortest route from one departure city to every
+    city it can reach, as the distance and the previous city of every city,
+    and repairs it after a change of a road segment u -> v:
+
+    - A new road segment or a shorter distance can only make routes through
+      u -> v shorter. If it improves the distance of v, the improvement is
+      spread from v with Dijkstra's algorithm, touching only the cities
+      whose distance gets shorter.
+    - A removed road segment or a longer distance only matters if u -> v is
+      in the tree. Then the distances of v and the cities under it in the
+      tree are unknown. Each of them gets the best distance through an
+      inbound road segment from outside that subtree, and Dijkstra's
+      algorithm inside the subtree settles the rest.
+
+    The distances and the previous cities are kept in arrays indexed by the
+    city id (12 bytes per city), which grow when the road network gets new
+    cities.
+    """
+
+    def __init__(self, network, source):
+        self.__network = network
+        self.__source = source
+        city_count = network.city_count()
+        self.__deltas = array("q", [-1]) * city_count     # city id -> distance from the source, -1 if not reached
+        self.__came_from = array("i", [-1]) * city_count  # city id -> the previous city id in the tree, or -1
+        self.__deltas[source] = 0
+        self.__spread([(0, source)])
+
+    def get_source(self):
+        """
+        fetch the departure city of the tree
+
+        :return: int, the id of the departure city
+        """
+
+        return self.__source
+
+    def route(self, target):
+        """
+        Give the shortest route from the departure city of the tree.
+
+        :param target: int, the id of the destination city
+        :return: tuple(list[int], int) | None, the city ids of the route and
+                 its length in km, or None if <target> can't be reached
+        """
+
+        if target >= len(self.__deltas) or self.__deltas[target] == -1:
+            return None
+        return _unwind(self.__came_from, target)[::-1], self.__deltas[target]
+
+    def road_changed(self, departure_id, destination_id, old_distance, new_distance):
+        """
+        Repair the tree after a change of a road segment, see
+        RoadNetwork.add_listener.
+        """
+
+        self.__grow()
+        deltas = self.__deltas
+        if new_distance is not None and (old_distance is None or new_distance < old_distance):
+            if deltas[departure_id] != -1:
+                new_delta = deltas[departure_id] + new_distance
+                if deltas[destination_id] == -1 or new_delta < deltas[destination_id]:
+                    deltas[destination_id] = new_delta
+                    self.__came_from[destination_id] = departure_id
+                    self.__spread([(new_delta, destination_id)])
+        elif self.__came_from[destination_id] == departure_id and new_distance != old_distance:
+            self.__repair_subtree(destination_id)
+
+    def __grow(self):
+        """
+        Make room in the arrays for the cities added to the road network
+        since the tree was built.
+        """
+
+        missing = self.__network.city_count() - len(self.__deltas)
+        if missing > 0:
+            self.__deltas.extend(array("q", [-1]) * missing)
+            self.__came_from.extend(array("i", [-1]) * missing)
+
+    def __spread(self, heap):
+        """
+        Dijkstra's algorithm from the cities in <heap>, whose distances have
+        been set already. Only the cities whose distance gets shorter are
+        visited.
+
+        :param heap: list[tuple(int, int)], (distance, city id) entries
+        """
+
+        starts, ends, targets, weights = self.__network.adjacency()
+        deltas = self.__deltas
+        came_from = self.__came_from
+        heapq.heapify(heap)
+
+        while heap:
+            delta, city = heapq.heappop(heap)
+            if delta > deltas[city]:
+                continue
+            for slot in range(starts[city], ends[city]):
+                neighbour = targets[slot]
+                new_delta = delta + weights[slot]
+                if deltas[neighbour] == -1 or new_delta < deltas[neighbour]:
+                    deltas[neighbour] = new_delta
+                    came_from[neighbour] = city
+                    heapq.heappush(heap, (new_delta, neighbour))
+
+    def __repair_subtree(self, root):
+        """
+        Find new distances for <root> and every city under it in the tree.
+
+        :param root: int, the city id whose road segment from its previous
+                     city got longer or was removed
+        """
+
+        starts, ends, targets, weights = self.__network.adjacency()
+        deltas = self.__deltas
+        came_from = self.__came_from
+
+        # collect the subtree: the children of a city are its neighbours
+        # whose previous city it is
+        subtree = [root]
+        in_subtree = {root}
+        for city in subtree:
+            for slot in range(starts[city], ends[city]):
+                neighbour = targets[slot]
+                if neighbour not in in_subtree and came_from[neighbour] == city:
+                    in_subtree.add(neighbour)
+                    subtree.append(neighbour)
+
+        for city in subtree:
+            deltas[city] = -1
+            came_from[city] = -1
+
+        # the best way into every city of the subtree from outside of it
+        in_starts, in_ends, sources, in_weights = self.__network.reverse_adjacency()
+        heap = []
+        for city in subtree:
+            for slot in range(in_starts[city], in_ends[city]):
+                previous = sources[slot]
+                if previous in in_subtree or deltas[previous] == -1:
+                    continue
+                new_delta = deltas[previous] + in_weights[slot]
+                if deltas[city] == -1 or new_delta < deltas[city]:
+                    deltas[city] = new_delta
+                    came_from[city] = previous
+            if deltas[city] != -1:
+                heap.append((deltas[city], city))
+
+        self.__spread(heap)
+
+
+class DisplayIndex:
+    """
+    This class keeps every road segment as a (departure, destination,
+    distance) tuple in one list sorted by the city names, so the display
+    action can write the road segments without sorting them again. The list
+    is built when it is first needed and then follows the changes of the
+    road network: a change is found with a binary search and costs
+    O(log E) plus moving the rest of the list.
+    """
 
-def find_route(data, departure, destination):
+    def __init__(self, network):
+        self.__network = network
+        self.__rows = None
+        network.add_listener(self)
+
+    def get_rows(self):
+        """
+        fetch the sorted road segments, building the list if needed
+
+        :return: list[tuple(str, str, int)], the departure, destination and
+                 distance of every road segment, sorted by the names
+        """
+
+        if self.__rows is None:
+            network = self.__network
+            starts, ends, targets, weights = network.adjacency()
+            rows = []
+            for city_id in range(network.city_count()):
+                departure = network.city_name(city_id)
+                for slot in range(starts[city_id], ends[city_id]):
+                    rows.append((departure, network.city_name(targets[slot]), weights[slot]))
+            rows.sort()
+            self.__rows = rows
+        return self.__rows
+
+    def road_changed(self, departure_id, destination_id, old_distance, new_distance):
+        """
+        Follow a change of the road network, see RoadNetwork.add_listener.
+        """
+
+        if self.__rows is None:
+            return
+        key = (self.__network.city_name(departure_id), self.__network.city_name(destination_id))
+        # a (departure, destination) pair sorts right before the rows starting with it
+        position = bisect_left(self.__rows, key)
+        if old_distance is not None:
+            del self.__rows[position]
+        if new_distance is not None:
+            self.__rows.insert(position, key + (new_distance,))
+
+
+class HotRouteTrees:
+    """
+    This class keeps the shortest path trees (see ShortestPathTree) of the
+    departure cities that are asked most often. A departure city gets a tree
+    when it has been asked HOT_DEPARTURE_QUERIES times, and at most
+    HOT_TREE_COUNT trees are kept, dropping the least recently used one.
+    The trees are repaired after every change of the road network instead
+    of being rebuilt.
+    """
+
+    def __init__(self, network, tree_count=HOT_TREE_COUNT, hot_queries=HOT_DEPARTURE_QUERIES):
+        self.__network = network
+        self.__tree_count = tree_count
+        self.__hot_queries = hot_queries
+        self.__query_counts = {}       # departure city id -> the number of queries
+        self.__trees = OrderedDict()   # departure city id -> ShortestPathTree
+        network.add_listener(self)
+
+    def route(self, source, target):
+        """
+        Count a route query and answer it from the tree of the departure city
+        if it has one, or has just become hot enough to get one.
+
+        :param source: int, the id of the departure city
+        :param target: int, the id of the destination city
+        :return: tuple(list[int], int) | None, the city ids of the route and
+                 its length in km, ([], None) if there is no route, or None
+                 if the departure city has no tree
+        """
+
+        tree = self.__trees.get(source)
+        if tree is None:
+            count = self.__query_counts.get(source, 0) + 1
+            self.__query_counts[source] = count
+            if count < self.__hot_queries:
+                return None
+            tree = ShortestPathTree(self.__network, source)
+            self.__trees[source] = tree
+            if len(self.__trees) > self.__tree_count:
+                self.__trees.popitem(last=False)
+        self.__trees.move_to_end(source)
+
+        found = tree.route(target)
+        if found is None:
+            return [], None
+        return found
+
+    def get_departures(self):
+        """
+        fetch the departure cities that have a tree
+
+        :return: list[int], the city ids, the most recently used last
+        """
+
+        return list(self.__trees)
+
+    def road_changed(self, departure_id, destination_id, old_distance, new_distance):
+        """
+        Repair every tree, see RoadNetwork.add_listener.
+        """
+
+        for tree in self.__trees.values():
+            tree.road_changed(departure_id, destination_id, old_distance, new_distance)
+
+
+class PhaseTimer:
+    """
+    This class measures the wall-clock time of the phases of an operation
+    for the profiling hook (see set_profile_hook). Every lap ends a phase
+    and starts the next one.
     """
-    This function, an already provided function, tries to find
-    a route between <departure> and <destination> cities. It assumes
-    the existence of the two functions fetch_neighbours and distance_to_neighbour
-    (see the assignment and the function templates below).
-    They are used to get the relevant information from the data
-    structure <data> for find_route to be able to do the search.
+
+    def __init__(self):
+        self.__last = time.perf_counter()
+        self.__phases = {}
+
+    def lap(self, phase):
+        """
+        End a phase and add its time to the phase's total.
+
+        :param phase: str, the name of the phase that has just ended
+        """
+
+        now = time.perf_counter()
+        self.__phases[phase] = self.__phases.get(phase, 0.0) + now - self.__last
+        self.__last = now
+
+    def get_phases(self):
+        """
+        fetch the measured phases
+
+        :return: dict[str, float], the time of every phase in seconds, in
+                 the order the phases ended first
+        """
+
+        return dict(self.__phases)
+
+
+ROUTE_METHODS = ("dijkstra", "bidirectional", "alt", "ch")
+
+# the function told about every search and every read, see set_profile_hook
+_profile_hook = None
+
+
+def set_profile_hook(hook):
+    """
+    Register a function that is called with a report of every operation
+    that can be profiled, or None to stop profiling. The reports are:
+
+    - "read": read_distance_file, with the file name, the numbers of
+      cities and road segments and the time of the phases (parse, merge
+      for a parallel read, build).
+    - "search": find_route, with the method, the cities, the search
+      counters and the time of the phases (search, names). The counters are
+      "settled" (the cities settled), "relaxed" (the road segments looked
+      at from the settled cities), "reached" (the cities given a distance,
+      every one pushed into a heap at least once) and "heap_left" (the
+      entries still in the heaps at the end). They are counted from the
+      state of the search after it has ended, so the search loops have no
+      extra work, also when profiling. The contraction hierarchy search
+      gives only "reached" and "heap_left".
+    - "lookup": route_with_distance, with the cities, what answered the
+      query (cache, matrix, reachability, tree or search), the route length
+      and the time of the phases up to the answer.
+
+    While no hook is registered, nothing is measured.
+
+    :param hook: function(str, dict) | None, called with the name and the
+                 report of every operation
+    :return: function(str, dict) | None, the hook registered before
+    """
+
+    global _profile_hook
+    previous = _profile_hook
+    _profile_hook = hook
+    return previous
+
+
+def find_route(data, departure, destination, method="dijkstra"):
+    """
+    This function tries to find the shortest route between <departure>
+    and <destination> cities. By default it uses Dijkstra's algorithm with
+    a priority queue (heapq), so a query costs O((V+E) log V) where V is the
+    number of cities and E the number of road segments. The search stops as
+    soon as the <destination> city has been settled.
+
+    With method="bidirectional" the search runs forward from <departure>
+    and backward from <destination> over the inbound road segments at the
+    same time. On road networks the two searches meet after settling far
+    fewer cities than a one-sided search, and the route has the same length.
+
+    With method="alt" the search is an A* search guided by the lower bounds
+    of the landmark tables (see LandmarkIndex), which are built first if
+    they are not up to date.
+
+    With method="ch" the route is searched in the contraction hierarchy of
+    the road network (see contraction_hierarchy.py), which is built first if
+    it is not up to date. The preprocessing is slow, but a query settles
+    only a few hundred cities.
 
     The return value is a list of cities one must travel through
     to get from <departure> to <destination>. If for any
     reason the route does not exist, the return value is
     an empty list [].
 
-    :param data: dict, A data structure which contains the distance information between the cities.
+    :param data: RoadNetwork, A data structure which contains the distance information between the cities.
     :param departure: str, the name of the departure city.
     :param destination: str, the name of the destination city.
+    :param method: str, one of ROUTE_METHODS, the search algorithm to be used.
     :return: list[str], a list of cities the route travels through, or
            an empty list if the route can not be found. If the departure
            and the destination cities are the same, the function returns
            a two element list where the departure city is stored twice.
     """
 
-    if departure not in data:
+    if method not in ROUTE_METHODS:
+        raise ValueError(f"unknown route method '{method}'")
+
+    if not data.is_departure(departure):
         return []
 
     elif departure == destination:
         return [departure, destination]
 
-    greens = {departure}
-    deltas = {departure: 0}
-    came_from = {departure: None}
+    source = data.city_id(departure)
+    target = data.city_id(destination)
+    if target is None:
+        return []
 
-    while True:
-        if destination in greens:
-            break
+    # the searches fill the trace only when someone is profiling them
+    hook = _profile_hook
+    trace = None
+    if hook is not None:
+        trace = {"settled": 0, "relaxed": 0, "reached": 0, "heap_left": 0}
+        timer = PhaseTimer()
+
+    if method == "bidirectional":
+        route_ids = _bidirectional_search(data, source, target, trace)
+    elif method == "alt":
+        landmarks = data.landmark_index()
+        landmarks.refresh()
+        route_ids = _landmark_search(data, source, target, landmarks.lower_bounds(target), trace)
+    elif method == "ch":
+        route_ids = data.contraction_hierarchy().route(source, target, trace)
+    else:
+        route_ids = _dijkstra_search(data, source, target, trace)
 
-        red_neighbours = []
-        for city in greens:
-            for neighbour in fetch_neighbours(data, city):
-                if neighbour not in greens:
-                    delta = deltas[city] + distance_to_neighbour(data, city, neighbour)
-                    red_neighbours.append((city, neighbour, delta))
+    if hook is not None:
+        timer.lap("search")
+    route = [data.city_name(city) for city in route_ids]
+    if hook is not None:
+        timer.lap("names")
+        hook("search", {"method": method, "departure": departure, "destination": destination,
+                        "found": bool(route), "counters": trace, "phases": timer.get_phases()})
+    return route
 
-        if not red_neighbours:
-            return []
 
-        current_city, next_city, delta = min(red_neighbours, key=lambda x: x[2])
+def find_routes_from(data, departure, destinations):
+    """
+    Find the shortest routes from one departure city to many destination
+    cities with a single Dijkstra's search, which stops as soon as every
+    destination has been settled (or every reachable city, if some of them
+    can't be reached).
 
-        greens.add(next_city)
-        deltas[next_city] = delta
-        came_from[next_city] = current_city
+    :param data: RoadNetwork, the road network to be searched.
+    :param departure: str, the name of the departure city.
+    :param destinations: iterable of str, the names of the destination cities.
+    :return: dict[str, tuple(list[str], int)], the route and its length in km
+             of every destination that can be reached. A destination equal to
+             the departure has the route [departure, departure] of 0 km.
+    """
 
-    route = []
-    while True:
-        route.append(destination)
+    routes = {}
+    if not data.is_departure(departure):
+        return routes
+
+    source = data.city_id(departure)
+    wanted = {}
+    for destination in destinations:
         if destination == departure:
+            routes[destination] = ([departure, departure], 0)
+        elif data.city_id(destination) is not None:
+            wanted[data.city_id(destination)] = destination
+    if not wanted:
+        return routes
+
+    starts, ends, targets, weights = data.adjacency()
+    deltas = {source: 0}
+    came_from = {source: -1}
+    settled = set()
+    heap = [(0, source)]
+    remaining = len(wanted)
+
+    while heap and remaining > 0:
+        delta, city = heapq.heappop(heap)
+        if city in settled:
+            continue
+        settled.add(city)
+        if city in wanted:
+            remaining -= 1
+
+        for slot in range(starts[city], ends[city]):
+            neighbour = targets[slot]
+            if neighbour in settled:
+                continue
+            new_delta = delta + weights[slot]
+            if new_delta < deltas.get(neighbour, new_delta + 1):
+                deltas[neighbour] = new_delta
+                came_from[neighbour] = city
+                heapq.heappush(heap, (new_delta, neighbour))
+
+    for target, destination in wanted.items():
+        if target in settled:
+            route = [data.city_name(city) for city in reversed(_unwind(came_from, target))]
+            routes[destination] = (route, deltas[target])
+    return routes
+
+
+def cities_within(data, departures, max_distance):
+    """
+    Find every city that can be reached within <max_distance> km with a
+    single Dijkstra's search, which stops at the distance budget and doesn't
+    push any city beyond it. With many departure cities the search starts
+    from all of them at once (a multi-source search), and every city gets
+    its distance from the nearest departure city.
+
+    :param data: RoadNetwork, the road network to be searched.
+    :param departures: str | iterable of str, the name(s) of the departure city.
+    :param max_distance: int, the distance budget in km.
+    :return: list[tuple(str, int)], the names and the distances of the
+             reached cities sorted by the distance and then by the name,
+             without the departure cities themselves.
+    """
+
+    if isinstance(departures, str):
+        departures = [departures]
+    sources = {data.city_id(departure) for departure in departures} - {None}
+
+    starts, ends, targets, weights = data.adjacency()
+    deltas = dict.fromkeys(sources, 0)
+    settled = set()
+    heap = [(0, source) for source in sources]
+    reached = []
+
+    while heap:
+        delta, city = heapq.heappop(heap)
+        if city in settled:
+            continue
+        settled.add(city)
+        if city not in sources:
+            reached.append((delta, data.city_name(city)))
+
+        for slot in range(starts[city], ends[city]):
+            neighbour = targets[slot]
+            new_delta = delta + weights[slot]
+            # a city beyond the budget is never pushed, so the heap runs out at the budget
+            if new_delta > max_distance or neighbour in settled:
+                continue
+            if new_delta < deltas.get(neighbour, new_delta + 1):
+                deltas[neighbour] = new_delta
+                heapq.heappush(heap, (new_delta, neighbour))
+
+    # the cities are settled in the order of their distance, only the ties need sorting by name
+    reached.sort()
+    return [(city, delta) for delta, city in reached]
+
+
+def find_alternative_routes(data, departure, destination, route_count):
+    """
+    Find the <route_count> shortest loopless routes between two cities with
+    Yen's algorithm. Every next route branches off an earlier one: for every
+    city of the last found route, a spur search looks for the shortest way
+    to the destination that leaves the city by a road segment not taken by
+    the earlier routes sharing the same beginning, and doesn't go through the
+    cities before it.
+
+    All the spur searches share one shortest path tree, built once by a
+    backward search from the destination. Its distances are exact lower
+    bounds for the A* spur searches (removing road segments only makes the
+    distances longer), and a spur search isn't needed at all when the tree
+    route from the city avoids the removed road segment and the blocked
+    cities, as no route can be shorter than it.
+
+    :param data: RoadNetwork, the road network to be searched.
+    :param departure: str, the name of the departure city.
+    :param destination: str, the name of the destination city.
+    :param route_count: int, the largest number of routes wanted.
+    :return: list[tuple(list[str], int)], the routes and their lengths in km,
+             the shortest first. The list is shorter than <route_count> if
+             there are fewer routes, and empty if there is none.
+    """
+
+    source = data.city_id(departure)
+    target = data.city_id(destination)
+    if source is None or target is None or route_count < 1 or not data.is_departure(departure):
+        return []
+    if source == target:
+        return [([departure, departure], 0)]
+
+    adjacency = data.adjacency()
+    to_target, next_cities = _reverse_tree(data, target)
+    if to_target[source] < 0:
+        return []
+
+    first = _follow_tree(next_cities, source, target)
+    routes = [(first, to_target[source])]
+    candidates = []
+    seen = {tuple(first)}
+
+    while len(routes) < route_count:
+        last_route = routes[-1][0]
+        root_distance = 0
+        for i in range(len(last_route) - 1):
+            spur_city = last_route[i]
+            root = last_route[:i + 1]
+            # the road segments from the spur city taken by the earlier routes with the same root
+            removed = {route[i + 1] for route, distance in routes if route[:i + 1] == root}
+            blocked = set(root[:-1])
+
+            spur = _spur_route(adjacency, spur_city, target, to_target, next_cities, removed, blocked)
+            if spur is not None:
+                spur_route, spur_distance = spur
+                candidate = root[:-1] + spur_route
+                if tuple(candidate) not in seen:
+                    seen.add(tuple(candidate))
+                    heapq.heappush(candidates, (root_distance + spur_distance, candidate))
+
+            root_distance += _road_weight(adjacency, spur_city, last_route[i + 1])
+
+        if not candidates:
+            break
+        distance, route = heapq.heappop(candidates)
+        routes.append((route, distance))
+
+    return [([data.city_name(city) for city in route], distance) for route, distance in routes]
+
+
+def _reverse_tree(data, target):
+    """
+    A backward Dijkstra's search from <target> over the whole road network,
+    giving the shortest path tree of the routes leading to it.
+
+    :param data: RoadNetwork, the road network to be searched.
+    :param target: int, the id of the destination city.
+    :return: tuple(array, array), the distance to <target> from every city
+             (-1 if it can't reach <target>) and the next city on its route
+    """
+
+    starts, ends, sources, weights = data.reverse_adjacency()
+    city_count = data.city_count()
+    to_target = array("q", [-1]) * city_count
+    next_cities = array("i", [-1]) * city_count
+    to_target[target] = 0
+    settled = bytearray(city_count)
+    heap = [(0, target)]
+
+    while heap:
+        delta, city = heapq.heappop(heap)
+        if settled[city]:
+            continue
+        settled[city] = 1
+        for slot in range(starts[city], ends[city]):
+            neighbour = sources[slot]
+            new_delta = delta + weights[slot]
+            if not settled[neighbour] and (to_target[neighbour] < 0 or new_delta < to_target[neighbour]):
+                to_target[neighbour] = new_delta
+                next_cities[neighbour] = city
+                heapq.heappush(heap, (new_delta, neighbour))
+
+    return to_target, next_cities
+
+
+def _follow_tree(next_cities, city, target):
+    """
+    Follow the shortest path tree of _reverse_tree from <city> to <target>.
+
+    :return: list[int], the city ids of the route
+    """
+
+    route = [city]
+    while city != target:
+        city = next_cities[city]
+        route.append(city)
+    return route
+
+
+def _spur_route(adjacency, spur_city, target, to_target, next_cities, removed, blocked):
+    """
+    Find the shortest route from <spur_city> to <target> that doesn't leave
+    <spur_city> towards a city of <removed> and doesn't go through <blocked>.
+    The tree route is used if it is allowed, otherwise an A* search guided by
+    the tree distances finds the route.
+
+    :return: tuple(list[int], int) | None, the route and its length in km,
+             or None if there is no such route
+    """
+
+    tree_route = _follow_tree(next_cities, spur_city, target)
+    if tree_route[1] not in removed and blocked.isdisjoint(tree_route):
+        return tree_route, to_target[spur_city]
+
+    starts, ends, targets, weights = adjacency
+    deltas = {spur_city: 0}
+    came_from = {spur_city: -1}
+    settled = set()
+    heap = [(to_target[spur_city], 0, spur_city)]
+
+    while heap:
+        estimate, delta, city = heapq.heappop(heap)
+        if city in settled:
+            continue
+        settled.add(city)
+        if city == target:
+            return _unwind(came_from, target)[::-1], delta
+
+        for slot in range(starts[city], ends[city]):
+            neighbour = targets[slot]
+            if neighbour in settled or neighbour in blocked or to_target[neighbour] < 0 \
+                    or (city == spur_city and neighbour in removed):
+                continue
+            new_delta = delta + weights[slot]
+            if new_delta < deltas.get(neighbour, new_delta + 1):
+                deltas[neighbour] = new_delta
+                came_from[neighbour] = city
+                heapq.heappush(heap, (new_delta + to_target[neighbour], new_delta, neighbour))
+
+    return None
+
+
+def _road_weight(adjacency, departure, destination):
+    """
+    fetch the distance of the road segment between two city ids
+
+    :return: int, the distance in km
+    """
+
+    starts, ends, targets, weights = adjacency
+    for slot in range(starts[departure], ends[departure]):
+        if targets[slot] == destination:
+            return weights[slot]
+    raise KeyError((departure, destination))
+
+
+def _dijkstra_search(data, source, target, trace=None):
+    """
+    Dijkstra's algorithm from <source> until <target> is settled.
+
+    :param data: RoadNetwork, the road network to be searched.
+    :param source: int, the id of the departure city.
+    :param target: int, the id of the destination city.
+    :param trace: dict | None, the search counters are added here, see _trace_search.
+    :return: list[int], the city ids of the route or [] if there is no route.
+    """
+
+    starts, ends, targets, weights = data.adjacency()
+
+    # Dijkstra's algorithm with a binary heap: every entry in the heap is
+    # (distance from the departure, city id). A city can be pushed several
+    # times if a shorter way to it is found later, the outdated entries are
+    # simply skipped when they are popped.
+    deltas = {source: 0}
+    came_from = {source: -1}
+    settled = set()
+    heap = [(0, source)]
+
+    while heap:
+        delta, city = heapq.heappop(heap)
+        if city in settled:
+            continue
+        settled.add(city)
+
+        # the destination is settled, its distance can not get any shorter
+        if city == target:
+            break
+
+        for slot in range(starts[city], ends[city]):
+            neighbour = targets[slot]
+            if neighbour in settled:
+                continue
+            new_delta = delta + weights[slot]
+            if new_delta < deltas.get(neighbour, new_delta + 1):
+                deltas[neighbour] = new_delta
+                came_from[neighbour] = city
+                heapq.heappush(heap, (new_delta, neighbour))
+
+    if trace is not None:
+        _trace_search(trace, starts, ends, settled, deltas, heap, target)
+
+    if target not in settled:
+        return []
+
+    return _unwind(came_from, target)[::-1]
+
+
+def _bidirectional_search(data, source, target, trace=None):
+    """
+    Bidirectional Dijkstra's algorithm: a forward search from <source> over
+    the outgoing road segments and a backward search from <target> over the
+    inbound road segments. Every time a search reaches a city the other
+    search has already reached, the route through that city is a candidate.
+    The searches stop when the smallest distances in the two heaps add up
+    to at least the best candidate, as no route through an unsettled city
+    can be shorter any more.
+
+    :param data: RoadNetwork, the road network to be searched.
+    :param source: int, the id of the departure city.
+    :param target: int, the id of the destination city.
+    :param trace: dict | None, the search counters are added here, see _trace_search.
+    :return: list[int], the city ids of the route or [] if there is no route.
+    """
+
+    forward = (data.adjacency(), {source: 0}, {source: -1}, set(), [(0, source)])
+    backward = (data.reverse_adjacency(), {target: 0}, {target: -1}, set(), [(0, target)])
+    forward_heap = forward[4]
+    backward_heap = backward[4]
+
+    best = None
+    meeting_city = -1
+
+    while forward_heap and backward_heap:
+        if best is not None and forward_heap[0][0] + backward_heap[0][0] >= best:
+            break
+
+        # expand the side with fewer cities waiting, it is the cheaper one
+        if len(forward_heap) <= len(backward_heap):
+            side, other = forward, backward
+        else:
+            side, other = backward, forward
+        (starts, ends, neighbours, weights), deltas, came_from, settled, heap = side
+        other_deltas = other[1]
+
+        delta, city = heapq.heappop(heap)
+        if city in settled:
+            continue
+        settled.add(city)
+
+        for slot in range(starts[city], ends[city]):
+            neighbour = neighbours[slot]
+            if neighbour in settled:
+                continue
+            new_delta = delta + weights[slot]
+            if new_delta < deltas.get(neighbour, new_delta + 1):
+                deltas[neighbour] = new_delta
+                came_from[neighbour] = city
+                heapq.heappush(heap, (new_delta, neighbour))
+            # the searches have met in <neighbour>
+            if neighbour in other_deltas:
+                candidate = deltas[neighbour] + other_deltas[neighbour]
+                if best is None or candidate < best:
+                    best = candidate
+                    meeting_city = neighbour
+
+    if trace is not None:
+        for (starts, ends, neighbours, weights), deltas, came_from, settled, heap in (forward, backward):
+            _trace_search(trace, starts, ends, settled, deltas, heap)
+
+    if best is None:
+        return []
+
+    route = _unwind(forward[2], meeting_city)[::-1]
+    route.extend(_unwind(backward[2], meeting_city)[1:])
+    return route
+
+
+def _landmark_search(data, source, target, lower_bound, trace=None):
+    """
+    A* search from <source> to <target>. The heap is ordered by the distance
+    from <source> plus the lower bound of the distance to <target>, so the
+    cities towards <target> are settled first. The landmark bounds are
+    consistent, so a settled city has its final distance like in Dijkstra's
+    algorithm.
+
+    :param data: RoadNetwork, the road network to be searched.
+    :param source: int, the id of the departure city.
+    :param target: int, the id of the destination city.
+    :param lower_bound: function(int) -> int | None, see LandmarkIndex.lower_bounds
+    :param trace: dict | None, the search counters are added here, see _trace_search.
+    :return: list[int], the city ids of the route or [] if there is no route.
+    """
+
+    starts, ends, targets, weights = data.adjacency()
+
+    source_bound = lower_bound(source)
+    if source_bound is None:
+        return []
+
+    # every entry in the heap is (estimated route length, distance from the departure, city id)
+    deltas = {source: 0}
+    came_from = {source: -1}
+    bounds = {source: source_bound}
+    settled = set()
+    heap = [(source_bound, 0, source)]
+
+    while heap:
+        estimate, delta, city = heapq.heappop(heap)
+        if city in settled:
+            continue
+        settled.add(city)
+
+        if city == target:
             break
-        destination = came_from.get(destination)
 
-    return list(reversed(route))
+        for slot in range(starts[city], ends[city]):
+            neighbour = targets[slot]
+            if neighbour in settled:
+                continue
+            new_delta = delta + weights[slot]
+            if new_delta < deltas.get(neighbour, new_delta + 1):
+                if neighbour not in bounds:
+                    bounds[neighbour] = lower_bound(neighbour)
+                bound = bounds[neighbour]
+                # the neighbour can't reach the destination at all
+                if bound is None:
+                    continue
+                deltas[neighbour] = new_delta
+                came_from[neighbour] = city
+                heapq.heappush(heap, (new_delta + bound, new_delta, neighbour))
+
+    if trace is not None:
+        _trace_search(trace, starts, ends, settled, deltas, heap, target)
+
+    if target not in settled:
+        return []
+
+    return _unwind(came_from, target)[::-1]
+
+
+def _trace_search(trace, starts, ends, settled, deltas, heap, target=None):
+    """
+    Add the counters of an ended search to a trace (see set_profile_hook).
+    They are counted from what the search left behind: every settled city
+    has had its road segments looked at, except <target> if the search
+    stopped when it was settled.
+
+    :param trace: dict[str, int], the counters to be added to
+    :param starts: array, the first slots of the searched road segments
+    :param ends: array, the ends of the slots of the searched road segments
+    :param settled: set[int], the settled cities
+    :param deltas: dict[int, int], the cities given a distance
+    :param heap: list, the entries left in the heap
+    :param target: int | None, the city the search stopped at
+    """
+
+    relaxed = sum(ends[city] - starts[city] for city in settled)
+    if target is not None and target in settled:
+        relaxed -= ends[target] - starts[target]
+    trace["settled"] += len(settled)
+    trace["relaxed"] += relaxed
+    trace["reached"] += len(deltas)
+    trace["heap_left"] += len(heap)
 
 
-def read_distance_file(file_name):
+def _distance_table(adjacency, source, city_count):
+    """
+    Dijkstra's algorithm from <source> over the whole road network.
+
+    :param adjacency: tuple(array, array, array, array), the CSR arrays to be
+                      searched, RoadNetwork.adjacency() or reverse_adjacency()
+    :param source: int, the id of the city to start from.
+    :param city_count: int, the number of cities.
+    :return: array[int], the distance of every city id from <source>, -1 for
+             the cities that can't be reached.
+    """
+
+    starts, ends, neighbours, weights = adjacency
+    deltas = array("q", [-1]) * city_count
+    deltas[source] = 0
+    settled = bytearray(city_count)
+    heap = [(0, source)]
+
+    while heap:
+        delta, city = heapq.heappop(heap)
+        if settled[city]:
+            continue
+        settled[city] = 1
+
+        for slot in range(starts[city], ends[city]):
+            neighbour = neighbours[slot]
+            new_delta = delta + weights[slot]
+            if deltas[neighbour] == -1 or new_delta < deltas[neighbour]:
+                deltas[neighbour] = new_delta
+                heapq.heappush(heap, (new_delta, neighbour))
+
+    return deltas
+
+
+def _file_signature(file_name):
+    """
+    Combine the size and the modification time of a file into one number,
+    which changes when the file is rewritten.
+
+    :param file_name: str, the name of the file
+    :return: int, the signature of the file
+    """
+
+    status = os.stat(file_name)
+    return (status.st_mtime_ns ^ (status.st_size << 20)) & 0x7FFFFFFFFFFFFFFF
+
+
+def _unwind(came_from, city):
+    """
+    Follow the came_from links of a search from <city> back to the city the
+    search started from.
+
+    :param came_from: dict[int, int] | array[int], the previous city of every
+                      reached city, -1 for the starting city.
+    :param city: int, the city id to start from.
+    :return: list[int], the city ids from <city> to the starting city.
+    """
+
+    cities = []
+    while city != -1:
+        cities.append(city)
+        city = came_from[city]
+    return cities
+
+
+def read_distance_file(file_name, workers=None):
     """
     Reads the distance information from <file_name> and stores it
     in a suitable data structure (you decide what kind of data
     structure to use). This data structure is also the return value,
     unless an error happens during the file reading operation.
 
+    A file of at least PARALLEL_READ_SIZE bytes is parsed in parallel by
+    worker processes (see _read_distance_file_parallel) when there is more
+    than one CPU, the result is the same as reading it line by line. Only
+    the parsing is parallel: merging the chunks and building the adjacency
+    arrays (load_edges) run in this process and take about half of the
+    sequential read, so the read gets at most about twice as fast however
+    many workers there are. A smaller file or a single CPU is read
+    sequentially, as the workers would only add their start-up and the
+    merge.
+
     :param file_name: str, The name of the file to be read.
-    :return: dict | None: A data structure containing the information
+    :param workers: int | None, the number of worker processes for a large
+           file, the number of CPUs by default and at most. 1 reads the file
+           sequentially.
+    :return: RoadNetwork | None: A data structure containing the information
              read from the <file_name> or None if any kind of error happens.
-             The data structure to be chosen is completely up to you as long
-             as all the required operations can be implemented using it.
     """
 
-    try:
-        distance_file = open(file_name, mode="r")
-        # distance information in the file is store as dictionaries in an outer dictionary
-        # each key of the big dictionary is a departure city, payload of that key is an inner dictionary
-        # keys of the small dict are destination, payloads of those keys are distance between the destination and
-        # the departure
-        data = {}
-        # iterate through every line of the file
-        for line in distance_file:
-            line = line.rstrip()
-            departure, destination, distance = line.split(";")
-            # check if a departure city is stored as the key of the outer dictionary or not
-            if departure not in data:
-                # if not, create a new inner dictionary for it
-                data[departure] = {}
-            # if the departure city is already stored, add more destination and distance into its inner dictionary
-            data[departure][destination] = distance
-            # connect departure and destination + distance through the big dictionary
+    # more workers than CPUs only take turns with each other
+    cpu_count = os.cpu_count() or 1
+    workers = cpu_count if workers is None else min(workers, cpu_count)
+    # the phases are timed only when someone is profiling them
+    hook = _profile_hook
+    timer = PhaseTimer() if hook is not None else None
 
-    except OSError:
+    try:
+        # an empty file can't be memory mapped, it is always read sequentially
+        if workers > 1 and os.path.getsize(file_name) >= max(PARALLEL_READ_SIZE, 1):
+            data = _read_distance_file_parallel(file_name, workers, timer)
+        else:
+            data = RoadNetwork()
+            sources = array("i")
+            targets = array("i")
+            weights = array("i")
+            lone_departures = array("i")
+            # the file is read without newline translation, like the parallel parser reads it
+            with open(file_name, mode="r", encoding="utf-8", newline="") as distance_file:
+                error = _parse_distance_rows(distance_file, data.intern, sources, targets, weights,
+                                             lone_departures)
+            if error is not None:
+                line_number, problem = error
+                print(f"Error: line {line_number} of '{file_name}' {problem}.")
+                return None
+            if timer is not None:
+                timer.lap("parse")
+            data.load_edges(sources, targets, weights)
+            data.mark_departures(lone_departures)
+            if timer is not None:
+                timer.lap("build")
+
+    except (OSError, UnicodeDecodeError):
         data = None
 
+    if hook is not None and data is not None:
+        starts, ends = data.adjacency()[:2]
+        hook("read", {"file": file_name, "cities": data.city_count(),
+                      "road_segments": sum(end - start for start, end in zip(starts, ends)),
+                      "phases": timer.get_phases()})
     return data
 
 
+def _parse_distance_rows(distance_file, intern, sources, targets, weights, lone_departures):
+    """
+    Parse the lines of a distance file into three parallel arrays. The
+    lines are read in large chunks and empty lines are skipped. A line
+    "departure;;" is a departure city without road segments, see
+    write_distance_file.
+
+    :param distance_file: file, the distance file opened in text mode
+    :param intern: function(str) -> int, gives the id of a city name
+    :param sources: array[int], the departure ids are appended here
+    :param targets: array[int], the destination ids are appended here
+    :param weights: array[int], the distances are appended here
+    :param lone_departures: array[int], the ids of the departure cities
+                            without road segments are appended here
+    :return: tuple(int, str) | None, the line number and the problem of the
+             first bad line, or None if every line is fine
+    """
+
+    line_number = 0
+    rest = ""
+    while True:
+        chunk = distance_file.read(READ_CHUNK_SIZE)
+        if chunk:
+            lines = (rest + chunk).split("\n")
+            # the last line may continue in the next chunk
+            rest = lines.pop()
+        else:
+            lines = [rest]
+
+        for line in lines:
+            line_number += 1
+            line = line.rstrip()
+            if line == "":
+                continue
+            fields = line.split(";")
+            if len(fields) != 3:
+                return line_number, "is not in the form 'departure;destination;distance'"
+            if fields[1] == "" and fields[2] == "":
+                lone_departures.append(intern(fields[0]))
+                continue
+            # only the distance has to be checked, the names can be anything
+            try:
+                distance = int(fields[2])
+            except ValueError:
+                distance = -1
+            if distance < 0:
+                return line_number, f"has a bad distance '{fields[2]}'"
+            if distance > MAX_DISTANCE:
+                return line_number, f"has a distance '{fields[2]}' larger than {MAX_DISTANCE}"
+            sources.append(intern(fields[0]))
+            targets.append(intern(fields[1]))
+            weights.append(distance)
+
+        if not chunk:
+            return None
+
+
+def _read_distance_file_parallel(file_name, workers, timer=None):
+    """
+    Parse a distance file with a pool of worker processes. The file is cut
+    into one chunk per worker at line boundaries, and every worker parses its
+    chunk into arrays of its own city ids (see _parse_distance_chunk). The
+    chunks are then merged in the order of the file: the local names of a
+    chunk are interned in the order they first appear in it and the ids of
+    the chunk are mapped to these ids. So the cities get the same ids and
+    the road segments the same order as when the file is read line by line,
+    and a later line still wins over an earlier one.
+
+    :param file_name: str, the name of the distance file
+    :param workers: int, the number of worker processes
+    :param timer: PhaseTimer | None, times the phases for the profiling hook
+    :return: RoadNetwork | None, the road network or None if there is a
+             bad line in the file
+    """
+
+    with open(file_name, mode="rb") as distance_file, \
+            mmap.mmap(distance_file.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+        size = len(file_map)
+        boundaries = [0]
+        for worker in range(1, workers):
+            boundary = file_map.find(b"\n", max(size * worker // workers, boundaries[-1]))
+            boundaries.append(size if boundary == -1 else boundary + 1)
+        boundaries.append(size)
+    if timer is not None:
+        timer.lap("split")
+
+    chunks = [(boundaries[i], boundaries[i + 1]) for i in range(workers) if boundaries[i] < boundaries[i + 1]]
+    data = RoadNetwork()
+    sources = array("i")
+    targets = array("i")
+    weights = array("i")
+    lone_departures = array("i")
+    lines_before = 0
+
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        parsed_chunks = executor.map(_parse_distance_chunk, [file_name] * len(chunks),
+                                     [start for start, end in chunks], [end for start, end in chunks])
+        for names, chunk_sources, chunk_targets, chunk_weights, chunk_lone_departures, line_count, error \
+                in parsed_chunks:
+            if error is not None:
+                line_number, problem = error
+                print(f"Error: line {lines_before + line_number} of '{file_name}' {problem}.")
+                return None
+            city_ids = array("i", [data.intern(name) for name in names])
+            sources.extend([city_ids[local_id] for local_id in chunk_sources])
+            targets.extend([city_ids[local_id] for local_id in chunk_targets])
+            weights.extend(chunk_weights)
+            lone_departures.extend([city_ids[local_id] for local_id in chunk_lone_departures])
+            lines_before += line_count
+
+    if timer is not None:
+        timer.lap("parse")
+    data.load_edges(sources, targets, weights)
+    data.mark_departures(lone_departures)
+    if timer is not None:
+        timer.lap("build")
+    return data
+
+
+def _parse_distance_chunk(file_name, start, end):
+    """
+    Parse the bytes <start> ... <end> - 1 of a distance file in a worker
+    process, giving the city names ids of the chunk's own.
+
+    :return: tuple(list[str], array, array, array, array, int, tuple | None),
+             the city names in the order of their ids, the departure ids, the
+             destination ids, the distances, the departure ids without road
+             segments, the number of line breaks in the chunk and the first
+             bad line (see _parse_distance_rows)
+    """
+
+    with open(file_name, mode="rb") as distance_file, \
+            mmap.mmap(distance_file.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+        text = file_map[start:end].decode("utf-8")
+
+    names = {}
+    sources = array("i")
+    targets = array("i")
+    weights = array("i")
+    lone_departures = array("i")
+    # a new name gets the next id, setdefault evaluates len(names) before adding it
+    error = _parse_distance_rows(io.StringIO(text, newline=""), lambda name: names.setdefault(name, len(names)),
+                                 sources, targets, weights, lone_departures)
+    return list(names), sources, targets, weights, lone_departures, text.count("\n"), error
+
+
 def fetch_neighbours(data, city):
     """
     Returns a list of all the cities that are directly
@@ -123,7 +2569,7 @@ def fetch_neighbours(data, city):
     an empty list [], if <city> is unknown or if there are no
     arrows leaving from <city>.
 
-    :param data: dict, A data structure containing the distance
+    :param data: RoadNetwork, A data structure containing the distance
            information between the known cities.
     :param city: str, the name of the city whose neighbours we
            are interested in.
@@ -135,19 +2581,11 @@ def fetch_neighbours(data, city):
 
     # create an empty list which is meant for containing the neighbouring city of the parameter city
     neighbours_list = []
-    if city in data:
-        # this city is not a city that can be departure from, then return the empty list
-        if not data[city]:
-            return neighbours_list
-        else:
-            # this city is a city that can be departure from, then add all the neighbouring city into the list
-            # and return that list
-            for neighbours in data[city]:
-                neighbours_list.append(neighbours)
-            return neighbours_list
-    # this city is not stored in the <data> parameter, then return the empty list
-    else:
-        return neighbours_list
+    # a city that is not a departure city has no road segments to list
+    if data.is_departure(city):
+        for neighbour, distance in data.roads_from(city):
+            neighbours_list.append(neighbour)
+    return neighbours_list
 
 
 def distance_to_neighbour(data, departure, destination):
@@ -158,7 +2596,7 @@ def distance_to_neighbour(data, departure, destination):
     if there is no arrow leading from <departure> city to
     <destination> city.
 
-    :param data: dict, A data structure containing the distance
+    :param data: RoadNetwork, A data structure containing the distance
            information between the known cities.
     :param departure: str, the name of the departure city.
     :param destination: str, the name of the destination city.
@@ -167,14 +2605,23 @@ def distance_to_neighbour(data, departure, destination):
            between the two cities.
     """
 
-    neighbour = fetch_neighbours(data, departure)
-    # utilizing the function fetch_neighbours to check if the destination city is a neighbour of the departure
-    # city or not
-    if destination not in neighbour:
-        return None
-    # If yes, return the distance between two neighbouring cities
-    else:
-        return int(data[departure][destination])
+    return data.distance(departure, destination)
+
+
+def display(data, output=None):
+    """"
+    This function prints every road segment, sorted by the departure city and then by the destination city. The rows
+    come from the sorted index of the data structure and are written a chunk of rows at a time
+
+    :param data: the data structure containing the information read from the input file
+    :param output: the text stream to write to, the standard output by default
+    """
+
+    output = output or sys.stdout
+    rows = data.display_index().get_rows()
+    for first in range(0, len(rows), DISPLAY_CHUNK_ROWS):
+        output.write("".join(f"{departure:<14}{destination:<14}{distance:>5}\n"
+                             for departure, destination, distance in rows[first:first + DISPLAY_CHUNK_ROWS]))
 
 
 def add(distance_dict):
@@ -187,18 +2634,45 @@ def add(distance_dict):
     departure_city = input("Enter departure city: ")
     destination_city = input("Enter destination city: ")
     distance = input("Distance: ")
+    add_connection(distance_dict, departure_city, destination_city, distance)
+
+
+def is_valid_city_name(city):
+    """"
+    This function checks that a city name can be written into a line of the distance file and of the journal, i.e.
+    it has no ';' and no control characters such as line breaks
+
+    :param city: the name of the city
+    :return: True, if the name can be used | False, if it can't
+    """
+
+    return all(character != ";" and character.isprintable() for character in city)
+
+
+def add_connection(distance_dict, departure_city, destination_city, distance, output=None):
+    """"
+    This function does the work of the add action with the answers already given
+
+    :param distance_dict: the data structure containing the information read from the input file
+    :param departure_city: the name of the departure city
+    :param destination_city: the name of the destination city
+    :param distance: the distance as it was written by the user
+    :param output: the text stream to write to, the standard output by default
+    """
+
+    output = output or sys.stdout
     # checking if the input distance is an integer or not
     if not distance.isdigit():
-        print(f"Error: '{distance}' is not an integer.")
+        output.write(f"Error: '{distance}' is not an integer.\n")
+    elif int(distance) > MAX_DISTANCE:
+        output.write(f"Error: '{distance}' is larger than {MAX_DISTANCE}.\n")
+    # a ';' or a line break would split the line of the road segment in the distance file and in the journal
+    elif not is_valid_city_name(departure_city) or not is_valid_city_name(destination_city):
+        output.write("Error: a city name can not contain ';' or control characters.\n")
     else:
         # If there has been a connection between the departure city and destination city before, the distance
-        # will be updated
-        if departure_city in distance_dict:
-            distance_dict[departure_city][destination_city] = distance
-        # if not, a new connection will be created
-        else:
-            distance_dict[departure_city] = {}
-            distance_dict[departure_city][destination_city] = distance
+        # will be updated, if not, a new connection will be created
+        distance_dict.set_distance(departure_city, destination_city, int(distance))
 
 
 def remove(distance_dict):
@@ -210,16 +2684,30 @@ def remove(distance_dict):
 
     departure_city = input("Enter departure city: ")
     # checking if this city can be departure from or not.
-    if departure_city not in distance_dict:
+    if not distance_dict.is_departure(departure_city):
         print(f"Error: '{departure_city}' is unknown.")
 
     else:
         destination_city = input("Enter destination city: ")
-        # checking if there's any connection between the departure and destination city or not
-        if destination_city not in distance_dict[departure_city]:
-            print(f"Error: missing road segment between '{departure_city}' and '{destination_city}'.")
-        else:
-            distance_dict[departure_city].pop(destination_city)
+        remove_connection(distance_dict, departure_city, destination_city)
+
+
+def remove_connection(distance_dict, departure_city, destination_city, output=None):
+    """"
+    This function does the work of the remove action with the answers already given
+
+    :param distance_dict: the data structure containing the information read from the input file
+    :param departure_city: the name of the departure city
+    :param destination_city: the name of the destination city
+    :param output: the text stream to write to, the standard output by default
+    """
+
+    output = output or sys.stdout
+    if not distance_dict.is_departure(departure_city):
+        output.write(f"Error: '{departure_city}' is unknown.\n")
+    # checking if there's any connection between the departure and destination city or not
+    elif not distance_dict.remove_road(departure_city, destination_city):
+        output.write(f"Error: missing road segment between '{departure_city}' and '{destination_city}'.\n")
 
 
 def neighbouring(distance_dict):
@@ -230,38 +2718,109 @@ def neighbouring(distance_dict):
     """
 
     departure_city = input("Enter departure city: ")
+    write_neighbours(distance_dict, departure_city)
+
+
+def write_neighbours(distance_dict, departure_city, output=None):
+    """"
+    This function does the work of the neighbours action with the departure city already given
+
+    :param distance_dict: the data structure containing the information read from the input file
+    :param departure_city: the name of the departure city
+    :param output: the text stream to write to, the standard output by default
+    """
+
+    output = output or sys.stdout
     # check if this city is a known city or not by checking if it can be departure from,
     # and it could be a destination or not
-    if departure_city not in distance_dict:
-        if departure_city not in checking_city(distance_dict, departure_city):
-            print(f"Error: '{departure_city}' is unknown.")
-        else:
-            return
+    if not distance_dict.is_departure(departure_city):
+        if not checking_city(distance_dict, departure_city):
+            output.write(f"Error: '{departure_city}' is unknown.\n")
     # it the departure city is known, then print all the connections if possible
     else:
-        sorted_destination = sorted(distance_dict[departure_city])
-        for destination in sorted_destination:
-            print(f"{departure_city:<14}{destination:<14}{distance_dict[departure_city][destination]:>5}")
+        sorted_destination = sorted(distance_dict.roads_from(departure_city))
+        output.write("".join(f"{departure_city:<14}{destination:<14}{distance:>5}\n"
+                             for destination, distance in sorted_destination))
 
 
 def checking_city(data, city):
     """"
-    This function test if a city that can't be departure from is known or not (can be a destination to go to from
-    other cities or not)
+    This function test if a city is known or not (can be departure from, or can be a destination to go to from
+    other cities). It uses the inbound road segment index of the data structure, so it doesn't need to scan
+    every departure city.
 
     :param data: the data structure containing the information read from the input file
     :param city: the city which will be tested
-    :return list: a list containing known city
+    :return bool: True, if the city is known | False, if it is unknown
     """
 
-    known_city = []
-    unknown_city = []
-    for departure_city in data:
-        if city not in data[departure_city]:
-            unknown_city.append(city)
-        else:
-            known_city.append(city)
-    return known_city
+    return data.is_known(city)
+
+
+def incoming(data):
+    """"
+    This function prints all the connection from any city to a destination city, i.e. the predecessors of that city
+
+    :param data: the data structure containing the information read from the input file
+    """
+
+    destination_city = input("Enter destination city: ")
+    if not checking_city(data, destination_city):
+        print(f"Error: '{destination_city}' is unknown.")
+    else:
+        sorted_departure = sorted(data.roads_to(destination_city))
+        for departure, distance in sorted_departure:
+            print(f"{departure:<14}{destination_city:<14}{distance:>5}")
+
+
+def print_within(data):
+    """"
+    This function prints every city that can be reached from a departure city within a given distance, the
+    nearest cities first
+
+    :param data: the data structure containing the information read from the input file
+    """
+
+    departure = input("Enter departure city: ")
+    if not checking_city(data, departure):
+        print(f"Error: '{departure}' is unknown.")
+        return
+
+    max_distance = input("Distance: ")
+    if not max_distance.isdigit():
+        print(f"Error: '{max_distance}' is not an integer.")
+        return
+
+    reached = cities_within(data, departure, int(max_distance))
+    if not reached:
+        print(f"No cities within {max_distance} km of '{departure}'.")
+    for city, distance in reached:
+        print(f"{city:<14}{distance:>5}")
+
+
+def print_alternatives(data):
+    """"
+    This function prints the shortest alternative routes from one city to another, the shortest first
+
+    :param data: the data structure containing the information read from the input file
+    """
+
+    departure = input("Enter departure city: ")
+    if not checking_city(data, departure):
+        print(f"Error: '{departure}' is unknown.")
+        return
+
+    destination = input("Enter destination city: ")
+    route_count = input("Number of routes: ")
+    if not route_count.isdigit() or int(route_count) == 0:
+        print(f"Error: '{route_count}' is not a positive integer.")
+        return
+
+    routes = find_alternative_routes(data, departure, destination, int(route_count))
+    if not routes:
+        print(f"No route found between '{departure}' and '{destination}'.")
+    for number, (route, total_distance) in enumerate(routes, start=1):
+        print(f"{number}. {format_route(route, total_distance)}")
 
 
 def print_route(data):
@@ -273,67 +2832,487 @@ def print_route(data):
     """
 
     departure = input("Enter departure city: ")
+    # check if the departure city is unknown or not, the destination is asked only from a known city
+    if not checking_city(data, departure):
+        print(f"Error: '{departure}' is unknown.")
+    else:
+        destination = input("Enter destination city: ")
+        write_route(data, departure, destination)
+
+
+def write_route(data, departure, destination, output=None):
+    """"
+    This function does the work of the route action with the cities already given
+
+    :param data: the data structure containing the information read from the input file
+    :param departure: the name of the departure city
+    :param destination: the name of the destination city
+    :param output: the text stream to write to, the standard output by default
+    """
+
+    output = output or sys.stdout
     # check if the departure city is unknown or not
-    if departure not in data:
+    if not data.is_departure(departure):
         # if this city is not a city that can be departure from, check if that city could be a destination or not
-        if departure not in checking_city(data, departure):
-            print(f"Error: '{departure}' is unknown.")
+        if not checking_city(data, departure):
+            output.write(f"Error: '{departure}' is unknown.\n")
         else:
             # this departure city is a known city, but there is no way to go out of that city
             # Hence, there is no connection from that city to any other city
-            des = input("Enter destination city: ")
-            print(f"No route found between '{departure}' and '{des}'.")
+            output.write(f"No route found between '{departure}' and '{destination}'.\n")
     else:
         # the departure city is a known city and can be departure from
-        destination = input("Enter destination city: ")
-        # create a list that contain the route to go from the departure city to the destination city
-        list_of_route = find_route(data, departure, destination)
+        list_of_route, total_distance = route_with_distance(data, departure, destination)
         if not list_of_route:
-            print(f"No route found between '{departure}' and '{destination}'.")
+            output.write(f"No route found between '{departure}' and '{destination}'.\n")
         else:
             # if the departure and destination city is 1 city
             if len(list_of_route) == 2 and list_of_route[0] == list_of_route[1]:
-                print(f"{list_of_route[0]}-{list_of_route[1]} (0 km)")
+                output.write(format_route(list_of_route, 0) + "\n")
             else:
-                list_of_distance = []
-                # this list contains the distance between every two cities
-                for i in range(len(list_of_route)-1):
-                    list_of_distance.append(int(data[list_of_route[i]][list_of_route[i+1]]))
-                # add up every distance inside that list_of_distance and obtain the
-                # total distance to travel
-                total_distance = sum(list_of_distance)
                 # print out the route and the total distance
-                for idx in range(len(list_of_route)):
-                    print(list_of_route[idx], end="")
-                    if idx == len(list_of_route) - 1:
-                        print(f" ({total_distance} km)\n")
-                    else:
-                        print("-", end="")
+                output.write(format_route(list_of_route, total_distance) + "\n\n")
 
 
-def main():
-    input_file = input("Enter input file name: ")
+def format_route(list_of_route, total_distance):
+    """"
+    This function makes the text of a route in the form the route action prints it, e.g. "A-B-C (123 km)"
 
-    distance_data = read_distance_file(input_file)
+    :param list_of_route: the route as a list of city names
+    :param total_distance: the total distance of the route in km
+    :return str: the text of the route
+    """
+
+    return f"{'-'.join(list_of_route)} ({total_distance} km)"
+
+
+def route_with_distance(data, departure, destination):
+    """"
+    This function finds a route from one city to another together with the total distance. The routes found are
+    kept in the route cache of the data structure, so asking the same route again doesn't need a search, and the
+    departure cities asked often get a shortest path tree that answers every route from them.
+
+    :param data: the data structure containing the information read from the input file
+    :param departure: the name of the departure city
+    :param destination: the name of the destination city
+    :return tuple: the route as a list of city names ([] if there is no route) and the total distance in km
+    (None if there is no route)
+    """
+
+    hook = _profile_hook
+    if hook is None:
+        list_of_route, total_distance, answered_by = _answer_route(data, departure, destination, None)
+        return list_of_route, total_distance
+
+    # somebody is profiling the route queries, tell them what answered this one and how long every step took
+    timer = PhaseTimer()
+    list_of_route, total_distance, answered_by = _answer_route(data, departure, destination, timer)
+    hook("lookup", {"departure": departure, "destination": destination, "answered_by": answered_by,
+                    "found": bool(list_of_route), "total_distance": total_distance,
+                    "phases": timer.get_phases()})
+    return list_of_route, total_distance
+
+
+def _answer_route(data, departure, destination, timer):
+    """"
+    This function does the work of route_with_distance, trying the faster ways to answer first
+
+    :param data: the data structure containing the information read from the input file
+    :param departure: the name of the departure city
+    :param destination: the name of the destination city
+    :param timer: a PhaseTimer timing every step for the profiling hook, or None
+    :return tuple: the route, the total distance (see route_with_distance) and what answered the query: "same city",
+    "cache", "matrix", "reachability", "tree" or "search"
+    """
+
+    if departure == destination:
+        list_of_route = find_route(data, departure, destination)
+        return list_of_route, 0 if list_of_route else None, "same city"
+
+    cache = data.route_cache()
+    cached = cache.get(departure, destination)
+    if timer is not None:
+        timer.lap("cache")
+    if cached is not None:
+        return cached[0], cached[1], "cache"
+
+    # the all-pairs matrix knows every route of the road network read from the file
+    matrix = data.all_pairs_matrix()
+    if matrix.is_valid():
+        # an unknown city has no row or column in the matrix and no route either
+        if data.city_id(departure) is None or data.city_id(destination) is None:
+            return [], None, "matrix"
+        route_ids, total_distance = matrix.route(data.city_id(departure), data.city_id(destination))
+        if timer is not None:
+            timer.lap("matrix")
+        if not route_ids:
+            return [], None, "matrix"
+        list_of_route = [data.city_name(city) for city in route_ids]
+        cache.put(list_of_route, total_distance)
+        return list_of_route, total_distance, "matrix"
+
+    # the reachability index tells right away if there is no route at all, then there is no need to search.
+    # An index without its reachable bits would search for that, so the route search finds it out instead
+    if data.reachability_index().has_closure():
+        reachable = data.can_reach(departure, destination)
+    else:
+        reachable = data.city_id(departure) is not None and data.city_id(destination) is not None
+    if timer is not None:
+        timer.lap("reachability")
+    if not reachable:
+        return [], None, "reachability"
+
+    # a departure city that is asked often has a shortest path tree which already knows the route
+    from_tree = data.route_trees().route(data.city_id(departure), data.city_id(destination))
+    if timer is not None:
+        timer.lap("tree")
+    if from_tree is not None:
+        route_ids, total_distance = from_tree
+        if not route_ids:
+            return [], None, "tree"
+        list_of_route = [data.city_name(city) for city in route_ids]
+        cache.put(list_of_route, total_distance)
+        return list_of_route, total_distance, "tree"
+
+    # create a list that contain the route to go from the departure city to the destination city,
+    # the landmark tables guide the search if they are up to date
+    if data.landmark_index().is_valid():
+        list_of_route = find_route(data, departure, destination, method="alt")
+    else:
+        list_of_route = find_route(data, departure, destination)
+    if timer is not None:
+        timer.lap("search")
+    if not list_of_route:
+        return [], None, "search"
+
+    list_of_distance = []
+    # this list contains the distance between every two cities
+    for i in range(len(list_of_route)-1):
+        list_of_distance.append(data.distance(list_of_route[i], list_of_route[i+1]))
+    # add up every distance inside that list_of_distance and obtain the
+    # total distance to travel
+    total_distance = sum(list_of_distance)
+    cache.put(list_of_route, total_distance)
+    if timer is not None:
+        timer.lap("distance")
+    return list_of_route, total_distance, "search"
+
+
+def print_profile(data):
+    """"
+    This function finds a route like the route action and prints how it was found: what answered the query, the
+    counters of the search and the time of every step
+
+    :param data: the data structure containing the information read from the input file
+    """
+
+    departure = input("Enter departure city: ")
+    if not checking_city(data, departure):
+        print(f"Error: '{departure}' is unknown.")
+        return
+    destination = input("Enter destination city: ")
+
+    reports = []
+    previous = set_profile_hook(lambda event, report: reports.append((event, report)))
+    try:
+        list_of_route, total_distance = route_with_distance(data, departure, destination)
+    finally:
+        set_profile_hook(previous)
+
+    if not list_of_route:
+        print(f"No route found between '{departure}' and '{destination}'.")
+    else:
+        print(format_route(list_of_route, total_distance))
+
+    # the lookup is reported after the search made inside it, print it first
+    for event, report in reversed(reports):
+        if event == "lookup":
+            statistics = data.route_cache().get_statistics()
+            print(f"Answered by: {report['answered_by']} (route cache hits {statistics['hits']}, "
+                  f"misses {statistics['misses']})")
+        elif event == "search":
+            counters = report["counters"]
+            print(f"Search ({report['method']}): {counters['settled']} cities settled, "
+                  f"{counters['relaxed']} road segments relaxed, {counters['reached']} cities reached, "
+                  f"{counters['heap_left']} heap entries left")
+        for phase, seconds in report["phases"].items():
+            print(f"  {phase:<14}{seconds * 1000:>10.3f} ms")
+
+
+def print_statistics(data):
+    """"
+    This function prints the counters of the route cache
+
+    :param data: the data structure containing the information read from the input file
+    """
+
+    statistics = data.route_cache().get_statistics()
+    print(f"Route cache: {statistics['routes']}/{statistics['capacity']} routes")
+    print(f"Hits:          {statistics['hits']:>8}")
+    print(f"Misses:        {statistics['misses']:>8}")
+    print(f"Evictions:     {statistics['evictions']:>8}")
+    print(f"Invalidations: {statistics['invalidations']:>8}")
+
+
+def preprocess_landmarks(data, file_name):
+    """"
+    This function builds the landmark tables for the route searches and saves them next to the input file, so that
+    they can be reloaded when the same file is opened again
+
+    :param data: the data structure containing the information read from the input file
+    :param file_name: the name of the input file
+    """
+
+    landmarks = data.landmark_index()
+    landmarks.build()
+    if landmarks.save(file_name + LANDMARK_SUFFIX, file_name):
+        print(f"Landmarks: {', '.join(landmarks.get_landmarks())}")
+    else:
+        print(f"Error: '{file_name + LANDMARK_SUFFIX}' can not be written.")
+
+
+def build_distance_matrix(data, file_name):
+    """"
+    This function computes the distances and routes between every pair of cities and saves them next to the
+    input file, so that the route action can answer from them without searching. The matrices take 12 bytes
+    for every pair of cities and one search for every city, so road networks of more than MATRIX_CITY_LIMIT
+    cities are refused
+
+    :param data: the data structure containing the information read from the input file
+    :param file_name: the name of the input file
+    """
+
+    city_count = data.city_count()
+    if city_count > MATRIX_CITY_LIMIT:
+        print(f"Error: the distance matrix is limited to {MATRIX_CITY_LIMIT} cities, '{file_name}' has "
+              f"{city_count} cities and would need {matrix_bytes(city_count) / 1e9:.1f} GB.")
+        return
+
+    try:
+        matrix_file = data.all_pairs_matrix().build(file_name)
+    except OSError:
+        print(f"Error: the distance matrix of '{file_name}' can not be written.")
+    else:
+        print(f"Distance matrix saved to '{matrix_file}'.")
+
+
+def write_distance_file(data, file_name):
+    """
+    Writes the road network into a distance file in the form read by
+    read_distance_file, one road segment per line, grouped by the departure
+    city. A departure city without road segments is written as
+    "departure;;", so that it stays known. The file is written under a temporary name and moved over
+    <file_name> only when it is complete and on the disk, so a crash leaves
+    either the old or the new file.
+
+    :param data: RoadNetwork, the road network
+    :param file_name: str, the name of the distance file
+    :return: int, the number of written road segments
+    :raise OSError: if the file can't be written
+    """
+
+    starts, ends, targets, weights = data.adjacency()
+    written = 0
+    temporary_file = file_name + ".tmp"
+    with open(temporary_file, mode="w", encoding="utf-8", newline="\n") as distance_file:
+        for city_id in range(data.city_count()):
+            departure = data.city_name(city_id)
+            if starts[city_id] == ends[city_id] and data.is_departure(departure):
+                distance_file.write(f"{departure};;\n")
+            for slot in range(starts[city_id], ends[city_id]):
+                distance_file.write(f"{departure};{data.city_name(targets[slot])};{weights[slot]}\n")
+                written += 1
+        distance_file.flush()
+        os.fsync(distance_file.fileno())
+    os.replace(temporary_file, file_name)
+    return written
+
+
+def compact_distance_file(data, file_name, journal):
+    """"
+    This function writes the current road network over the input file, after asking for a confirmation, and empties
+    the journal, whose changes are now in the input file. A new snapshot of the input file is saved too
+
+    :param data: the data structure containing the information read from the input file
+    :param file_name: the name of the input file
+    :param journal: the journal of the changes made to the input file
+    """
+
+    answer = input(f"Overwrite '{file_name}' with the current road network? (yes/no): ")
+    if answer.strip().lower() not in ("yes", "y"):
+        print(f"'{file_name}' was not changed.")
+        return
+
+    # the journal is synced first, if the compaction fails half way its changes are still replayed
+    journal.sync()
+    try:
+        written = write_distance_file(data, file_name)
+    except OSError:
+        print(f"Error: '{file_name}' can not be written.")
+        return
+    # replaying the journal again on the new file would do no harm, so a crash here loses nothing
+    journal.clear()
+    data.save_snapshot(snapshot_file_name(file_name), file_name)
+    print(f"Compacted {written} road segments into '{file_name}'.")
+
+
+def open_distance_data(file_name):
+    """"
+    This function opens the snapshot of the input file if there is one newer than the file and made from it, and
+    reads the input file otherwise. After reading the input file a new snapshot is saved next to it, so that the
+    next start doesn't have to parse the file again
+
+    :param file_name: the name of the input file
+    :return: the data structure containing the information read from the input file, or None if it can't be read
+    """
+
+    snapshot_file = snapshot_file_name(file_name)
+    try:
+        snapshot_is_newer = os.path.getmtime(snapshot_file) >= os.path.getmtime(file_name)
+    except OSError:
+        snapshot_is_newer = False
+
+    if snapshot_is_newer:
+        data = RoadNetwork()
+        if data.load_snapshot(snapshot_file, file_name):
+            return data
+
+    data = read_distance_file(file_name)
+    if data is None:
+        return None
+
+    # a snapshot that can't be written only means a slower start next time
+    data.save_snapshot(snapshot_file, file_name)
+    return data
+
+
+def start_session(input_file):
+    """"
+    This function opens the input file together with everything made from it earlier: the snapshot, the landmark
+    tables, the distance matrix and the journal of the changes made by the add and remove actions
+
+    :param input_file: the name of the input file
+    :return: the data structure and the journal, or None if the input file or the journal can't be read. A
+             journal that can't be written only gives a warning, the changes are not kept then
+    """
+
+    distance_data = open_distance_data(input_file)
 
     if distance_data is None:
         print(f"Error: '{input_file}' can not be read.")
+        return None
+
+    # reload the landmark tables made by the landmarks action, if they are made from this version of the file
+    distance_data.landmark_index().load(input_file + LANDMARK_SUFFIX, input_file)
+    # open the distance matrix made by the matrix action, if it is made from this version of the file
+    distance_data.all_pairs_matrix().open(input_file)
+    # the tables above follow the replayed changes like any other change
+    # replay the changes made by the earlier add and remove actions, and write down the new ones
+    journal = MutationJournal(journal_file_name(input_file))
+    if journal.attach(distance_data) is None:
+        print(f"Error: '{journal.get_file_name()}' can not be used.")
+        return None
+
+    return distance_data, journal
+
+
+def run_script(data, script, output):
+    """"
+    This function runs the actions of a script without asking anything. Every line is one action and its
+    arguments separated by ';', e.g. "route;Tampere;Oulu" or "add;Tampere;Oulu;491". The actions can be shortened
+    like in the interactive mode. Empty lines and lines starting with '#' are skipped
+
+    :param data: the data structure containing the information read from the input file
+    :param script: the lines of the script, e.g. an open file
+    :param output: the text stream the results are written to
+    :return: the number of actions run
+    """
+
+    # the actions in the order they are matched, the number of their arguments and the function doing them
+    actions = (
+        ("display", 0, display),
+        ("add", 3, add_connection),
+        ("remove", 2, remove_connection),
+        ("neighbours", 1, write_neighbours),
+        ("route", 2, write_route),
+    )
+
+    run = 0
+    for line_number, line in enumerate(script, start=1):
+        line = line.rstrip("\r\n")
+        if line.strip() == "" or line.startswith("#"):
+            continue
+
+        action, *arguments = line.split(";")
+        for name, argument_count, function in actions:
+            if action != "" and name.startswith(action):
+                break
+        else:
+            output.write(f"Error: unknown action '{action}' on line {line_number}.\n")
+            continue
+
+        if len(arguments) != argument_count:
+            output.write(f"Error: '{name}' needs {argument_count} arguments on line {line_number}.\n")
+            continue
+        function(data, *arguments, output)
+        run += 1
+
+    return run
+
+
+def batch_main(arguments):
+    """"
+    This function runs a script of actions on an input file, see run_script. The script is read from a file or from
+    the standard input, and the results are written through one large buffer
+
+    :param arguments: the command line arguments after --batch: the input file and the script file (optional)
+    """
+
+    if len(arguments) not in (1, 2):
+        print("Usage: python traveller_template1.py --batch <input file> [script file]")
+        return
+
+    session = start_session(arguments[0])
+    if session is None:
         return
+    distance_data, journal = session
+
+    try:
+        script = open(arguments[1], mode="r", encoding="utf-8") if len(arguments) == 2 else sys.stdin
+    except OSError:
+        print(f"Error: '{arguments[1]}' can not be read.")
+        journal.close()
+        return
+
+    sys.stdout.flush()
+    output = open(sys.stdout.fileno(), mode="w", encoding="utf-8", buffering=OUTPUT_BUFFER_SIZE, closefd=False)
+    try:
+        run_script(distance_data, script, output)
+    finally:
+        output.close()
+        journal.close()
+        if script is not sys.stdin:
+            script.close()
+
+
+def main():
+    input_file = input("Enter input file name: ")
+
+    session = start_session(input_file)
+    if session is None:
+        return
+    distance_data, journal = session
 
     while True:
         action = input("Enter action> ")
 
         if action == "":
+            journal.close()
             print("Done and done!")
             return
 
         elif "display".startswith(action):
-            sorted_departure = sorted(distance_data)
-
-            for departure in sorted_departure:
-                sorted_destination = sorted(distance_data[departure])
-                for destination in sorted_destination:
-                    print(f"{departure:<14}{destination:<14}{distance_data[departure][destination]:>5}")
+            display(distance_data)
 
         elif "add".startswith(action):
 
@@ -346,10 +3325,30 @@ def main():
             neighbouring(distance_data)
         elif "route".startswith(action):
             print_route(distance_data)
+        elif "incoming".startswith(action):
+            incoming(distance_data)
+        elif "landmarks".startswith(action):
+            preprocess_landmarks(distance_data, input_file)
+        elif "stats".startswith(action):
+            print_statistics(distance_data)
+        elif "matrix".startswith(action):
+            build_distance_matrix(distance_data, input_file)
+        # compact overwrites the input file, so it is never matched by a shortened name
+        elif action == "compact":
+            compact_distance_file(distance_data, input_file, journal)
+        elif "within".startswith(action):
+            print_within(distance_data)
+        elif "alternatives".startswith(action):
+            print_alternatives(distance_data)
+        elif "profile".startswith(action):
+            print_profile(distance_data)
 
         else:
             print(f"Error: unknown action '{action}'.")
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["--batch"]:
+        batch_main(sys.argv[2:])
+    else:
+        main()
@@ -18,25 +18,62 @@ quantity has fallen below a preset limit.
 6. combine <code₁> <code₂>: Combines 2 products into 1
 7. sale <category> <sale_percentage>: set a sale price for all the products in
 a specific category.
+8. category <category>: Prints all products of a category in ascending order
+by product code.
+9. limit <amount>: Changes the limit of the low command.
+10. total [category]: Prints the number of items in stock, of all the products
+or of one category.
 
 """
 
+from array import array
+from bisect import bisect_left, insort
+
 
 LOW_STOCK_LIMIT = 30
 
 
 class Product:
     """
-    This class represent a product i.e. an item available for sale.
+    This class represent a product i.e. an item available for sale. The
+    data of the products is kept in the columns of a ProductColumns, and
+    a Product is only a small view to the row of one product code, so a
+    Product can be made whenever it is needed.
     """
 
-    def __init__(self, code, name, category, price, stock):
+    __slots__ = ("__columns", "__code")
+
+    def __init__(self, columns, code):
+        self.__columns = columns
         self.__code = code
-        self.__name = name
-        self.__category = category
-        self.__price = price
-        self.__stock = stock
-        self.__original_price = price  # only need when calculating the sale price
+
+    def __row(self):
+        """
+        Find the row of the product in the columns. The row of a product
+        may change when another product is removed, the code doesn't.
+
+        :return: int, the row
+        """
+
+        return self.__columns.rows[self.__code]
+
+    def get_code(self):
+        """
+        fetch the product code
+
+        :return: the product code
+        """
+
+        return self.__code
+
+    def get_name(self):
+        """
+        fetch the name
+
+        :return: the name
+        """
+
+        return self.__columns.name_table[self.__columns.names[self.__row()]]
 
     def get_stock(self):
         """
@@ -45,7 +82,7 @@ class Product:
         :return: the stock size
         """
 
-        return self.__stock
+        return self.__columns.stocks[self.__row()]
 
     def get_price(self):
         """
@@ -54,7 +91,7 @@ class Product:
         :return: the price
         """
 
-        return self.__price
+        return self.__columns.prices[self.__row()]
 
     def get_category(self):
         """
@@ -63,7 +100,7 @@ class Product:
         :return: the category
         """
 
-        return self.__category
+        return self.__columns.category_table[self.__columns.categories[self.__row()]]
 
     def __str__(self):
         """
@@ -72,10 +109,10 @@ class Product:
 
         lines = [
             f"Code:     {self.__code}",
-            f"Name:     {self.__name}",
-            f"Category: {self.__category}",
-            f"Price:    {self.__price:.2f}€",
-            f"Stock:    {self.__stock} units",
+            f"Name:     {self.get_name()}",
+            f"Category: {self.get_category()}",
+            f"Price:    {self.get_price():.2f}€",
+            f"Stock:    {self.get_stock()} units",
         ]
 
         longest_line = len(max(lines, key=len))
@@ -95,9 +132,22 @@ class Product:
         """
 
         return self.__code == other.__code and \
-               self.__name == other.__name and \
-               self.__category == other.__category and \
-               self.__price == other.__price
+               self.get_name() == other.get_name() and \
+               self.get_category() == other.get_category() and \
+               self.get_price() == other.get_price()
+
+    def matches(self, name, category, price):
+        """
+        Check if the product has the given data. This method is utilized in
+        read_database, when the same product code is found again.
+
+        :param name: str, the name
+        :param category: str, the category
+        :param price: float, the price
+        :return: True, if the product has the same data | False, if it doesn't
+        """
+
+        return self.get_name() == name and self.belong_to_category(category) and self.get_price() == price
 
     def modify_stock_size(self, amount):
         """
@@ -110,23 +160,27 @@ class Product:
         :param amount: int, how much to change the amount in stock.
                        Both positive and negative values are accepted:
                        positive value increases the stock and vice versa.
+        :raise OverflowError: if the new stock size doesn't fit the stock
+                              column, the stock size is not changed then
         """
 
-        self.__stock += amount
+        row = self.__row()
+        old_stock = self.__columns.stocks[row]
+        self.__columns.stocks[row] = old_stock + amount
+        if self.__columns.listener is not None:
+            self.__columns.listener.stock_changed(self.__code, old_stock, old_stock + amount)
 
     def belong_to_category(self, category):
         """
         Check if the product belongs to a specific category or not.
-        This method is utilized in the sale_command (to set the sale price
-        for all products that belong to a category) and also in the
-        can_combine method below (to check if 2 products are of the same
-        category or not).
+        This method is utilized in the can_combine method below (to check
+        if 2 products are of the same category or not).
 
         :param Any, category: the target category .
         :return: True, if the product belongs to that category.
         :return: False, if the product doesn't belong to that category
         """
-        if self.__category == category:
+        if self.get_category() == category:
             return True
         else:
             return False
@@ -134,12 +188,14 @@ class Product:
     def sale_price(self, sale):
         """
         Calculate the sale price for a product based on its
-        original price. This method is utilized in the sale_command
+        original price. The sale_command puts a whole category on sale
+        with Warehouse.put_on_sale instead.
 
         :param sale: float, how much the price will be put on sale
         """
 
-        self.__price = self.__original_price*(100-sale)/100
+        row = self.__row()
+        self.__columns.prices[row] = self.__columns.original_prices[row]*(100-sale)/100
 
     def same_price(self, product):
         """
@@ -192,21 +248,274 @@ class Product:
         else:
             return True
 
-    def is_low(self):
+    def is_low(self, limit=LOW_STOCK_LIMIT):
         """
-        Check if the stock size is below the preset limit or not.
-        This method is utilized in the low_command.
+        Check if the stock size is below the limit or not.
+        This method is utilized by the low stock index of the Warehouse.
 
+        :param limit: int, the low stock limit
         :return: True, if the stock size is below the limit | False, if
         the stock size isn't below the limit
         """
 
-        if self.get_stock() < LOW_STOCK_LIMIT:
+        if self.get_stock() < limit:
             return True
         else:
             return False
 
 
+class ProductColumns:
+    """
+    This class keeps the data of many products in columns, one array per
+    field and one row per product, instead of one object per product. The
+    names and the categories are kept as ids into tables of the different
+    names and categories. A removed row is filled with the last row, so
+    the columns never have holes.
+    """
+
+    def __init__(self):
+        self.codes = array("q")
+        self.names = array("i")             # ids into name_table
+        self.categories = array("i")        # ids into category_table
+        self.prices = array("d")
+        self.original_prices = array("d")   # only need when calculating the sale price
+        self.stocks = array("q")
+        self.rows = {}                      # product code -> row
+        self.name_table = []
+        self.category_table = []
+        self.listener = None                # told about the changes of the stock sizes, see Product.modify_stock_size
+        self.__name_ids = {}
+        self.__category_ids = {}
+
+    def append(self, code, name, category, price, stock):
+        """
+        Add a row for a new product.
+
+        :param code: int, the product code, must not be known yet
+        :param name: str, the name
+        :param category: str, the category
+        :param price: float, the price
+        :param stock: int, the stock size
+        :raise OverflowError: if the code or the stock size doesn't fit the
+                              columns, nothing is added then
+        """
+
+        if not _fits_int64(code) or not _fits_int64(stock):
+            raise OverflowError("the code or the stock size is too large")
+        self.rows[code] = len(self.codes)
+        self.codes.append(code)
+        self.names.append(self.__encode(name, self.__name_ids, self.name_table))
+        self.categories.append(self.__encode(category, self.__category_ids, self.category_table))
+        self.prices.append(price)
+        self.original_prices.append(price)
+        self.stocks.append(stock)
+
+    def remove(self, code):
+        """
+        Remove the row of a product, moving the last row in its place.
+
+        :param code: int, a known product code
+        """
+
+        row = self.rows.pop(code)
+        last = len(self.codes) - 1
+        for column in (self.codes, self.names, self.categories, self.prices, self.original_prices, self.stocks):
+            column[row] = column[last]
+            column.pop()
+        if row != last:
+            self.rows[self.codes[row]] = row
+
+    @staticmethod
+    def __encode(value, ids, table):
+        """
+        Find the id of a name or a category, giving it a new id if needed.
+        """
+
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = len(table)
+            ids[value] = value_id
+            table.append(value)
+        return value_id
+
+
+class Warehouse:
+    """
+    This class holds all the known products by their product code, like a
+    dict[int, Product], and keeps an index from every category to the codes
+    of its products, so that a command about one category only touches the
+    products of that category. Products are added and removed only through
+    add_product and remove_product, which keep the index up to date.
+
+    The data of the products is kept in a ProductColumns, and warehouse[code]
+    gives a Product view to it, so the bulk operations (put_on_sale,
+    total_stock, rebuilding the low stock index) work on the columns.
+
+    The warehouse also keeps the codes of the products with a low stock
+    size in ascending order. It listens to the stock changes of its products
+    (see Product.modify_stock_size), so a product is moved in or out of the
+    low stock index only when its stock size crosses the limit.
+    """
+
+    def __init__(self, low_stock_limit=LOW_STOCK_LIMIT):
+        self.__columns = ProductColumns()
+        self.__columns.listener = self
+        self.__categories = {}  # category -> set of the product codes in it
+        self.__low_stock_limit = low_stock_limit
+        self.__low_codes = []   # the sorted codes of the products below the limit
+
+    def __contains__(self, code):
+        return code in self.__columns.rows
+
+    def __getitem__(self, code):
+        if code not in self.__columns.rows:
+            raise KeyError(code)
+        return Product(self.__columns, code)
+
+    def __iter__(self):
+        return iter(self.__columns.rows)
+
+    def __len__(self):
+        return len(self.__columns.rows)
+
+    def add_product(self, code, name, category, price, stock):
+        """
+        Add a new product to the warehouse.
+
+        :param code: int, the product code, must not be known yet
+        :param name: str, the name
+        :param category: str, the category
+        :param price: float, the price
+        :param stock: int, the stock size
+        """
+
+        self.__columns.append(code, name, category, price, stock)
+        self.__categories.setdefault(category, set()).add(code)
+        if stock < self.__low_stock_limit:
+            insort(self.__low_codes, code)
+
+    def remove_product(self, code):
+        """
+        Remove a product from the warehouse.
+
+        :param code: int, the code of a known product
+        """
+
+        product = self[code]
+        codes = self.__categories[product.get_category()]
+        codes.discard(code)
+        if len(codes) == 0:
+            del self.__categories[product.get_category()]
+        if product.is_low(self.__low_stock_limit):
+            del self.__low_codes[bisect_left(self.__low_codes, code)]
+        self.__columns.remove(code)
+
+    def category_codes(self, category):
+        """
+        fetch the codes of the products of a category
+
+        :param category: str, the category
+        :return: set[int], the product codes, empty for an unknown category.
+                 The set must not be changed.
+        """
+
+        return self.__categories.get(category, set())
+
+    def put_on_sale(self, category, sale):
+        """
+        Set the sale price of all the products of a category, based on their
+        original prices.
+
+        :param category: str, the category
+        :param sale: float, how much the prices will be put on sale
+        :return: int, the number of products put on sale
+        """
+
+        rows = self.__columns.rows
+        prices = self.__columns.prices
+        original_prices = self.__columns.original_prices
+        product_codes = self.category_codes(category)
+        for code in product_codes:
+            row = rows[code]
+            prices[row] = original_prices[row]*(100-sale)/100
+        return len(product_codes)
+
+    def total_stock(self, category=None):
+        """
+        Count the items in stock.
+
+        :param category: str | None, count only the products of this
+                         category, or all the products if None
+        :return: int, the sum of the stock sizes
+        """
+
+        if category is None:
+            return sum(self.__columns.stocks)
+        rows = self.__columns.rows
+        stocks = self.__columns.stocks
+        return sum(stocks[rows[code]] for code in self.category_codes(category))
+
+    def stock_changed(self, code, old_stock, new_stock):
+        """
+        Follow a change of the stock size of a product, see Product.modify_stock_size.
+        """
+
+        was_low = old_stock < self.__low_stock_limit
+        is_low = new_stock < self.__low_stock_limit
+        if is_low and not was_low:
+            insort(self.__low_codes, code)
+        elif was_low and not is_low:
+            del self.__low_codes[bisect_left(self.__low_codes, code)]
+
+    def get_low_stock_limit(self):
+        """
+        fetch the low stock limit
+
+        :return: int, the limit
+        """
+
+        return self.__low_stock_limit
+
+    def set_low_stock_limit(self, limit):
+        """
+        Change the low stock limit and rebuild the low stock index. A lower
+        limit only drops codes from the index, a higher one scans the stock
+        column once.
+
+        :param limit: int, the new limit
+        """
+
+        if limit <= self.__low_stock_limit:
+            rows = self.__columns.rows
+            stocks = self.__columns.stocks
+            self.__low_codes = [code for code in self.__low_codes if stocks[rows[code]] < limit]
+        else:
+            self.__low_codes = sorted(code for code, stock in zip(self.__columns.codes, self.__columns.stocks)
+                                      if stock < limit)
+        self.__low_stock_limit = limit
+
+    def low_codes(self):
+        """
+        fetch the codes of the products with a low stock size
+
+        :return: list[int], the codes in ascending order. The list must not
+                 be changed.
+        """
+
+        return self.__low_codes
+
+
+def _fits_int64(value):
+    """
+    Check if an int fits a column of 64 bit ints.
+
+    :param value: int, the value
+    :return: True, if it fits | False, if it doesn't
+    """
+
+    return -(1 << 63) <= value < (1 << 63)
+
+
 def _read_lines_until(fd, last_line):
     """
     (This is an already provided function)
@@ -258,10 +567,10 @@ def read_database(filename):
     object as the payload. If an error happens, the return value will be None.
 
     :param filename: str, name of the file to be read.
-    :return: dict[int, Product] | None
+    :return: Warehouse | None
     """
 
-    data = {}
+    data = Warehouse()
 
     try:
         with open(filename, mode="r", encoding="utf-8") as fd:
@@ -310,16 +619,8 @@ def read_database(filename):
                 product_price = collected_product_info["PRICE"]
                 product_stock = collected_product_info["STOCK"]
 
-                product = Product(code=product_code,
-                                  name=product_name,
-                                  category=product_category,
-                                  price=product_price,
-                                  stock=product_stock)
-
-                # print(product)
-
                 if product_code in data:
-                    if product == data[product_code]:
+                    if data[product_code].matches(product_name, product_category, product_price):
                         data[product_code].modify_stock_size(product_stock)
 
                     else:
@@ -327,13 +628,13 @@ def read_database(filename):
                         return None
 
                 else:
-                    data[product_code] = product
+                    data.add_product(product_code, product_name, product_category, product_price, product_stock)
 
     except OSError:
         print(f"Error: opening the file '{filename}' failed.")
         return None
 
-    except ValueError:
+    except (ValueError, OverflowError):
         print(f"Error: something wrong on line '{line}'.")
         return None
 
@@ -343,7 +644,7 @@ def delete_command(warehouse, parameters):
     This function executes the "delete" command that deletes an
     existing product with the stock size <= 0
 
-    :param warehouse: dict[int, Product], dict of all known products.
+    :param warehouse: Warehouse, all known products.
     :param parameters: str, parameter of the command.
     """
 
@@ -359,7 +660,7 @@ def delete_command(warehouse, parameters):
         if not warehouse[code].can_be_deleted():
             print(f"Error: product \'{parameters}\' can not be deleted as stock remains.")
         else:
-            del warehouse[code]
+            warehouse.remove_product(code)
 
 
 def changes_command(warehouse, parameters):
@@ -367,7 +668,7 @@ def changes_command(warehouse, parameters):
     This function execute the "change" command that changes the stock
     size of a product
 
-    :param warehouse: dict[int, Product], dict of all known products.
+    :param warehouse: Warehouse, all known products.
     :param parameters: str, parameter of the command.
     """
 
@@ -391,7 +692,10 @@ def changes_command(warehouse, parameters):
     if code not in warehouse:
         print(f"Error: stock for '{code}' can not be changed as it does not exist.")
     else:
-        warehouse[code].modify_stock_size(amount)
+        try:
+            warehouse[code].modify_stock_size(amount)
+        except OverflowError:
+            print(f"Error: bad parameters '{parameters}' for change command.")
 
 
 def low_command(warehouse):
@@ -399,21 +703,30 @@ def low_command(warehouse):
     This function execute the "low" command that prints the products that have
     the stock size below the preset limit
 
-    :param warehouse: dict[int, Product], dict of all known products.
+    :param warehouse: Warehouse, all known products.
     """
 
-    # create a dictionary that contains the products with low stock size
-    low_product = {}
-    for product_code in warehouse:
-        # product is the code
-        if warehouse[product_code].is_low():
-            low_product[product_code] = warehouse[product_code]
-        else:
-            continue
+    # the low stock index of the warehouse is already in ascending order by product code
+    for product_code in warehouse.low_codes():
+        print(warehouse[product_code].__str__())
+
 
-    # now the low_product dictionary should contain all the products with low stock size
-    for product in sorted(low_product):
-        print(low_product[product].__str__())
+def limit_command(warehouse, parameter):
+    """
+    This function execute the "limit <amount>" command that changes the
+    limit of the low command.
+
+    :param warehouse: Warehouse, all known products.
+    :param parameter: str, parameter of the command
+    """
+
+    try:
+        limit = int(parameter)
+    except ValueError:
+        print(f"Error: bad parameters '{parameter}' for limit command.")
+        return
+
+    warehouse.set_low_stock_limit(limit)
 
 
 def combine_command(warehouse, parameter):
@@ -421,7 +734,7 @@ def combine_command(warehouse, parameter):
     This function execute the "combine" command that combines 2 products
     into one.
 
-    :param warehouse: dict[int, Product], dict of all known products.
+    :param warehouse: Warehouse, all known products.
     :param parameter: str, parameter of the command
     """
 
@@ -446,8 +759,14 @@ def combine_command(warehouse, parameter):
         return
 
     # Now check if two products can be combined or not
-    if warehouse[code1].can_combine(warehouse[code2]):
-        del warehouse[code2]
+    try:
+        combined = warehouse[code1].can_combine(warehouse[code2])
+    except OverflowError:
+        print(f"Error: bad parameters '{parameter}' for combine command.")
+        return
+
+    if combined:
+        warehouse.remove_product(code2)
     else:
         pass
 
@@ -457,7 +776,7 @@ def sale_command(warehouse, parameter):
     This function execute the "sale" command that set the price of
     the products that belong to a category to the sale price.
 
-    :param warehouse: dict[int, Product], dict of all known products.
+    :param warehouse: Warehouse, all known products.
     :param parameter: str, parameter of the command
     """
 
@@ -469,27 +788,46 @@ def sale_command(warehouse, parameter):
         print(f"Error: bad parameters '{parameter}' for sale command.")
         return
 
-    # Firstly, find the occurrences of the category in the warehouse.
-    # Create a list of product to be sale.
-    # Set the occurrences of this category to 0.
-    product_to_be_sale = []
-    occurrences_of_category = 0
-    for product_code in warehouse:
-        if warehouse[product_code].belong_to_category(category):
-            occurrences_of_category += 1
-            product_to_be_sale.append(warehouse[product_code])
-        else:
-            continue
+    # The category index of the warehouse gives the products to be put
+    # on sale, so only the products of this category are touched.
+    product_count = len(warehouse.category_codes(category))
+    print(f"Sale price set for {product_count} items.")
+    warehouse.put_on_sale(category, sale)
 
-    # Now, we know the occurrence of this category, if it's greater
-    # than 0, we execute the sale_price method to the products in the
-    # product_to_sale list
-    if occurrences_of_category == 0:
-        print(f"Sale price set for 0 items.")
+
+def total_command(warehouse, parameter):
+    """
+    This function execute the "total [category]" command that prints the
+    number of items in stock.
+
+    :param warehouse: Warehouse, all known products.
+    :param parameter: str, parameter of the command, a category or ""
+    """
+
+    if parameter == "":
+        print(f"Total stock: {warehouse.total_stock()} units.")
+    elif len(warehouse.category_codes(parameter)) == 0:
+        print(f"Error: there are no products in category '{parameter}'.")
     else:
-        print(f"Sale price set for {occurrences_of_category} items.")
-        for product in product_to_be_sale:
-            product.sale_price(sale)
+        print(f"Total stock of category '{parameter}': {warehouse.total_stock(parameter)} units.")
+
+
+def category_command(warehouse, parameter):
+    """
+    This function execute the "category <category>" command that prints
+    the products of a category in ascending order by product code.
+
+    :param warehouse: Warehouse, all known products.
+    :param parameter: str, parameter of the command
+    """
+
+    product_codes = warehouse.category_codes(parameter)
+    if len(product_codes) == 0:
+        print(f"Error: there are no products in category '{parameter}'.")
+        return
+
+    for product_code in sorted(product_codes):
+        print(warehouse[product_code].__str__())
 
 
 def print_a_product_command(warehouse, parameter):
@@ -497,7 +835,7 @@ def print_a_product_command(warehouse, parameter):
     This function execute the "print <code>" command that print a specific
     product
 
-    :param warehouse: dict[int, Product], dict of all known products.
+    :param warehouse: Warehouse, all known products.
     :param parameter: str, parameter of the command
     """
     try:
@@ -556,6 +894,15 @@ def main():
         elif "sale".startswith(command) and parameters != "":
             sale_command(warehouse, parameters)
 
+        elif "category".startswith(command) and parameters != "":
+            category_command(warehouse, parameters)
+
+        elif "limit".startswith(command) and parameters != "":
+            limit_command(warehouse, parameters)
+
+        elif "total".startswith(command):
+            total_command(warehouse, parameters)
+
         else:
             print(f"Error: bad command line '{command_line}'.")
 